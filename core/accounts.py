@@ -0,0 +1,336 @@
+import os
+import json
+import logging
+import time
+import threading
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Optional, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 进程内共享的HTTP连接池和图片编码进程池
+_shared_lock = threading.Lock()
+_shared_session = None
+_shared_encode_pool = None
+
+
+def get_shared_session(pool_size: int = 10) -> 'requests.Session':
+    """获取所有账号共用的HTTP会话
+
+    Args:
+        pool_size: 连接池大小
+
+    Returns:
+        requests.Session: 共享会话
+    """
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _shared_session = session
+        return _shared_session
+
+
+def get_shared_encode_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """获取所有账号共用的图片编码进程池
+
+    Args:
+        max_workers: 进程数，默认为CPU核数
+
+    Returns:
+        ProcessPoolExecutor: 共享进程池
+    """
+    global _shared_encode_pool
+    with _shared_lock:
+        if _shared_encode_pool is None:
+            _shared_encode_pool = ProcessPoolExecutor(max_workers=max_workers)
+        return _shared_encode_pool
+
+
+def shutdown_shared_pools():
+    """关闭共享的连接池和进程池"""
+    global _shared_session, _shared_encode_pool
+    with _shared_lock:
+        if _shared_encode_pool is not None:
+            _shared_encode_pool.shutdown()
+            _shared_encode_pool = None
+        if _shared_session is not None:
+            _shared_session.close()
+            _shared_session = None
+
+
+def load_config(config_path: str = os.path.join(root_dir, 'config', 'config.json')) -> dict:
+    """加载配置文件
+
+    Args:
+        config_path: 配置文件路径
+
+    Returns:
+        dict: 配置信息
+    """
+    if not os.path.exists(config_path):
+        raise Exception(f'配置文件不存在，请先在{config_path}中配置公众号的appid和appsecret')
+
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class Account:
+    def __init__(self, name: str, appid: str, appsecret: str, image_base_dir: str, data_dir: str,
+                 daily_quota: int = 1, settings: Optional[Dict] = None):
+        """公众号账号
+
+        每个账号拥有独立的token缓存、发布配额、图库目录和计数文件。
+
+        Args:
+            name: 账号名称
+            appid: 微信公众号的AppID
+            appsecret: 微信公众号的AppSecret
+            image_base_dir: 图库根目录
+            data_dir: 账号数据目录（已处理目录、文章序号、token缓存等）
+            daily_quota: 每天最多发布的次数
+            settings: 账号的其它配置项
+        """
+        self.name = name
+        self.appid = appid
+        self.appsecret = appsecret
+        self.image_base_dir = image_base_dir
+        self.data_dir = data_dir
+        self.daily_quota = daily_quota
+        self.settings = settings or {}
+        self._wechat = None
+        self._quota_lock = threading.Lock()
+
+    def __repr__(self):
+        return f'Account({self.name!r})'
+
+    @property
+    def processed_dirs_file(self) -> str:
+        return os.path.join(self.data_dir, 'processed_dirs.json')
+
+    @property
+    def article_count_file(self) -> str:
+        return os.path.join(self.data_dir, 'article_count.txt')
+
+    @property
+    def token_cache_file(self) -> str:
+        return os.path.join(self.data_dir, 'access_token.json')
+
+    @property
+    def quota_file(self) -> str:
+        return os.path.join(self.data_dir, 'quota.json')
+
+    @property
+    def video_cache_file(self) -> str:
+        return os.path.join(self.data_dir, 'video_media.json')
+
+    @property
+    def upload_limit_file(self) -> str:
+        return os.path.join(self.data_dir, 'upload_limit.json')
+
+    def read_processed_dirs(self) -> List[str]:
+        """读取已处理目录列表，文件不存在或损坏时返回空列表"""
+        try:
+            with open(self.processed_dirs_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def get_wechat(self, session: Optional['requests.Session'] = None, encode_pool=None) -> 'WeChatArticle':
+        """获取账号对应的WeChatArticle实例（同一账号复用同一实例）
+
+        Args:
+            session: 共享的HTTP会话
+            encode_pool: 共享的图片编码进程池
+
+        Returns:
+            WeChatArticle: 发布器实例
+        """
+        if self._wechat is None:
+            from core.adaptive_limit import AdaptiveLimiter
+            from core.derivatives import get_derivative_cache
+            from core.wechat_article import WeChatArticle
+
+            # 上传并发从上次运行结束时的上限开始，不必每次从头试探
+            last = self.read_upload_limit()
+            limiter = AdaptiveLimiter.from_settings(self.settings, initial=last.get('limit') if last else None)
+            self._wechat = WeChatArticle(self.appid, self.appsecret, session=session,
+                                         token_cache_path=self.token_cache_file,
+                                         encode_pool=encode_pool,
+                                         derivatives=get_derivative_cache(self.settings),
+                                         upload_limiter=limiter)
+        return self._wechat
+
+    def read_upload_limit(self) -> Optional[Dict]:
+        """上次保存的上传并发状态，没有时返回None"""
+        try:
+            with open(self.upload_limit_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_upload_limit(self):
+        """保存当前的上传并发上限和调整记录，供下次启动和status命令使用"""
+        if self._wechat is None:
+            return
+        snapshot = self._wechat.upload_limiter.snapshot()
+        snapshot['saved_at'] = time.time()
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(self.upload_limit_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+
+    def _read_quota(self) -> Dict:
+        today = date.today().isoformat()
+        try:
+            with open(self.quota_file, 'r', encoding='utf-8') as f:
+                quota = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            quota = {}
+        if quota.get('date') != today:
+            quota = {'date': today, 'used': 0}
+        return quota
+
+    def remaining_quota(self) -> int:
+        """今天剩余的发布次数"""
+        with self._quota_lock:
+            return max(0, self.daily_quota - self._read_quota()['used'])
+
+    def consume_quota(self):
+        """记录一次发布"""
+        with self._quota_lock:
+            quota = self._read_quota()
+            quota['used'] += 1
+            os.makedirs(self.data_dir, exist_ok=True)
+            with open(self.quota_file, 'w', encoding='utf-8') as f:
+                json.dump(quota, f)
+
+
+def load_accounts(config: dict) -> List[Account]:
+    """从配置中解析账号列表
+
+    配置中有accounts列表时按列表创建账号，每个账号的数据放在data/accounts/<name>下；
+    否则使用顶层的appid/appsecret创建单个账号，数据仍放在data目录下，兼容旧配置。
+
+    Args:
+        config: 配置信息字典
+
+    Returns:
+        List[Account]: 账号列表
+    """
+    default_base_dir = config.get('image_base_dir', os.path.join(root_dir, 'imgs'))
+    entries = config.get('accounts')
+    if not entries:
+        return [Account(
+            name=config.get('name', 'default'),
+            appid=config['appid'],
+            appsecret=config['appsecret'],
+            image_base_dir=default_base_dir,
+            data_dir=os.path.join(root_dir, 'data'),
+            daily_quota=config.get('daily_quota', 1),
+            settings=config
+        )]
+
+    accounts = []
+    names = set()
+    for entry in entries:
+        name = entry.get('name') or entry['appid']
+        if name in names:
+            raise Exception(f'账号名称重复: {name}')
+        names.add(name)
+        accounts.append(Account(
+            name=name,
+            appid=entry['appid'],
+            appsecret=entry['appsecret'],
+            image_base_dir=entry.get('image_base_dir', default_base_dir),
+            data_dir=entry.get('data_dir', os.path.join(root_dir, 'data', 'accounts', name)),
+            daily_quota=entry.get('daily_quota', 1),
+            settings={**config, **entry}
+        ))
+    return accounts
+
+
+class AccountScheduler:
+    def __init__(self, accounts: List[Account], max_parallel: int = 1):
+        """多账号公平调度器
+
+        按轮次调度：每一轮中每个还有配额的账号最多执行一次任务，
+        每轮的起始账号依次轮换，保证没有账号总是排在最前面。
+
+        Args:
+            accounts: 账号列表
+            max_parallel: 同一轮中最多同时执行的账号数
+        """
+        self.accounts = accounts
+        self.max_parallel = max(1, max_parallel)
+        self._offset = 0
+
+    def _round_order(self) -> List[Account]:
+        if not self.accounts:
+            return []
+        start = self._offset % len(self.accounts)
+        self._offset += 1
+        return self.accounts[start:] + self.accounts[:start]
+
+    def run_round(self, task: Callable[[Account], Optional[bool]], skip: Iterable[str] = ()) -> Dict[str, bool]:
+        """执行一轮调度
+
+        只有任务成功时才消耗配额；任务返回False表示没有可发布的内容，同样不消耗配额。
+
+        Args:
+            task: 对单个账号执行的任务，抛出异常视为失败
+            skip: 本轮不参与的账号名称
+
+        Returns:
+            Dict[str, bool]: 每个参与本轮的账号是否执行成功并消耗了配额
+        """
+        skip = set(skip)
+        eligible = [a for a in self._round_order() if a.name not in skip and a.remaining_quota() > 0]
+        results = {}
+        if not eligible:
+            return results
+
+        def run(account: Account) -> bool:
+            try:
+                if task(account) is False:
+                    return False
+            except Exception as e:
+                logger.error(f'账号 {account.name} 执行失败: {str(e)}')
+                return False
+            account.consume_quota()
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            futures = {account.name: executor.submit(run, account) for account in eligible}
+            for name, future in futures.items():
+                results[name] = future.result()
+        return results
+
+    def run_all(self, task: Callable[[Account], Optional[bool]]) -> Dict[str, List[bool]]:
+        """反复执行调度轮次，直到所有账号当天配额用完
+
+        失败或没有可发布内容的账号不消耗配额，本次不再参与后面的轮次，避免同一天反复重试导致接口被限频。
+
+        Args:
+            task: 对单个账号执行的任务
+
+        Returns:
+            Dict[str, List[bool]]: 每个账号各次执行的结果
+        """
+        history = {account.name: [] for account in self.accounts}
+        stopped = set()
+        while True:
+            results = self.run_round(task, skip=stopped)
+            if not results:
+                return history
+            stopped.update(name for name, ok in results.items() if not ok)
+            for name, ok in results.items():
+                history[name].append(ok)
@@ -0,0 +1,134 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 表示调用频率或配额受限的错误码：系统繁忙、接口调用超过限制、分钟配额超过限制
+THROTTLE_ERRCODES = {-1, 45009, 45011}
+
+# 请求结果
+OK = 'ok'
+THROTTLED = 'throttled'
+ERROR = 'error'
+
+
+def classify_result(result: Dict) -> str:
+    """根据接口返回判断请求结果：成功、被限流，或与并发无关的其它错误"""
+    errcode = result.get('errcode', 0)
+    if not errcode:
+        return OK
+    if errcode in THROTTLE_ERRCODES:
+        return THROTTLED
+    return ERROR
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial: int = 2, min_limit: int = 1, max_limit: int = 16, backoff: float = 0.5,
+                 latency_factor: float = 3.0, history_size: int = 100):
+        """按AIMD（加性增、乘性减）自适应调整的并发上限
+
+        每完成与当前上限相同数量的正常请求，上限加1；请求被限流、超时，或耗时超过基线的latency_factor倍时，
+        上限乘以backoff。上限降低之前已经发出的请求再失败不会重复降低，一次突发的限流只减半一次。
+        基线为正常请求耗时的指数移动平均。
+
+        Args:
+            initial: 初始并发上限
+            min_limit: 并发上限的最小值
+            max_limit: 并发上限的最大值
+            backoff: 降低时乘以的系数
+            latency_factor: 耗时超过基线的这个倍数视为延迟突增
+            history_size: 保留的调整记录数
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.baseline: Optional[float] = None
+        self.history = deque(maxlen=history_size)
+        self._in_flight = 0
+        self._successes = 0
+        self._epoch = 0
+        self._cond = threading.Condition()
+        self._record('初始值')
+
+    @classmethod
+    def from_settings(cls, settings: Dict, initial: Optional[int] = None) -> 'AdaptiveLimiter':
+        """按配置中的upload_concurrency创建，可以包含initial、min、max、backoff、latency_factor"""
+        options = settings.get('upload_concurrency') or {}
+        return cls(initial=initial or options.get('initial', 2), min_limit=options.get('min', 1),
+                   max_limit=options.get('max', 16), backoff=options.get('backoff', 0.5),
+                   latency_factor=options.get('latency_factor', 3.0))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _record(self, reason: str):
+        self.history.append({'time': time.time(), 'limit': self.limit, 'reason': reason})
+
+    def acquire(self) -> tuple:
+        """等待空闲的并发名额
+
+        Returns:
+            tuple: 传给release的凭据
+        """
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+            return time.monotonic(), self._epoch
+
+    def release(self, token: tuple, outcome: str):
+        """归还名额并根据请求结果调整上限
+
+        Args:
+            token: acquire返回的凭据
+            outcome: OK、THROTTLED或ERROR；ERROR（例如参数错误）不影响上限
+        """
+        started, epoch = token
+        latency = time.monotonic() - started
+        with self._cond:
+            self._in_flight -= 1
+            if outcome == OK and self.baseline is not None and latency > self.baseline * self.latency_factor:
+                self._decrease(epoch, f'延迟{latency * 1000:.0f}ms超过基线{self.baseline * 1000:.0f}ms的'
+                                      f'{self.latency_factor:g}倍')
+                # 基线仍然缓慢跟随，网络整体变慢后不会一直判定为突增
+                self.baseline = self.baseline * 0.9 + latency * 0.1
+            elif outcome == OK:
+                self.baseline = latency if self.baseline is None else self.baseline * 0.9 + latency * 0.1
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self._successes = 0
+                    self.limit += 1
+                    self._record('正常')
+            elif outcome == THROTTLED:
+                self._decrease(epoch, '限流或超时')
+            self._cond.notify_all()
+
+    def _decrease(self, epoch: int, reason: str):
+        self._successes = 0
+        # 上次降低之前发出的请求反映的是旧的并发数，不再重复降低
+        if epoch != self._epoch:
+            return
+        self._epoch += 1
+        new_limit = max(self.min_limit, int(self.limit * self.backoff))
+        if new_limit != self.limit:
+            self.limit = new_limit
+            self._record(reason)
+            logger.warning(f'上传并发降低到{self.limit}: {reason}')
+
+    def snapshot(self) -> Dict:
+        """当前上限、进行中的请求数、延迟基线和调整记录"""
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'min': self.min_limit,
+                'max': self.max_limit,
+                'baseline_ms': round(self.baseline * 1000, 1) if self.baseline is not None else None,
+                'history': list(self.history),
+            }
@@ -0,0 +1,267 @@
+import os
+import re
+import html
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Optional, Iterable, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# draft/batchget和freepublish/batchget每页最多20个
+PAGE_SIZE = 20
+
+MIRROR_KINDS = ('draft', 'published')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS articles (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    update_time INTEGER,
+    title TEXT,
+    digest TEXT,
+    url TEXT,
+    thumb_media_id TEXT,
+    source TEXT,
+    media_refs TEXT,
+    url_refs TEXT,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (kind, id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_articles_source ON articles(source);
+CREATE TABLE IF NOT EXISTS sync_state (
+    kind TEXT PRIMARY KEY,
+    watermark INTEGER,
+    total_count INTEGER,
+    synced_at REAL
+);
+'''
+
+# 正文中的来源标记（由文章模板写入）和引用的素材：视频的data-mpvid，图片的src/data-src
+_SOURCE_RE = re.compile(r'data-source="([^"]*)"')
+_MPVID_RE = re.compile(r'data-mpvid="([^"]+)"')
+_SRC_RE = re.compile(r'(?:data-src|src)="([^"]+)"')
+
+
+def source_key(account, directory: str) -> str:
+    """目录的来源标记：相对于账号图库根目录的路径，写入正文后可以从草稿和已发布文章反查目录"""
+    return os.path.relpath(directory, account.image_base_dir).replace(os.sep, '/')
+
+
+class ArticleMirror:
+    def __init__(self, db_path: str):
+        """草稿箱和已发布文章的本地镜像
+
+        每篇图文消息保存标题、链接、封面media_id、来源目录标记以及正文引用的素材，
+        不保存正文本身。
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _state(self, kind: str) -> Dict:
+        row = self._conn().execute('SELECT * FROM sync_state WHERE kind = ?', (kind,)).fetchone()
+        return dict(row) if row else {'kind': kind, 'watermark': None, 'total_count': None, 'synced_at': None}
+
+    def count(self, kind: str) -> int:
+        """镜像中的草稿或已发布消息数（不是图文篇数）"""
+        return self._conn().execute('SELECT COUNT(DISTINCT id) FROM articles WHERE kind = ?',
+                                    (kind,)).fetchone()[0]
+
+    def _store(self, kind: str, item: Dict, seen_at: float):
+        item_id = item.get('media_id') if kind == 'draft' else item.get('article_id')
+        rows = []
+        for idx, news in enumerate(item.get('content', {}).get('news_item', [])):
+            content = news.get('content') or ''
+            match = _SOURCE_RE.search(content)
+            source = html.unescape(match.group(1)) if match and match.group(1) else None
+            url_refs = _SRC_RE.findall(content) + ([news['thumb_url']] if news.get('thumb_url') else [])
+            rows.append((kind, item_id, idx, item.get('update_time'), news.get('title'), news.get('digest'),
+                         news.get('url'), news.get('thumb_media_id'), source,
+                         json.dumps(_MPVID_RE.findall(content)), json.dumps(url_refs), seen_at))
+        conn = self._conn()
+        # 草稿被修改后图文篇数可能变少，先删除旧记录
+        conn.execute('DELETE FROM articles WHERE kind = ? AND id = ?', (kind, item_id))
+        conn.executemany('INSERT INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def _scan(self, fetch, kind: str, watermark: Optional[int], limiter=None) -> Tuple[Dict, bool]:
+        """从最新的一页开始读取，遇到不晚于watermark的消息时停止；watermark为None时读完所有页"""
+        conn = self._conn()
+        scan_start = time.time()
+        offset = 0
+        stats = {'fetched': 0, 'pages': 0, 'total': 0}
+        newest = watermark
+        while True:
+            if limiter:
+                limiter.wait()
+            result = fetch(offset, PAGE_SIZE)
+            stats['pages'] += 1
+            stats['total'] = result.get('total_count', 0)
+            items = result.get('item') or []
+            reached = False
+            for item in items:
+                update_time = item.get('update_time') or 0
+                # 同一秒内更新的消息可能在上次同步之后，相等时仍然读取
+                if watermark is not None and update_time < watermark:
+                    reached = True
+                    break
+                self._store(kind, item, scan_start)
+                stats['fetched'] += 1
+                newest = max(newest or 0, update_time)
+            conn.commit()
+            offset += len(items)
+            if reached:
+                break
+            if not items or offset >= stats['total']:
+                if watermark is None:
+                    # 读完了所有页，没有出现的记录已经在线上被删除或发布
+                    stats['removed'] = conn.execute('DELETE FROM articles WHERE kind = ? AND seen_at < ?',
+                                                    (kind, scan_start)).rowcount
+                break
+        conn.execute(
+            'INSERT INTO sync_state (kind, watermark, total_count, synced_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(kind) DO UPDATE SET watermark = excluded.watermark, '
+            'total_count = excluded.total_count, synced_at = excluded.synced_at',
+            (kind, newest, stats['total'], time.time())
+        )
+        conn.commit()
+        return stats, watermark is None
+
+    def sync_kind(self, wechat, kind: str, full: bool = False, limiter=None) -> Dict:
+        """增量同步草稿箱或已发布文章
+
+        列表按更新时间从新到旧排列，只读取上次同步之后更新的消息。增量同步后本地数量与线上总数
+        不一致（有消息在线上被删除，或草稿已经发布）时自动全量同步一次，并删除线上已不存在的记录。
+
+        Args:
+            wechat: WeChatArticle实例
+            kind: draft或published
+            full: 是否全量同步
+            limiter: 接口调用限速
+
+        Returns:
+            Dict: fetched（读取的消息数）、pages（读取的页数）、total（线上总数）、full（是否全量同步）
+        """
+        fetch = wechat.batchget_draft if kind == 'draft' else wechat.batchget_published
+        watermark = None if full else self._state(kind)['watermark']
+        stats, is_full = self._scan(fetch, kind, watermark, limiter)
+        if not is_full and self.count(kind) != stats['total']:
+            logger.info(f'{kind}镜像数量（{self.count(kind)}）与线上（{stats["total"]}）不一致，执行全量同步')
+            full_stats, is_full = self._scan(fetch, kind, None, limiter)
+            full_stats['fetched'] += stats['fetched']
+            full_stats['pages'] += stats['pages']
+            stats = full_stats
+        stats['full'] = is_full
+        return stats
+
+    def sync(self, wechat, full: bool = False, limiter=None) -> Dict[str, Dict]:
+        """同步草稿箱和已发布文章"""
+        return {kind: self.sync_kind(wechat, kind, full, limiter) for kind in MIRROR_KINDS}
+
+    def sources(self) -> Set[str]:
+        """已经创建过草稿或已经发布的目录来源标记"""
+        rows = self._conn().execute('SELECT DISTINCT source FROM articles WHERE source IS NOT NULL').fetchall()
+        return {row['source'] for row in rows}
+
+    def find_source(self, source: str) -> List[Dict]:
+        """来源标记对应的草稿和已发布文章"""
+        rows = self._conn().execute(
+            'SELECT kind, id, idx, update_time, title, url FROM articles WHERE source = ? ORDER BY update_time',
+            (source,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def references(self) -> Tuple[Set[str], Set[str]]:
+        """镜像中所有图文消息引用的素材
+
+        Returns:
+            Tuple[Set[str], Set[str]]: (引用的media_id, 引用的图片URL)
+        """
+        media_ids: Set[str] = set()
+        urls: Set[str] = set()
+        for row in self._conn().execute('SELECT thumb_media_id, media_refs, url_refs FROM articles'):
+            if row['thumb_media_id']:
+                media_ids.add(row['thumb_media_id'])
+            media_ids.update(json.loads(row['media_refs'] or '[]'))
+            urls.update(json.loads(row['url_refs'] or '[]'))
+        return media_ids, urls
+
+    def status(self) -> Dict[str, Dict]:
+        """每种消息的镜像数量和上次同步时间"""
+        return {kind: dict(self._state(kind), count=self.count(kind)) for kind in MIRROR_KINDS}
+
+
+def mirror_db_path(account) -> str:
+    return os.path.join(account.data_dir, 'articles.db')
+
+
+def get_article_mirror(account) -> ArticleMirror:
+    """打开账号的草稿和已发布文章镜像"""
+    return ArticleMirror(mirror_db_path(account))
+
+
+def mirrored_directories(account, directories: Iterable[str], mirror: Optional[ArticleMirror] = None) -> Set[str]:
+    """在镜像中已经有草稿或已发布文章的目录，只读取本地数据库"""
+    sources = (mirror or get_article_mirror(account)).sources()
+    if not sources:
+        return set()
+    return {d for d in directories if source_key(account, d) in sources}
+
+
+def reconcile_processed(account, mirror: Optional[ArticleMirror] = None, release: bool = False) -> Dict:
+    """用镜像校正已处理目录列表
+
+    镜像中已有草稿或已发布文章但不在已处理列表中的目录会被补上。已处理但在镜像中找不到、
+    也没有被积压处理暂存的目录（通常是中途失败的发布）只报告，release为True时从已处理列表中移除，
+    以后可以重新发布。来源标记是后来才写入正文的，更早发布的目录在镜像中也找不到，移除前请先确认。
+
+    Args:
+        account: 发布账号
+        mirror: 文章镜像，默认为账号的镜像
+        release: 是否移除在镜像中找不到的目录
+
+    Returns:
+        Dict: added（补上的目录）、missing（在镜像中找不到的目录）、released（已移除的目录数）
+    """
+    from core.backlog import get_backlog_state
+
+    mirror = mirror or get_article_mirror(account)
+    processed = account.read_processed_dirs()
+
+    all_dirs = []
+    for root, dirs, _ in os.walk(account.image_base_dir):
+        for d in dirs:
+            all_dirs.append(os.path.join(root, d))
+
+    mirrored = mirrored_directories(account, all_dirs, mirror)
+    processed_set = set(processed)
+    added = sorted(d for d in mirrored if d not in processed_set)
+    staged = {d for d, s in get_backlog_state(account).dirs.items() if s.get('drafted') or s.get('article')}
+    missing = [d for d in processed if d not in mirrored and d not in staged]
+
+    processed = processed + added
+    if release:
+        missing_set = set(missing)
+        processed = [d for d in processed if d not in missing_set]
+    if added or (release and missing):
+        os.makedirs(os.path.dirname(account.processed_dirs_file), exist_ok=True)
+        with open(account.processed_dirs_file, 'w', encoding='utf-8') as f:
+            json.dump(processed, f, indent=4, ensure_ascii=False)
+    return {'added': added, 'missing': missing, 'released': len(missing) if release else 0}
@@ -0,0 +1,175 @@
+import os
+import re
+import html
+import logging
+import statistics
+from functools import lru_cache
+from string import Formatter
+from typing import List, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYOUTS_PATH = os.path.join(root_dir, 'templates', 'article_layouts.html')
+
+# 草稿接口对正文的限制：少于2万字符，小于1MB
+MAX_CONTENT_CHARS = 20000
+MAX_CONTENT_BYTES = 1024 * 1024
+
+LAYOUTS = ('single', 'two_column', 'grid')
+
+_BLOCK_RE = re.compile(r'<!-- block: (\w+) -->\s*\n(.*?)(?=\n\s*<!-- block:|\Z)', re.S)
+
+
+class CompiledTemplate:
+    def __init__(self, name: str, source: str):
+        """预编译的模板片段：把文本拆成(字面量, 占位符)序列，渲染时不再解析
+
+        Args:
+            name: 片段名称
+            source: 片段文本，占位符格式为{name}
+        """
+        self.name = name
+        self.parts: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in Formatter().parse(source)
+        ]
+
+    def render_into(self, out: List[str], **values):
+        """把渲染结果追加到out中；值为列表时直接展开，嵌套片段不需要先拼接成字符串"""
+        for literal, field in self.parts:
+            if literal:
+                out.append(literal)
+            if field is not None:
+                value = values[field]
+                if isinstance(value, list):
+                    out.extend(value)
+                else:
+                    out.append(value)
+
+
+@lru_cache(maxsize=None)
+def load_layouts(path: str = LAYOUTS_PATH) -> Dict[str, CompiledTemplate]:
+    """读取并预编译布局文件中的所有片段，每个进程只加载一次"""
+    if not os.path.exists(path):
+        raise Exception(f'布局模板不存在: {path}')
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    blocks = {name: CompiledTemplate(name, body.strip()) for name, body in _BLOCK_RE.findall(source)}
+    missing = {'single', 'pair_row', 'pair_cell', 'grid_row', 'grid_cell', 'video', 'article'} - set(blocks)
+    if missing:
+        raise Exception(f'布局模板缺少片段: {", ".join(sorted(missing))}')
+    return blocks
+
+
+def choose_layout(ratios: Optional[List[float]], preferred: str = 'auto') -> str:
+    """根据图片的高宽比选择布局
+
+    竖图（中位高宽比不小于1.2）使用两栏，横图使用单栏，接近方形的图片使用三列网格。
+
+    Args:
+        ratios: 每张图片的高宽比，未知时为None
+        preferred: 指定的布局，auto表示自动选择
+
+    Returns:
+        str: 布局名称
+    """
+    if preferred in LAYOUTS:
+        return preferred
+    known = [r for r in ratios or [] if r]
+    if not known:
+        return 'single'
+    median = statistics.median(known)
+    if median >= 1.2:
+        return 'two_column'
+    if median <= 0.85:
+        return 'single'
+    return 'grid'
+
+
+def _image_values(url: str, i: int) -> Dict[str, str]:
+    return {'url': html.escape(url, quote=True), 'alt': f'图片{i + 1}'}
+
+
+def render_article(image_urls: List[str], ratios: Optional[List[float]] = None, layout: str = 'auto',
+                   video_media_ids: Optional[List[str]] = None, source: str = '') -> str:
+    """渲染文章正文，所有片段追加到同一个列表中，最后只拼接一次
+
+    Args:
+        image_urls: 图片URL列表
+        ratios: 与图片一一对应的高宽比
+        layout: single、two_column、grid或auto
+        video_media_ids: 放在图片之前的视频素材
+        source: 来源目录标记，写入正文的data-source属性，同步草稿镜像时据此反查目录
+
+    Returns:
+        str: 正文HTML
+    """
+    blocks = load_layouts()
+    ratios = list(ratios) if ratios else [None] * len(image_urls)
+    layout = choose_layout(ratios, layout)
+    body: List[str] = []
+
+    for media_id in video_media_ids or []:
+        blocks['video'].render_into(body, media_id=html.escape(media_id, quote=True))
+
+    if layout == 'two_column':
+        # 图片顺序由layout_planner按宽高比配对：每对单独成一行（两格各占48%，间隔4%），
+        # 行高只由这一对决定，不会随前面图片的高度差逐行累积错位；奇数时最后一张单独占一行的左格
+        for row_start in range(0, len(image_urls), 2):
+            cells: List[str] = []
+            for i in range(row_start, min(row_start + 2, len(image_urls))):
+                gap = '4%' if i > row_start else '0px'
+                blocks['pair_cell'].render_into(cells, gap=gap, **_image_values(image_urls[i], i))
+            blocks['pair_row'].render_into(body, gap='15px' if row_start else '25px', cells=cells)
+    elif layout == 'grid':
+        for row_start in range(0, len(image_urls), 3):
+            cells: List[str] = []
+            for i in range(row_start, min(row_start + 3, len(image_urls))):
+                gap = '8px' if i > row_start else '0px'
+                blocks['grid_cell'].render_into(cells, gap=gap, **_image_values(image_urls[i], i))
+            blocks['grid_row'].render_into(body, gap='8px' if row_start else '0px', cells=cells)
+    else:
+        for i, url in enumerate(image_urls):
+            blocks['single'].render_into(body, gap='8px' if i else '0px', **_image_values(url, i))
+
+    out: List[str] = []
+    blocks['article'].render_into(out, body=body, source=html.escape(source, quote=True))
+    return ''.join(out)
+
+
+def content_size_error(content: str) -> Optional[str]:
+    """正文超过草稿接口限制时返回原因，否则返回None"""
+    if len(content) >= MAX_CONTENT_CHARS:
+        return f'正文长度（{len(content)}字符）超过{MAX_CONTENT_CHARS}字符限制'
+    size = len(content.encode('utf-8'))
+    if size >= MAX_CONTENT_BYTES:
+        return f'正文大小（{size / 1024:.0f}KB）超过1MB限制'
+    return None
+
+
+def check_content_size(content: str):
+    """正文超过草稿接口限制时抛出异常"""
+    error = content_size_error(content)
+    if error:
+        raise Exception(error)
+
+
+def render_fitting(image_urls: List[str], ratios: Optional[List[float]] = None, layout: str = 'auto',
+                   video_media_ids: Optional[List[str]] = None, source: str = '') -> Tuple[str, int]:
+    """渲染正文，超过大小限制时从末尾成对去掉图片直到满足限制
+
+    Returns:
+        Tuple[str, int]: (正文HTML, 实际使用的图片数)
+    """
+    count = len(image_urls)
+    ratios = list(ratios) if ratios else None
+    while True:
+        content = render_article(image_urls[:count], ratios[:count] if ratios else None, layout, video_media_ids,
+                                 source)
+        if content_size_error(content) is None or count <= 2:
+            break
+        count -= 2
+    if count < len(image_urls):
+        logger.warning(f'正文超过大小限制，只使用前{count}张图片（共{len(image_urls)}张）')
+    check_content_size(content)
+    return content, count
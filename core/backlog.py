@@ -0,0 +1,421 @@
+import os
+import json
+import fcntl
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional
+
+from core.accounts import Account
+from core.library_index import get_library_index
+from core.sidecar import get_directory_metadata, clean_desc
+from core.video import find_videos, upload_video, video_cover_for
+from core.article_mirror import source_key, mirrored_directories
+from core.log import log_context, submit_with_context
+from core.memory_governor import get_memory_governor, track_peak_rss
+from core.publisher import get_random_images, build_article, image_ratios, theme_selection, MAX_ARTICLES_PER_DRAFT
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaBudget:
+    def __init__(self, limit: Optional[int]):
+        """接口调用预算，limit为None时不限制"""
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def try_consume(self, n: int = 1) -> bool:
+        """尝试消耗预算，预算不足时返回False"""
+        with self._lock:
+            if self.limit is not None and self.used + n > self.limit:
+                return False
+            self.used += n
+            return True
+
+    @property
+    def exhausted(self) -> bool:
+        with self._lock:
+            return self.limit is not None and self.used >= self.limit
+
+
+class BacklogState:
+    def __init__(self, path: str):
+        """积压处理进度，保存在JSON文件中，中断后可以继续
+
+        积压处理和常驻发布在不同的进程中修改同一个文件，每次修改都在进程间文件锁内重新读取文件、
+        修改后写回，不会覆盖其它进程的修改。
+
+        Args:
+            path: 状态文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.dirs: Dict[str, Dict] = {}
+        self.drafts: List[Dict] = []
+        self._merge(self._read())
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _merge(self, data: Dict):
+        """用文件中的内容更新内存中的状态；已有目录的字典原地更新，其它线程持有的引用仍然有效"""
+        for directory, fresh in data.get('dirs', {}).items():
+            existing = self.dirs.get(directory)
+            if existing is None:
+                self.dirs[directory] = fresh
+            else:
+                existing.update(fresh)
+        self.drafts[:] = data.get('drafts', [])
+
+    def _write(self):
+        """先写临时文件再替换，避免中断时留下损坏的状态文件"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'dirs': self.dirs, 'drafts': self.drafts}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def _update(self):
+        """在进程间文件锁内重新读取状态、执行修改并写回；修改抛出异常时不写回"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._merge(self._read())
+                    yield
+                    self._write()
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def dir_state(self, directory: str) -> Dict:
+        with self._lock:
+            return self.dirs.setdefault(directory, {'images': {}})
+
+    def update_dir(self, directory: str, **fields):
+        with self._update():
+            self.dirs.setdefault(directory, {'images': {}}).update(fields)
+
+    def set_image_url(self, directory: str, path: str, url: str):
+        with self._update():
+            self.dirs[directory].setdefault('images', {})[path] = url
+
+    def set_video_media_id(self, directory: str, path: str, media_id: str):
+        with self._update():
+            self.dirs[directory].setdefault('videos', {})[path] = media_id
+
+    def ready_directories(self) -> List[str]:
+        """文章已准备好但还没有打包成草稿的目录"""
+        with self._lock:
+            return [d for d, s in self.dirs.items() if s.get('article') and not s.get('drafted')]
+
+    def add_draft(self, media_id: str, directories: List[str]):
+        """记录新建的暂存草稿，并把其中的目录标记为已打包"""
+        with self._update():
+            self.drafts.append({'media_id': media_id, 'dirs': directories, 'created_at': time.time()})
+            for directory in directories:
+                self.dirs.setdefault(directory, {'images': {}})['drafted'] = media_id
+
+    def staged_drafts(self) -> List[Dict]:
+        """尚未发送、也没有被认领的暂存草稿"""
+        with self._lock:
+            return [d for d in self.drafts if not d.get('sent') and not d.get('claimed_at')]
+
+    def claimed_drafts(self) -> List[Dict]:
+        """已被认领但还没有确认发送的草稿（群发过程中进程退出时会留在这里）"""
+        with self._lock:
+            return [d for d in self.drafts if not d.get('sent') and d.get('claimed_at')]
+
+    def _find_draft(self, media_id: str) -> Dict:
+        for draft in self.drafts:
+            if draft['media_id'] == media_id:
+                return draft
+        raise Exception(f'暂存草稿不存在: {media_id}')
+
+    def claim_draft(self) -> Optional[Dict]:
+        """认领最早暂存的一个草稿，认领后其它发布流程不会再取到它"""
+        with self._update():
+            staged = [d for d in self.drafts if not d.get('sent') and not d.get('claimed_at')]
+            if not staged:
+                return None
+            draft = staged[0]
+            draft['claimed_at'] = time.time()
+        return dict(draft)
+
+    def mark_sent(self, media_id: str, msg_id=None):
+        """群发成功后把认领的草稿标记为已发送"""
+        with self._update():
+            draft = self._find_draft(media_id)
+            draft['sent'] = True
+            draft['sent_at'] = time.time()
+            draft['msg_id'] = msg_id
+
+    def release(self, media_id: str):
+        """群发失败时释放认领，草稿下次仍然可以发送"""
+        with self._update():
+            self._find_draft(media_id).pop('claimed_at', None)
+
+
+def get_backlog_state(account: Account) -> BacklogState:
+    """打开账号的积压处理状态"""
+    return BacklogState(os.path.join(account.data_dir, 'backlog_state.json'))
+
+
+def claim_staged_draft(account: Account) -> Optional[Dict]:
+    """认领最早暂存的一个草稿
+
+    群发成功后调用mark_draft_sent，失败时调用release_staged_draft。
+
+    Returns:
+        Optional[Dict]: 暂存草稿，包含media_id和目录列表；没有暂存草稿时返回None
+    """
+    return get_backlog_state(account).claim_draft()
+
+
+def mark_draft_sent(account: Account, media_id: str, msg_id=None):
+    get_backlog_state(account).mark_sent(media_id, msg_id)
+
+
+def release_staged_draft(account: Account, media_id: str):
+    get_backlog_state(account).release(media_id)
+
+
+class BacklogProcessor:
+    def __init__(self, account: Account, wechat, encode_pool, max_workers: int = 4,
+                 upload_budget: Optional[int] = None, draft_budget: Optional[int] = None,
+                 batch_size: int = MAX_ARTICLES_PER_DRAFT):
+        """批量处理所有未处理目录，提前生成封面、上传图片并创建暂存草稿
+
+        每个目录的进度（封面、已上传图片、文章）都会写入状态文件，中断后重新运行
+        会跳过已完成的步骤。发布当天只需要从暂存草稿中取一篇群发。
+
+        Args:
+            account: 发布账号
+            wechat: WeChatArticle实例
+            encode_pool: 图片编码进程池（封面渲染、图片压缩）
+            max_workers: 同时处理的目录数（全局并发上限）
+            upload_budget: 本次运行最多调用的上传接口次数，为None时不限制
+            draft_budget: 本次运行最多创建的草稿数，为None时不限制
+            batch_size: 每个草稿包含的文章数
+        """
+        from core.derivatives import get_derivative_cache
+        from core.image_quality import quality_thresholds
+
+        self.account = account
+        self.wechat = wechat
+        self.encode_pool = encode_pool
+        self.max_workers = max(1, max_workers)
+        self.uploads = QuotaBudget(upload_budget)
+        self.drafts = QuotaBudget(draft_budget)
+        self.batch_size = max(1, min(batch_size, MAX_ARTICLES_PER_DRAFT))
+        self.state = get_backlog_state(account)
+        self._video_executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.index = get_library_index(account)
+        self.max_distance = account.settings.get('near_duplicate_distance', 6)
+        self.quality = quality_thresholds(account.settings)
+        self.derivatives = get_derivative_cache(account.settings)
+        self._progress_lock = threading.Lock()
+        self._finished = 0
+
+    def pending_directories(self) -> List[str]:
+        """所有未处理、尚未暂存为草稿、也不在草稿和已发布文章镜像中的目录"""
+        processed = set(self.account.read_processed_dirs())
+
+        pending = []
+        for root, dirs, _ in os.walk(self.account.image_base_dir):
+            for d in sorted(dirs):
+                dir_path = os.path.join(root, d)
+                if dir_path in processed or self.state.dirs.get(dir_path, {}).get('drafted'):
+                    continue
+                pending.append(dir_path)
+        mirrored = mirrored_directories(self.account, pending)
+        return [d for d in pending if d not in mirrored]
+
+    def _cover_paths(self, directory: str):
+        cover_dir = os.path.join(self.account.data_dir, 'covers')
+        os.makedirs(cover_dir, exist_ok=True)
+        key = hashlib.md5(directory.encode('utf-8')).hexdigest()[:12]
+        return (os.path.join(cover_dir, f'{key}_merged_cover.jpg'),
+                os.path.join(cover_dir, f'{key}_thumb_merged_cover.jpg'))
+
+    def prepare_directory(self, directory: str) -> bool:
+        """准备一个目录的封面和图片，返回目录是否已完全准备好"""
+        from core.create_cover import create_merged_cover, merged_cover_footprint
+        from core.compress_image import compress_image
+
+        dir_state = self.state.dir_state(directory)
+        if dir_state.get('article'):
+            return True
+        if dir_state.get('failed'):
+            return False
+
+        # 先扫描图片，没有有效图片的目录（例如只有视频）直接标记失败
+        image_paths = dir_state.get('image_paths')
+        if image_paths is None:
+            theme, theme_size = theme_selection(self.account.settings)
+            image_paths = get_random_images(directory, theme_size, index=self.index, max_distance=self.max_distance,
+                                            pool=self.encode_pool, quality=self.quality,
+                                            derivatives=self.derivatives, theme=theme)
+            cover_paths = get_random_images(directory, 3, index=self.index, max_distance=self.max_distance,
+                                            even=False, quality=self.quality, theme=theme)
+            # 选择先写入状态文件作为预留，再在索引中标记，后续目录中的近似重复图片会被排除；
+            # 目录最终失败时由_fail释放，中断后重新运行沿用状态文件中的选择
+            self.state.update_dir(directory, image_paths=image_paths, cover_paths=cover_paths)
+            self.index.mark_published(set(image_paths) | set(cover_paths))
+        video_cover = video_cover_for(self.account, directory)
+        if (not image_paths or len(dir_state.get('cover_paths') or []) < 3) and not video_cover:
+            self._fail(directory, '目录中没有足够的有效图片')
+            return False
+
+        # 封面：在进程池中渲染和压缩，上传为永久缩略图
+        if not dir_state.get('thumb_media_id'):
+            merged_path, thumb_path = self._cover_paths(directory)
+            if not os.path.exists(thumb_path):
+                if len(dir_state.get('cover_paths') or []) >= 3:
+                    cover_paths = dir_state['cover_paths']
+                    get_memory_governor().submit(
+                        self.encode_pool, merged_cover_footprint(cover_paths, self.derivatives), create_merged_cover,
+                        directory, merged_path, image_paths=cover_paths, derivatives=self.derivatives).result()
+                else:
+                    merged_path = video_cover
+                self.encode_pool.submit(compress_image, merged_path, thumb_path).result()
+            if not self.uploads.try_consume():
+                return False
+            result = self.wechat.upload_permanent_material(thumb_path, 'thumb')
+            self.state.update_dir(directory, thumb_media_id=result['media_id'])
+
+        # 视频：与文章图片同时在后台上传，跳过已经上传过的视频
+        metadata = get_directory_metadata(self.index, directory)
+        video_title = clean_desc(metadata.get('desc', '')) if metadata else ''
+        video_futures = {}
+        budget_left = True
+        for path in find_videos(directory):
+            if path in dir_state.get('videos', {}):
+                continue
+            if not self.uploads.try_consume():
+                budget_left = False
+                break
+            video_futures[path] = self._video_executor.submit(upload_video, self.wechat, self.account,
+                                                              path, video_title)
+
+        # 文章图片：跳过已经上传过的图片；预算用完时也要先记录已完成的视频
+        for path in image_paths:
+            if not budget_left:
+                break
+            if path in dir_state['images']:
+                continue
+            if not self.uploads.try_consume():
+                budget_left = False
+                break
+            try:
+                self.state.set_image_url(directory, path, self.wechat.upload_article_image(path))
+            except Exception as e:
+                # 失败的图片不记录，重新运行时会再次尝试
+                logger.error(f'图片上传失败 {path}: {str(e)}', extra={'image': path})
+
+        for path, future in video_futures.items():
+            try:
+                self.state.set_video_media_id(directory, path, future.result())
+            except Exception as e:
+                # 失败的视频不记录，重新运行时会再次尝试
+                logger.error(f'视频上传失败 {path}: {str(e)}')
+        if not budget_left:
+            return False
+
+        image_urls = [dir_state['images'][p] for p in image_paths if dir_state['images'].get(p)]
+        video_media_ids = list(dir_state.get('videos', {}).values())
+        if not image_urls and not video_media_ids:
+            self._fail(directory, '没有成功上传的图片')
+            return False
+
+        uploaded = [p for p in image_paths if dir_state['images'].get(p)]
+        article = build_article(image_urls, self.account, metadata, video_media_ids,
+                                image_ratios(self.index, uploaded), source_key(self.account, directory))
+        article['thumb_media_id'] = dir_state['thumb_media_id']
+        self.state.update_dir(directory, article=article)
+        return True
+
+    def _fail(self, directory: str, reason: str):
+        """标记目录失败，并释放它预留的图片，以后的发布仍然可以选择这些图片"""
+        dir_state = self.state.dir_state(directory)
+        self.index.release_published(set(dir_state.get('image_paths') or []) | set(dir_state.get('cover_paths') or []))
+        self.state.update_dir(directory, failed=reason)
+
+    def _report(self, directory: str, ok: bool, total: int):
+        with self._progress_lock:
+            self._finished += 1
+            mark = '完成' if ok else '未完成'
+            print(f'[{self._finished}/{total}] {mark}: {os.path.basename(directory)} '
+                  f'（上传{self.uploads.used}次，草稿{self.drafts.used}篇）')
+
+    def _flush_drafts(self, force: bool = False):
+        """把已准备好的文章按batch_size打包成草稿"""
+        ready = self.state.ready_directories()
+        while ready and (len(ready) >= self.batch_size or force):
+            batch, ready = ready[:self.batch_size], ready[self.batch_size:]
+            if not self.drafts.try_consume():
+                return
+            media_id = self.wechat.create_draft([self.state.dirs[d]['article'] for d in batch])
+            self.state.add_draft(media_id, batch)
+            self._mark_processed(batch)
+            logger.info(f'[{self.account.name}] 已暂存草稿 {media_id}，包含{len(batch)}篇文章')
+
+    def _mark_processed(self, directories: List[str]):
+        """把已暂存的目录写入已处理列表，避免日常发布再次选中"""
+        processed = self.account.read_processed_dirs()
+        processed.extend(d for d in directories if d not in processed)
+        os.makedirs(os.path.dirname(self.account.processed_dirs_file), exist_ok=True)
+        with open(self.account.processed_dirs_file, 'w', encoding='utf-8') as f:
+            json.dump(processed, f, indent=4, ensure_ascii=False)
+
+    def run(self) -> Dict:
+        """处理全部积压目录
+
+        Returns:
+            Dict: 本次运行的统计信息
+        """
+        start = time.time()
+        pending = self.pending_directories()
+        print(f'[{self.account.name}] 待处理目录: {len(pending)}')
+        self._finished = 0
+
+        with log_context(account=self.account.name, stage='backlog'), \
+                track_peak_rss(f'{self.account.name} backlog', self.encode_pool, get_memory_governor()) as memory, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {submit_with_context(executor, self.prepare_directory, d): d for d in pending}
+            for future in as_completed(futures):
+                directory = futures[future]
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    logger.error(f'处理目录失败 {directory}: {str(e)}')
+                    ok = False
+                self._report(directory, ok, len(pending))
+                self._flush_drafts()
+
+        self._video_executor.shutdown()
+
+        # 所有目录都已处理时，把不足一批的剩余文章也打包
+        self._flush_drafts(force=not self.uploads.exhausted)
+
+        summary = {
+            'pending': len(pending),
+            'prepared': sum(1 for d in pending if self.state.dirs.get(d, {}).get('article')),
+            'uploads': self.uploads.used,
+            'drafts_created': self.drafts.used,
+            'staged_drafts': len(self.state.staged_drafts()),
+            'upload_limit': self.wechat.upload_limiter.limit,
+            'peak_rss_mb': memory['peak_rss_mb'],
+            'seconds': round(time.time() - start, 1),
+        }
+        self.account.save_upload_limit()
+        print(f'[{self.account.name}] 处理结束: {summary}')
+        return summary
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from typing import List, Dict, Optional, Iterable
+
+import numpy as np
+
+from core.image_color import COLOR_FIELDS, DOMINANT_COLORS, feature_matrix, theme_scores, select_coherent
+from core.library_index import to_unsigned64
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION = 2
+
+# 每一列保存为一个.npy文件；行按(dir, path)排序，同一目录的图片是连续的一段
+COLUMNS = {
+    'id': np.int64,             # images表的rowid
+    'dir_id': np.int32,         # 目录在dirs中的下标
+    'width': np.int32,          # 未知时为0
+    'height': np.int32,
+    'ratio': np.float32,        # 宽高比，未知时为NaN
+    'dhash': np.uint64,
+    'hashed': np.bool_,         # dhash是否有效
+    'sharpness': np.float32,    # 质量指标，未评分时为NaN
+    'brightness': np.float32,
+    'dark_ratio': np.float32,
+    'bright_ratio': np.float32,
+    'published': np.uint8,      # 打开时可写，发布后原地更新
+    'hue': np.float32,          # 颜色特征，未计算时为NaN
+    'saturation': np.float32,
+    'value': np.float32,
+    'luma_p10': np.float32,
+    'luma_p50': np.float32,
+    'luma_p90': np.float32,
+}
+
+# 主色保存为(行数, DOMINANT_COLORS, 4)的数组，每个主色为r、g、b、比例
+_FLOAT_COLUMNS = ('ratio', 'sharpness', 'brightness', 'dark_ratio', 'bright_ratio') + COLOR_FIELDS
+
+# 路径和目录名保存为UTF-8字节串拼接的数组加偏移量，只在需要时解码选中的行
+_STRINGS = ('paths', 'dirs')
+
+_QUERY = ('SELECT rowid, path, dir, width, height, dhash, sharpness, brightness, dark_ratio, bright_ratio, '
+          'published, hue, saturation, value, luma_p10, luma_p50, luma_p90, dominant FROM images ORDER BY dir, path')
+
+
+def _pack_strings(values: List[str]):
+    encoded = [v.encode('utf-8') for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def build_catalog(index, catalog_dir: str, chunk_size: int = 50000) -> 'LibraryCatalog':
+    """把图库索引导出为列式快照
+
+    先写入临时目录，完成后整体替换旧快照；已经映射旧快照的进程继续读取旧文件，不受影响。
+
+    Args:
+        index: 图库索引（LibraryIndex）
+        catalog_dir: 快照目录
+        chunk_size: 每次从数据库读取的行数
+
+    Returns:
+        LibraryCatalog: 新快照
+    """
+    start = time.perf_counter()
+    conn = index._conn()
+    count = conn.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+    columns = {name: np.zeros(count, dtype=dtype) for name, dtype in COLUMNS.items()}
+    for name in _FLOAT_COLUMNS:
+        columns[name].fill(np.nan)
+    columns['dominant'] = np.full((count, DOMINANT_COLORS, 4), np.nan, dtype=np.float32)
+    paths, dirs, dir_start = [], [], []
+
+    cursor = conn.execute(_QUERY)
+    i = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            if not dirs or dirs[-1] != row['dir']:
+                dirs.append(row['dir'])
+                dir_start.append(i)
+            paths.append(row['path'])
+            columns['id'][i] = row['rowid']
+            columns['dir_id'][i] = len(dirs) - 1
+            width, height = row['width'] or 0, row['height'] or 0
+            columns['width'][i] = width
+            columns['height'][i] = height
+            if width and height:
+                columns['ratio'][i] = width / height
+            if row['dhash'] is not None:
+                columns['dhash'][i] = to_unsigned64(row['dhash'])
+                columns['hashed'][i] = True
+            for name in ('sharpness', 'brightness', 'dark_ratio', 'bright_ratio') + COLOR_FIELDS:
+                if row[name] is not None:
+                    columns[name][i] = row[name]
+            if row['dominant'] is not None:
+                colors = json.loads(row['dominant'])[:DOMINANT_COLORS]
+                columns['dominant'][i, :len(colors)] = colors
+            columns['published'][i] = 1 if row['published'] else 0
+            i += 1
+    # 统计行数和读取之间有新写入时以实际读到的行为准
+    if i != count:
+        columns = {name: values[:i] for name, values in columns.items()}
+    dir_start.append(i)
+
+    parent = os.path.dirname(os.path.abspath(catalog_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = f'{catalog_dir}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), values)
+    for name, values in (('paths', paths), ('dirs', dirs)):
+        blob, offsets = _pack_strings(values)
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), blob)
+        np.save(os.path.join(tmp_dir, f'{name}_offsets.npy'), offsets)
+    np.save(os.path.join(tmp_dir, 'dir_start.npy'), np.asarray(dir_start, dtype=np.int64))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': CATALOG_VERSION, 'count': i, 'dirs': len(dirs), 'built_at': time.time()}, f)
+
+    old_dir = f'{catalog_dir}.old-{os.getpid()}'
+    if os.path.exists(catalog_dir):
+        os.rename(catalog_dir, old_dir)
+    os.rename(tmp_dir, catalog_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info(f'图库快照已生成: {i}张图片，{len(dirs)}个目录，用时{time.perf_counter() - start:.2f}秒')
+    return LibraryCatalog(catalog_dir)
+
+
+class LibraryCatalog:
+    def __init__(self, catalog_dir: str):
+        """内存映射的列式图库快照
+
+        打开时只读取各.npy文件的头部并映射文件，不解析任何记录；筛选全部是对整列的向量化运算，
+        只有最终选中的行才解码路径。published列以可写方式映射，发布后原地更新，多个进程共享。
+
+        Args:
+            catalog_dir: 快照目录（build_catalog的输出）
+        """
+        self.catalog_dir = catalog_dir
+        with open(os.path.join(catalog_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != CATALOG_VERSION:
+            raise Exception(f'图库快照版本不兼容: {self.meta.get("version")}')
+        for name in COLUMNS:
+            mode = 'r+' if name == 'published' else 'r'
+            setattr(self, name, self._load(name, mode))
+        self.dominant = self._load('dominant')
+        for name in _STRINGS:
+            setattr(self, f'_{name}', self._load(name))
+            setattr(self, f'_{name}_offsets', self._load(f'{name}_offsets'))
+        self.dir_start = self._load('dir_start')
+        self._dir_ids = None
+        self._lock = threading.Lock()
+
+    def _load(self, name: str, mode: str = 'r') -> np.ndarray:
+        return np.load(os.path.join(self.catalog_dir, f'{name}.npy'), mmap_mode=mode)
+
+    def __len__(self) -> int:
+        return self.meta['count']
+
+    @staticmethod
+    def _decode(blob: np.ndarray, offsets: np.ndarray, i: int) -> str:
+        return blob[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+    def path(self, row: int) -> str:
+        return self._decode(self._paths, self._paths_offsets, row)
+
+    def paths(self, rows: Iterable[int]) -> List[str]:
+        return [self.path(int(row)) for row in rows]
+
+    def dir_name(self, dir_id: int) -> str:
+        return self._decode(self._dirs, self._dirs_offsets, dir_id)
+
+    def find_dir(self, directory: str) -> Optional[int]:
+        """目录在快照中的编号，快照中没有时返回None；第一次调用时解码全部目录名"""
+        if self._dir_ids is None:
+            with self._lock:
+                if self._dir_ids is None:
+                    self._dir_ids = {self.dir_name(i): i for i in range(self.meta['dirs'])}
+        return self._dir_ids.get(directory)
+
+    def dir_rows(self, directory: str) -> slice:
+        """目录中图片所在的行范围，快照中没有该目录时为空"""
+        dir_id = self.find_dir(directory)
+        if dir_id is None:
+            return slice(0, 0)
+        return slice(int(self.dir_start[dir_id]), int(self.dir_start[dir_id + 1]))
+
+    def quality_mask(self, thresholds: Optional[Dict]) -> np.ndarray:
+        """按质量阈值筛选，规则与image_quality.passes_quality一致（未知的指标视为通过）"""
+        from core.image_quality import quality_mask
+
+        width = np.where(self.width > 0, self.width, np.nan)
+        height = np.where(self.height > 0, self.height, np.nan)
+        columns = {'width': width, 'height': height, 'sharpness': self.sharpness, 'brightness': self.brightness,
+                   'dark_ratio': self.dark_ratio, 'bright_ratio': self.bright_ratio}
+        return quality_mask(columns, thresholds, len(self))
+
+    def candidate_mask(self, thresholds: Optional[Dict] = None, unpublished: bool = True,
+                       ratio_range: Optional[tuple] = None) -> np.ndarray:
+        """可以选用的图片
+
+        Args:
+            thresholds: 质量阈值，为None时不检查质量
+            unpublished: 是否只保留未发布的图片
+            ratio_range: 宽高比范围(最小, 最大)
+
+        Returns:
+            np.ndarray: 布尔数组
+        """
+        mask = self.quality_mask(thresholds)
+        if unpublished:
+            mask &= self.published == 0
+        if ratio_range is not None:
+            low, high = ratio_range
+            mask &= (self.ratio >= low) & (self.ratio <= high)
+        return mask
+
+    def candidates_per_dir(self, mask: np.ndarray) -> np.ndarray:
+        """每个目录中满足条件的图片数，下标为目录编号"""
+        return np.bincount(self.dir_id[mask], minlength=self.meta['dirs'])
+
+    def select_themed(self, count: int, theme: Optional[str] = None, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """在整个图库中选出颜色特征最接近、最符合主题的count张图片
+
+        Args:
+            count: 需要的图片数量
+            theme: 主题（image_color.THEMES），为None时只要求彼此相似
+            mask: 候选图片，例如candidate_mask的结果；为None时使用全部图片
+
+        Returns:
+            np.ndarray: 选中的行号
+        """
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+        columns = {name: getattr(self, name)[rows].astype(np.float64) for name in COLOR_FIELDS}
+        columns['dominant'] = self.dominant[rows]
+        scores = theme_scores(columns, theme) if theme else None
+        return rows[select_coherent(feature_matrix(columns), count, scores)]
+
+    def records(self, rows: Iterable[int]) -> List[Dict]:
+        """把选中的行转换为与图库索引相同格式的记录"""
+        records = []
+        for row in rows:
+            row = int(row)
+            record = {'path': self.path(row), 'dir': self.dir_name(int(self.dir_id[row])),
+                      'width': int(self.width[row]) or None, 'height': int(self.height[row]) or None,
+                      'dhash': int(self.dhash[row]) if self.hashed[row] else None,
+                      'published': int(self.published[row])}
+            for name in ('sharpness', 'brightness', 'dark_ratio', 'bright_ratio') + COLOR_FIELDS:
+                value = float(getattr(self, name)[row])
+                record[name] = None if np.isnan(value) else value
+            colors = self.dominant[row]
+            record['dominant'] = None if np.isnan(colors).all() else colors[~np.isnan(colors).any(axis=1)].tolist()
+            records.append(record)
+        return records
+
+    def mark_published(self, paths: Iterable[str], published: bool = True) -> int:
+        """在快照中原地标记已发布的图片，快照中没有的图片忽略
+
+        Args:
+            paths: 图片路径
+            published: 为False时撤销标记（预留的图片没有发出去）
+
+        Returns:
+            int: 更新的行数
+        """
+        by_dir = {}
+        for path in paths:
+            by_dir.setdefault(os.path.dirname(path), set()).add(path)
+        updated = 0
+        for rows in self._rows_for(by_dir):
+            self.published[rows] = 1 if published else 0
+            updated += len(rows)
+        if updated:
+            self.published.flush()
+        return updated
+
+    def _rows_for(self, by_dir: Dict[str, set]):
+        # 索引中的dir是扫描时的目录，图片可能位于它的子目录中，逐级向上查找
+        for parent, wanted in by_dir.items():
+            directory = parent
+            while wanted:
+                rows = self.dir_rows(directory)
+                if rows.stop > rows.start:
+                    found = [i for i in range(rows.start, rows.stop) if self.path(i) in wanted]
+                    if found:
+                        wanted = wanted - set(self.paths(found))
+                        yield found
+                up = os.path.dirname(directory)
+                if up == directory:
+                    break
+                directory = up
+
+    def stats(self) -> Dict:
+        return {'images': len(self), 'dirs': self.meta['dirs'], 'published': int(np.count_nonzero(self.published)),
+                'built_at': self.meta['built_at']}
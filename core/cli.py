@@ -0,0 +1,492 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import statistics
+import subprocess
+from typing import List, Dict, Optional
+
+# 命令行入口只导入标准库和轻量模块；requests、PIL、numpy等在各子命令内部按需导入，
+# status等轻量命令的冷启动时间不受影响（可以用 gzh bench startup 检查）
+
+logger = logging.getLogger(__name__)
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 轻量命令不应该加载的模块
+HEAVY_MODULES = ('requests', 'PIL', 'numpy')
+
+# 轻量命令（status等）会导入的模块
+LIGHT_MODULES = ('core.cli', 'core.accounts', 'core.article_mirror', 'core.backlog', 'core.library_index',
+                 'core.log', 'core.publisher')
+
+# 导入轻量命令模块的时间预算（毫秒），不包含解释器本身的启动时间，不同机器之间可以比较
+STARTUP_BUDGET_MS = 100
+
+# 在新的解释器中导入轻量命令的模块，输出耗时和其中混入的重量级模块
+_PROBE = """
+import sys, json, time, importlib
+start = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module(name)
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'import_ms': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _select_accounts(config: dict, name: Optional[str]) -> list:
+    from core.accounts import load_accounts
+
+    accounts = load_accounts(config)
+    if name:
+        accounts = [a for a in accounts if a.name == name]
+        if not accounts:
+            raise Exception(f'未知账号: {name}')
+    return accounts
+
+
+def _list_directories(base_dir: str) -> List[str]:
+    all_dirs = []
+    for root, dirs, _ in os.walk(base_dir):
+        for d in dirs:
+            all_dirs.append(os.path.join(root, d))
+    return all_dirs
+
+
+def cmd_status(args, config: dict) -> int:
+    """各账号的目录、配额、暂存草稿和镜像状态，只读取本地文件"""
+    from core.article_mirror import ArticleMirror, mirror_db_path, mirrored_directories
+    from core.backlog import get_backlog_state
+    from core.library_index import catalog_meta
+
+    for account in _select_accounts(config, args.account):
+        all_dirs = _list_directories(account.image_base_dir)
+        processed = set(account.read_processed_dirs())
+        mirror = ArticleMirror(mirror_db_path(account)) if os.path.exists(mirror_db_path(account)) else None
+        mirrored = mirrored_directories(account, all_dirs, mirror) if mirror else set()
+        pending = [d for d in all_dirs if d not in processed and d not in mirrored]
+        backlog = get_backlog_state(account)
+        staged = backlog.staged_drafts()
+        claimed = backlog.claimed_drafts()
+
+        print(f'[{account.name}]')
+        print(f'  图库目录: {len(all_dirs)}，已处理: {len(processed)}，未处理: {len(pending)}')
+        print(f'  今日剩余配额: {account.remaining_quota()}/{account.daily_quota}，暂存草稿: {len(staged)}')
+        if claimed:
+            print(f'  已认领但未确认发送的草稿: {", ".join(d["media_id"] for d in claimed)}')
+        catalog = catalog_meta(account)
+        if catalog:
+            built = time.strftime('%Y-%m-%d %H:%M', time.localtime(catalog['built_at']))
+            print(f'  图库快照: {catalog["count"]}张图片，{catalog["dirs"]}个目录，生成于{built}')
+        upload_limit = account.read_upload_limit()
+        if upload_limit:
+            limits = [h['limit'] for h in upload_limit['history']]
+            print(f'  上传并发: 上次结束时{upload_limit["limit"]}（{upload_limit["min"]}-{upload_limit["max"]}），'
+                  f'最近调整: {" → ".join(str(n) for n in limits[-10:])}')
+        if mirror is None:
+            print('  文章镜像: 尚未同步')
+            continue
+        for kind, state in mirror.status().items():
+            synced = time.strftime('%Y-%m-%d %H:%M', time.localtime(state['synced_at'])) if state['synced_at'] else '从未'
+            print(f'  文章镜像 {kind}: {state["count"]}条，上次同步: {synced}')
+    return 0
+
+
+def cmd_scan(args, config: dict) -> int:
+    """增量扫描图库，计算新增图片的尺寸、感知哈希和质量评分，并在同一次解码中生成衍生图"""
+    from core.accounts import get_shared_encode_pool, shutdown_shared_pools
+    from core.derivatives import get_derivative_cache
+    from core.library_index import get_library_index, scan_directory
+    from core.memory_governor import get_memory_governor, track_peak_rss
+
+    pool = get_shared_encode_pool(args.workers or config.get('encode_workers'))
+    try:
+        for account in _select_accounts(config, args.account):
+            index = get_library_index(account)
+            derivatives = get_derivative_cache(account.settings)
+            directories = [args.dir] if args.dir else _list_directories(account.image_base_dir)
+            start = time.perf_counter()
+            total = 0
+            with track_peak_rss(f'{account.name} scan', pool, get_memory_governor()) as report:
+                for i, directory in enumerate(directories, 1):
+                    total += len(scan_directory(index, directory, pool, derivatives))
+                    print(f'[{account.name}] [{i}/{len(directories)}] {os.path.basename(directory)}')
+            elapsed = time.perf_counter() - start
+            print(f'[{account.name}] 扫描完成: {len(directories)}个目录，{total}张有效图片，用时{elapsed:.1f}秒，'
+                  f'峰值内存{report["peak_rss_mb"]}MB')
+            catalog = index.build_catalog()
+            print(f'[{account.name}] 图库快照已更新: {len(catalog)}张图片，{catalog.meta["dirs"]}个目录')
+    finally:
+        shutdown_shared_pools()
+    return 0
+
+
+def cmd_themed(args, config: dict) -> int:
+    """按颜色主题从图库快照中选出一组彼此相近的图片，快照由 gzh scan 生成"""
+    from core.image_quality import quality_thresholds
+    from core.library_index import get_library_index
+
+    for account in _select_accounts(config, args.account):
+        catalog = get_library_index(account).catalog()
+        if catalog is None:
+            print(f'[{account.name}] 没有可用的图库快照，请先运行 gzh scan')
+            continue
+        mask = catalog.candidate_mask(quality_thresholds(account.settings), unpublished=not args.include_published)
+        rows = catalog.select_themed(args.count, args.theme, mask)
+        print(f'[{account.name}] 选出{len(rows)}张图片（主题: {args.theme or "无"}）')
+        for record in catalog.records(rows):
+            print(f'  {record["path"]}  色相{record["hue"]:.0f} 饱和度{record["saturation"]:.2f} '
+                  f'亮度中位数{record["luma_p50"]:.0f}')
+    return 0
+
+
+def _ask(prompt: str) -> bool:
+    return input(prompt).lower() == 'y'
+
+
+def _publish_interactive(account, config: dict) -> int:
+    """选择一个未处理的目录创建草稿，再逐步询问发布方式"""
+    from core.accounts import get_shared_session, get_shared_encode_pool
+    from core.library_index import get_library_index
+    from core.publisher import get_unprocessed_directory, prepare_article
+
+    wechat = account.get_wechat(session=get_shared_session(config.get('http_pool_size', 10)),
+                                encode_pool=get_shared_encode_pool(config.get('encode_workers')))
+    directory = get_unprocessed_directory(account)
+    if not directory:
+        print('没有可处理的目录，程序退出')
+        return 0
+    print(f'选择处理目录: {directory}')
+    selected = set()
+    article = prepare_article(wechat, account, directory, get_shared_encode_pool(), selected)
+    if not article:
+        print('创建文章失败，程序退出')
+        return 1
+
+    print('正在创建草稿...')
+    media_id = wechat.create_draft([article])
+    print(f'草稿创建成功，media_id: {media_id}')
+    # 草稿已经创建，之后是否发布由用户决定，选中的图片不再参与选择
+    get_library_index(account).mark_published(selected)
+    if not _ask('是否要发布文章？(y/n): '):
+        return 0
+
+    if _ask('是否要群发文章？(y/n): '):
+        is_to_all = _ask('是否发送给全部用户？(y/n): ')
+        tag_id = None if is_to_all else int(input('请输入标签ID: '))
+        ignore_reprint = _ask('是否忽略原创校验？(y/n): ')
+        print('正在群发文章...')
+        result = wechat.send_mass_message(media_id, send_ignore_reprint=1 if ignore_reprint else 0,
+                                          is_to_all=is_to_all, tag_id=tag_id)
+        print(f'群发任务创建成功，msg_id: {result["msg_id"]}')
+        print('等待群发完成...')
+        print(f'群发状态: {wechat.wait_for_mass_send(result["msg_id"])}')
+    else:
+        print('正在发布文章...')
+        publish_id = wechat.publish_draft(media_id)
+        print(f'发布任务创建成功，publish_id: {publish_id}')
+        status = wechat.wait_for_publish(publish_id)
+        if status['publish_status'] == 0:
+            print('文章发布成功！')
+            for item in status.get('article_detail', {}).get('item', []):
+                print(f'文章链接: {item["article_url"]}')
+        else:
+            print(f'发布失败: {status["status_desc"]}')
+    return 0
+
+
+def wait_until(hour: int = 8):
+    """等待到下一个指定的整点"""
+    from datetime import datetime, timedelta
+
+    now = datetime.now()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if now >= target:
+        target += timedelta(days=1)
+    wait_seconds = (target - now).total_seconds()
+    logger.info(f'等待{wait_seconds}秒后开始发布...')
+    time.sleep(wait_seconds)
+
+
+def cmd_publish(args, config: dict) -> int:
+    """按配额为各账号发布文章；--daemon每天定时发布，--interactive逐步确认"""
+    from core.accounts import AccountScheduler, shutdown_shared_pools
+    from core.event_server import start_callback_server
+    from core.publisher import auto_publish
+
+    accounts = _select_accounts(config, args.account)
+    if args.interactive:
+        try:
+            return _publish_interactive(accounts[0], config)
+        finally:
+            shutdown_shared_pools()
+
+    scheduler = AccountScheduler(accounts, max_parallel=config.get('max_parallel_accounts', 1))
+    logger.info(f'已加载{len(accounts)}个账号: {", ".join(a.name for a in accounts)}')
+    # 配置了callback时启动推送事件接收服务，发布和群发完成后无需轮询
+    callback_server = start_callback_server(config, accounts)
+    watchers = []
+    if args.daemon:
+        from core.accounts import get_shared_encode_pool
+        from core.fs_watch import start_library_watchers
+
+        # 常驻运行时在后台监听图库，发布时不再扫描目录
+        watchers = start_library_watchers(accounts, get_shared_encode_pool(config.get('encode_workers')))
+    try:
+        while True:
+            try:
+                if args.daemon:
+                    wait_until(args.hour)
+                # 所有账号在同一进程内轮流发布，共享编码进程池和HTTP连接池
+                results = scheduler.run_all(auto_publish)
+                logger.info(f'本轮发布结果: {results}')
+            except Exception as e:
+                logger.error(f'运行出错: {str(e)}')
+                if not args.daemon:
+                    return 1
+            if not args.daemon:
+                return 0
+            # 无论成功失败，都等待到下一个发布时间
+    finally:
+        for watcher in watchers:
+            watcher.stop()
+        if callback_server is not None:
+            callback_server.stop()
+        shutdown_shared_pools()
+
+
+def cmd_prepare(args, config: dict) -> int:
+    """批量处理积压目录，生成暂存草稿"""
+    from core.accounts import get_shared_session, get_shared_encode_pool, shutdown_shared_pools
+    from core.backlog import BacklogProcessor
+
+    session = get_shared_session(config.get('http_pool_size', 10))
+    encode_pool = get_shared_encode_pool(config.get('encode_workers'))
+    try:
+        for account in _select_accounts(config, args.account):
+            wechat = account.get_wechat(session=session, encode_pool=encode_pool)
+            processor = BacklogProcessor(account, wechat, encode_pool, max_workers=args.workers,
+                                         upload_budget=args.upload_budget, draft_budget=args.draft_budget,
+                                         batch_size=args.batch_size)
+            processor.run()
+    finally:
+        shutdown_shared_pools()
+    return 0
+
+
+def cmd_sync(args, config: dict) -> int:
+    """增量同步草稿箱和已发布文章到本地镜像"""
+    from core.accounts import get_shared_session, shutdown_shared_pools
+    from core.article_mirror import get_article_mirror, reconcile_processed
+    from core.material_inventory import RateLimiter
+
+    session = get_shared_session(config.get('http_pool_size', 10))
+    try:
+        for account in _select_accounts(config, args.account):
+            wechat = account.get_wechat(session=session)
+            mirror = get_article_mirror(account)
+            for kind, stats in mirror.sync(wechat, full=args.full, limiter=RateLimiter(args.rate)).items():
+                mode = '全量' if stats['full'] else '增量'
+                print(f'[{account.name}] {kind}: {mode}同步，读取{stats["fetched"]}条（{stats["pages"]}页），'
+                      f'线上共{stats["total"]}条')
+            if args.reconcile or args.release_missing:
+                result = reconcile_processed(account, mirror, release=args.release_missing)
+                print(f'[{account.name}] 补充已处理目录{len(result["added"])}个，'
+                      f'镜像中找不到的已处理目录{len(result["missing"])}个，移出{result["released"]}个')
+                for directory in result['missing']:
+                    print(f'  {directory}')
+    finally:
+        shutdown_shared_pools()
+    return 0
+
+
+def cmd_gc(args, config: dict) -> int:
+    """同步永久素材清单并清理没有被引用的素材"""
+    from core.accounts import get_shared_session, shutdown_shared_pools
+    from core.material_inventory import get_material_inventory, collect_garbage
+
+    session = get_shared_session(config.get('http_pool_size', 10))
+    try:
+        for account in _select_accounts(config, args.account):
+            wechat = account.get_wechat(session=session)
+            inventory = get_material_inventory(account)
+            if args.sync_only:
+                for type, result in inventory.sync(wechat, rate=args.rate).items():
+                    print(f'[{account.name}] {type}: 线上{result["total"]}个，新增{result["new"]}个，'
+                          f'读取{result["pages"]}页，移除{result["removed"]}条过期记录')
+                continue
+
+            stats = collect_garbage(wechat, account, inventory, apply=args.apply,
+                                    min_age_days=args.min_age_days, rate=args.rate, limit=args.limit)
+            print(f'[{account.name}] 素材共{stats["total"]}个，被引用{stats["referenced"]}个，'
+                  f'可清理{stats["candidates"]}个')
+            if args.apply:
+                print(f'[{account.name}] 已回收{stats["deleted"]}个，失败{stats["failed"]}个')
+            else:
+                print('未指定--apply，没有删除任何素材')
+    finally:
+        shutdown_shared_pools()
+    return 0
+
+
+def probe_startup() -> Dict:
+    """在新的解释器中导入轻量命令的模块
+
+    Returns:
+        Dict: import_ms（导入耗时，毫秒）、heavy（被导入的重量级模块）、total_ms（整个进程的耗时，毫秒）
+    """
+    code = _PROBE.format(modules=LIGHT_MODULES, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], cwd=root_dir, capture_output=True, text=True,
+                            check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def bench_startup(runs: int = 5, budget_ms: float = STARTUP_BUDGET_MS) -> bool:
+    """测量轻量命令的冷启动时间
+
+    每次启动一个新的解释器导入status等命令用到的全部模块，按导入耗时的中位数检查预算，
+    并检查是否加载了requests、PIL或numpy。解释器本身的启动时间取决于机器，只作为参考输出。
+
+    Args:
+        runs: 启动次数
+        budget_ms: 导入时间预算（毫秒）
+
+    Returns:
+        bool: 是否在预算内且没有加载重量级模块
+    """
+    probes = [probe_startup() for _ in range(runs)]
+    imports = [p['import_ms'] for p in probes]
+    heavy = sorted({m for p in probes for m in p['heavy']})
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    interpreter_ms = (time.perf_counter() - start) * 1000
+
+    median = statistics.median(imports)
+    print(f'导入耗时: 中位数{median:.1f}ms，最快{min(imports):.1f}ms，最慢{max(imports):.1f}ms（预算{budget_ms:.0f}ms）；'
+          f'整个进程{statistics.median(p["total_ms"] for p in probes):.1f}ms，空解释器{interpreter_ms:.1f}ms')
+    ok = True
+    if heavy:
+        print(f'轻量命令加载了重量级模块: {", ".join(heavy)}')
+        ok = False
+    if median > budget_ms:
+        print('超出导入时间预算')
+        ok = False
+    return ok
+
+
+def cmd_bench(args, config: Optional[dict]) -> int:
+    return 0 if bench_startup(args.runs, args.budget_ms) else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='gzh', description='微信公众号自动发布系统')
+    # 日志参数放在各子命令中，scripts/下的包装脚本把参数追加在子命令之后
+    log_options = argparse.ArgumentParser(add_help=False)
+    log_options.add_argument('--log-file', help='日志文件，默认使用配置中的logging.file')
+    log_options.add_argument('--json-logs', action='store_true', help='日志文件使用JSON Lines格式')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    publish = subparsers.add_parser('publish', help='按配额为各账号发布文章', parents=[log_options])
+    publish.add_argument('--account', help='账号名称，默认为全部账号')
+    mode = publish.add_mutually_exclusive_group()
+    mode.add_argument('--daemon', action='store_true', help='常驻运行，每天定时发布')
+    mode.add_argument('--interactive', action='store_true', help='创建草稿后逐步确认发布方式')
+    publish.add_argument('--hour', type=int, default=8, help='常驻运行时每天的发布时间（整点）')
+    publish.set_defaults(handler=cmd_publish)
+
+    prepare = subparsers.add_parser('prepare', help='批量处理积压目录，生成暂存草稿', parents=[log_options])
+    prepare.add_argument('--account', help='账号名称，默认为全部账号')
+    prepare.add_argument('--workers', type=int, default=4, help='同时处理的目录数')
+    prepare.add_argument('--upload-budget', type=int, help='本次最多调用的上传接口次数')
+    prepare.add_argument('--draft-budget', type=int, help='本次最多创建的草稿数')
+    prepare.add_argument('--batch-size', type=int, default=8, help='每个草稿包含的文章数')
+    prepare.set_defaults(handler=cmd_prepare)
+
+    scan = subparsers.add_parser('scan', help='增量扫描图库索引', parents=[log_options])
+    scan.add_argument('--account', help='账号名称，默认为全部账号')
+    scan.add_argument('--dir', help='只扫描指定目录')
+    scan.add_argument('--workers', type=int, help='进程数，默认为CPU核数')
+    scan.set_defaults(handler=cmd_scan)
+
+    themed = subparsers.add_parser('themed', help='按颜色主题从图库快照中选出一组图片', parents=[log_options])
+    themed.add_argument('--account', help='账号名称，默认为全部账号')
+    themed.add_argument('--theme', help='主题: bright、dark、warm、cool、vivid、muted，默认只要求颜色相近')
+    themed.add_argument('--count', type=int, default=8, help='图片数量')
+    themed.add_argument('--include-published', action='store_true', help='也从已发布的图片中选择')
+    themed.set_defaults(handler=cmd_themed)
+
+    status = subparsers.add_parser('status', help='查看目录、配额、暂存草稿和镜像状态', parents=[log_options])
+    status.add_argument('--account', help='账号名称，默认为全部账号')
+    status.set_defaults(handler=cmd_status)
+
+    sync = subparsers.add_parser('sync', help='同步草稿箱和已发布文章镜像', parents=[log_options])
+    sync.add_argument('--account', help='账号名称，默认为全部账号')
+    sync.add_argument('--full', action='store_true', help='全量同步')
+    sync.add_argument('--rate', type=float, default=5.0, help='每秒最多调用的接口次数')
+    sync.add_argument('--reconcile', action='store_true', help='同步后用镜像校正已处理目录列表')
+    sync.add_argument('--release-missing', action='store_true',
+                      help='校正时把镜像中找不到的已处理目录移出列表，以后可以重新发布')
+    sync.set_defaults(handler=cmd_sync)
+
+    gc = subparsers.add_parser('gc', help='同步永久素材清单并清理没有被引用的素材', parents=[log_options])
+    gc.add_argument('--account', help='账号名称，默认为全部账号')
+    gc.add_argument('--apply', action='store_true', help='实际删除素材，默认只统计')
+    gc.add_argument('--sync-only', action='store_true', help='只同步素材清单')
+    gc.add_argument('--min-age-days', type=float, default=7, help='只删除更新时间早于这么多天的素材')
+    gc.add_argument('--rate', type=float, default=2.0, help='每秒最多调用的接口次数')
+    gc.add_argument('--limit', type=int, help='本次最多删除的素材数')
+    gc.set_defaults(handler=cmd_gc)
+
+    bench = subparsers.add_parser('bench', help='性能测试')
+    bench_sub = bench.add_subparsers(dest='bench', required=True)
+    startup = bench_sub.add_parser('startup', help='检查轻量命令的冷启动时间预算')
+    startup.add_argument('--runs', type=int, default=5, help='启动次数')
+    startup.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS,
+                         help='导入轻量命令模块的时间预算（毫秒，不含解释器启动）')
+    startup.set_defaults(handler=cmd_bench)
+    return parser
+
+
+def _default_log_file(args) -> Optional[str]:
+    """常驻发布默认写入logs/auto_publish.log，其它命令默认只输出到控制台"""
+    if args.command == 'publish' and args.daemon:
+        return os.path.join(root_dir, 'logs', 'auto_publish.log')
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == 'bench':
+        return args.handler(args, None)
+
+    from core.accounts import load_config
+    from core.log import setup_logging_from_config
+    from core.memory_governor import get_memory_governor
+
+    try:
+        config = load_config()
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+    # 命令行参数优先于配置文件中的logging段
+    overrides = {'json_lines': True} if args.json_logs else {}
+    if args.log_file:
+        overrides['log_file'] = args.log_file
+    setup_logging_from_config(config, log_file=_default_log_file(args), **overrides)
+    # 图片解码的内存预算，所有账号和线程共用
+    get_memory_governor(config.get('memory_budget_mb'))
+
+    try:
+        return args.handler(args, config)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        logger.error(str(e))
+        return 1
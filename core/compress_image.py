@@ -1,5 +1,14 @@
-from PIL import Image
+from PIL import Image, ImageOps
+import io
 import os
+import tempfile
+
+try:
+    # 安装pillow-heif后Pillow可以读取HEIC图片
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
 
 def compress_image(input_path: str, output_path: str, max_size_kb: int = 2048) -> str:
     """处理图片格式
@@ -23,6 +32,91 @@ def compress_image(input_path: str, output_path: str, max_size_kb: int = 2048) -
     
     return output_path
 
+def encode_article_image(input_path: str, max_width: int = 1920, quality: int = 85) -> bytes:
+    """将图片缩放并编码为图文消息内使用的JPEG数据
+
+    该函数位于模块顶层，可以提交到进程池中执行。
+
+    Args:
+        input_path: 输入图片路径
+        max_width: 最大宽度（像素），超出时按比例缩放
+        quality: JPEG质量
+
+    Returns:
+        bytes: 编码后的JPEG数据
+    """
+    with Image.open(input_path) as img:
+        # 计算新的分辨率（保持宽高比）
+        if img.width > max_width:
+            ratio = max_width / img.width
+            new_size = (max_width, int(img.height * ratio))
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+
+def needs_transcode(input_path: str, max_size_kb: int = 2048) -> bool:
+    """图片是否需要转码：非JPEG格式、带有旋转方向、非RGB模式或超过大小限制"""
+    if os.path.getsize(input_path) > max_size_kb * 1024:
+        return True
+    with Image.open(input_path) as img:
+        if img.format != 'JPEG' or img.mode not in ('RGB', 'L'):
+            return True
+        return img.getexif().get(0x0112, 1) != 1
+
+def transcode_to_jpeg(input_path: str, output_path: str, max_size_kb: int = 2048,
+                      quality: int = 90, min_quality: int = 60) -> int:
+    """把PNG/WebP/HEIC等格式转码为符合微信要求的JPEG
+
+    按EXIF方向旋转图片，透明背景填充为白色；超过大小限制时逐步降低质量，
+    质量降到min_quality仍超限时按比例缩小。先写入同目录的临时文件再替换，
+    中断时不会留下不完整的输出文件。该函数可以提交到进程池中执行。
+
+    Args:
+        input_path: 输入图片路径
+        output_path: 输出JPEG路径（可以与输入相同）
+        max_size_kb: 最大文件大小（KB）
+        quality: 初始JPEG质量
+        min_quality: 最低JPEG质量
+
+    Returns:
+        int: 输出文件大小（字节）
+    """
+    with Image.open(input_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        limit = max_size_kb * 1024
+        while True:
+            output = io.BytesIO()
+            img.save(output, format='JPEG', quality=quality, optimize=True)
+            if output.tell() <= limit:
+                break
+            if quality > min_quality:
+                quality = max(min_quality, quality - 10)
+            else:
+                img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.Resampling.LANCZOS)
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(output.getvalue())
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return output.tell()
+
 if __name__ == '__main__':
     try:
         input_file = '2.jpg'
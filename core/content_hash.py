@@ -0,0 +1,20 @@
+import hashlib
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """流式计算文件内容的SHA-256，不会把整个文件读入内存
+
+    Args:
+        path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,13 +1,21 @@
 import os
-import random
 from PIL import Image
-import numpy as np
-from typing import List, Tuple, Optional
+from typing import List, Optional
+
+from core.layout_planner import tight_window
+from core.memory_governor import decoded_footprint, BYTES_PER_PIXEL
+
+def merged_cover_footprint(image_paths: List[str], derivatives=None) -> int:
+    """估计拼接封面占用的内存（字节）：逐张处理，同时只解码一张原图，再加上缩放后的中间图和拼接结果"""
+    max_width = derivatives.decode_width if derivatives is not None else None
+    largest = max((decoded_footprint(p, max_width) for p in image_paths), default=0)
+    return largest + 900 * 900 * BYTES_PER_PIXEL
 
 def create_merged_cover(image_dir: str, output_path: str, num_images: int = 3, 
-                       aspect_ratio: float = 2.35, max_size_kb: int = 2048) -> str:
+                       aspect_ratio: float = 2.35, max_size_kb: int = 2048,
+                       image_paths: Optional[List[str]] = None, derivatives=None) -> str:
     """
-    从指定目录随机选择图片并拼接成一张公众号封面
+    从指定目录选择宽高比相近的图片并拼接成一张公众号封面
 
     Args:
         image_dir: 图片目录路径
@@ -15,20 +23,32 @@ def create_merged_cover(image_dir: str, output_path: str, num_images: int = 3,
         num_images: 要拼接的图片数量，默认为3
         aspect_ratio: 目标宽高比，默认为2.35:1（公众号封面比例）
         max_size_kb: 最大文件大小（KB），默认2MB
+        image_paths: 候选图片路径列表（例如已去重的图片），为None时使用目录中的所有图片
+        derivatives: 衍生图缓存，提供时从缓存中的cover_tile规格裁剪，不再解码原图
 
     Returns:
         str: 拼接后的图片路径
     """
-    # 获取目录中所有图片文件
-    image_files = [f for f in os.listdir(image_dir) 
-                  if os.path.isfile(os.path.join(image_dir, f)) and 
-                  f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    # 获取候选图片文件
+    if image_paths is not None:
+        image_files = list(image_paths)
+    else:
+        image_files = [os.path.join(image_dir, f) for f in os.listdir(image_dir)
+                      if os.path.isfile(os.path.join(image_dir, f)) and 
+                      f.lower().endswith(('.jpg', '.jpeg', '.png'))]
     
     if len(image_files) < num_images:
         raise ValueError(f"目录中只有{len(image_files)}张图片，无法选择{num_images}张进行拼接")
     
-    # 随机选择指定数量的图片
-    selected_images = random.sample(image_files, num_images)
+    # 选出宽高比最接近的一组图片，拼接后各部分的裁剪比例一致
+    if len(image_files) == num_images:
+        selected_images = image_files
+    else:
+        ratios = []
+        for f in image_files:
+            with Image.open(f) as img:
+                ratios.append(img.width / img.height)
+        selected_images = [image_files[i] for i in tight_window(ratios, num_images)]
     print(f"已选择图片: {selected_images}")
     
     # 计算目标尺寸
@@ -44,8 +64,9 @@ def create_merged_cover(image_dir: str, output_path: str, num_images: int = 3,
     
     # 处理并拼接每张图片
     for i, img_file in enumerate(selected_images):
-        img_path = os.path.join(image_dir, img_file)
-        with Image.open(img_path) as img:
+        if derivatives is not None:
+            img_file = derivatives.get(img_file, 'cover_tile')
+        with Image.open(img_file) as img:
             # 转换为RGB模式
             if img.mode != 'RGB':
                 img = img.convert('RGB')
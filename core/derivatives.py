@@ -0,0 +1,229 @@
+import io
+import os
+import logging
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from core.content_hash import hash_file
+
+logger = logging.getLogger(__name__)
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 衍生图规格：fit为width时限制宽度，short时把短边缩放到size（封面拼接需要从中裁剪），
+# long时限制最长边；都不会放大原图
+PROFILES = {
+    'article': {'fit': 'width', 'size': 1920, 'quality': 85},    # 正文单栏图片
+    'column': {'fit': 'width', 'size': 960, 'quality': 85},      # 正文两栏图片
+    'cover_tile': {'fit': 'short', 'size': 600, 'quality': 90},  # 拼接封面的单张图片
+    'thumb': {'fit': 'long', 'size': 360, 'quality': 85},        # 缩略图
+}
+
+# 缓存默认上限（MB），超过后按最近使用时间淘汰
+DEFAULT_MAX_MB = 2048
+
+# 淘汰时降到上限的这个比例以下，避免每次写入都触发淘汰
+EVICT_TARGET = 0.9
+
+# 同一进程内缓存源文件的哈希，文件大小和修改时间不变时不再重新计算
+_source_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def target_size(width: int, height: int, spec: Dict) -> Tuple[int, int]:
+    """按规格计算衍生图尺寸，原图小于规格时保持原尺寸"""
+    if spec['fit'] == 'width':
+        scale = spec['size'] / width
+    elif spec['fit'] == 'short':
+        scale = spec['size'] / min(width, height)
+    else:
+        scale = spec['size'] / max(width, height)
+    if scale >= 1:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def source_hash(path: str) -> str:
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    h = _source_hashes.get(key)
+    if h is None:
+        h = _source_hashes[key] = hash_file(path)
+    return h
+
+
+class DerivativeCache:
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+                 profiles: Optional[Dict[str, Dict]] = None):
+        """图片衍生图磁盘缓存
+
+        一张原图只解码一次，按从大到小的顺序逐级缩小，生成所有规格的衍生图（每一级都从上一级缩小，
+        而不是每次从原图缩小）。文件按原图内容的SHA-256和规格命名，原图移动或重命名后仍然命中；
+        总大小超过上限时删除最久没有使用的文件。实例可以传给进程池中的函数。
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+            profiles: 衍生图规格，默认为PROFILES
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.profiles = profiles or PROFILES
+        # 本进程估计的缓存大小，为None时在第一次写入后扫描目录
+        self._usage = None
+
+    @property
+    def decode_width(self) -> int:
+        """生成衍生图时原图最多需要解码到的宽度（用于估计内存占用）"""
+        return max(spec['size'] for spec in self.profiles.values())
+
+    def path_for(self, digest: str, profile: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f'{digest}_{profile}.jpg')
+
+    def lookup(self, path: str, profile: str) -> Optional[str]:
+        """缓存中的衍生图路径，没有时返回None；命中时更新文件时间用于淘汰"""
+        cached = self.path_for(source_hash(path), profile)
+        try:
+            os.utime(cached)
+        except FileNotFoundError:
+            return None
+        return cached
+
+    def missing(self, path: str) -> List[str]:
+        """缓存中还没有的规格"""
+        digest = source_hash(path)
+        return [p for p in self.profiles if not os.path.exists(self.path_for(digest, p))]
+
+    def generate(self, path: str, img: Optional['Image.Image'] = None) -> Dict[str, 'Image.Image']:
+        """解码一次原图，生成缓存中缺少的规格
+
+        Args:
+            path: 原图路径
+            img: 已经打开的原图，为None时在这里打开
+
+        Returns:
+            Dict[str, Image.Image]: 本次生成的各级衍生图（全部命中缓存时为空）
+        """
+        missing = self.missing(path)
+        if not missing:
+            return {}
+        if img is None:
+            from PIL import Image
+
+            with Image.open(path) as opened:
+                return self._build(path, opened, missing)
+        return self._build(path, img, missing)
+
+    def _build(self, path: str, img: 'Image.Image', missing: List[str]) -> Dict[str, 'Image.Image']:
+        from PIL import Image
+
+        width, height = img.size
+        sizes = {p: target_size(width, height, self.profiles[p]) for p in missing}
+        # JPEG可以直接按需要的最大尺寸缩小解码
+        largest = max(sizes.values())
+        img.draft('RGB', largest)
+        current = img.convert('RGB') if img.mode != 'RGB' else img.copy()
+
+        digest = source_hash(path)
+        levels = {}
+        for profile in sorted(missing, key=lambda p: sizes[p][0] * sizes[p][1], reverse=True):
+            if current.size != sizes[profile]:
+                current = current.resize(sizes[profile], Image.Resampling.LANCZOS)
+            self._store(self.path_for(digest, profile), current, self.profiles[profile]['quality'])
+            levels[profile] = current
+        return levels
+
+    def _store(self, cached: str, img: 'Image.Image', quality: int):
+        """先写临时文件再替换，其它进程不会读到不完整的文件"""
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(output.getvalue())
+            os.replace(tmp_path, cached)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if self._usage is None:
+            self._usage = self.disk_usage()
+        else:
+            self._usage += output.tell()
+        if self._usage > self.max_bytes:
+            self.evict()
+
+    def get(self, path: str, profile: str) -> str:
+        """某个规格的衍生图路径，缓存中没有时解码原图生成所有缺少的规格"""
+        cached = self.lookup(path, profile)
+        if cached is None:
+            self.generate(path)
+            cached = self.path_for(source_hash(path), profile)
+        return cached
+
+    def read(self, path: str, profile: str) -> bytes:
+        with open(self.get(path, profile), 'rb') as f:
+            return f.read()
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.jpg'):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """删除最久没有使用的衍生图，直到总大小低于上限的90%
+
+        Returns:
+            int: 删除的文件数
+        """
+        entries = sorted(self._entries())
+        usage = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET
+        removed = 0
+        for _, size, path in entries:
+            if usage <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # 其它进程已经删除
+                pass
+            usage -= size
+            removed += 1
+        self._usage = usage
+        if removed:
+            logger.info(f'衍生图缓存超过上限，删除了{removed}个文件')
+        return removed
+
+
+def read_derivative(cache: DerivativeCache, path: str, profile: str) -> bytes:
+    """读取衍生图数据，位于模块顶层，可以提交到进程池中执行"""
+    return cache.read(path, profile)
+
+
+def get_derivative_cache(settings: Dict) -> Optional[DerivativeCache]:
+    """按配置中的derivative_cache创建衍生图缓存，配置为false时返回None
+
+    derivative_cache可以包含dir（默认为data/derivatives，多个账号共用）和max_mb。
+    """
+    options = settings.get('derivative_cache', {})
+    if options is False:
+        return None
+    options = options or {}
+    return DerivativeCache(options.get('dir') or os.path.join(root_dir, 'data', 'derivatives'),
+                           int(options.get('max_mb', DEFAULT_MAX_MB)) * 1024 * 1024)
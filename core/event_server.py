@@ -0,0 +1,309 @@
+import hmac
+import time
+import hashlib
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# 发布和群发完成事件的类型
+PUBLISH_JOB_FINISH = 'PUBLISHJOBFINISH'
+MASS_SEND_JOB_FINISH = 'MASSSENDJOBFINISH'
+
+
+def publish_key(publish_id, appid: str) -> str:
+    # publish_id和msg_id只在同一个公众号内唯一，事件键按appid区分
+    return f'publish:{appid}:{publish_id}'
+
+
+def mass_key(msg_id, appid: str) -> str:
+    return f'mass:{appid}:{msg_id}'
+
+
+def check_signature(token: str, signature: str, timestamp: str, nonce: str) -> bool:
+    """校验微信服务器推送的签名
+
+    Args:
+        token: 公众号后台配置的Token
+        signature: 请求参数中的signature
+        timestamp: 请求参数中的timestamp
+        nonce: 请求参数中的nonce
+
+    Returns:
+        bool: 签名是否有效
+    """
+    if not (signature and timestamp and nonce):
+        return False
+    raw = ''.join(sorted([token, timestamp, nonce]))
+    expected = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return hmac.compare_digest(expected.encode('ascii'), signature.encode('utf-8'))
+
+
+def _element_to_dict(element: ET.Element):
+    """把XML节点转换为字典，重复出现的子节点合并为列表"""
+    children = list(element)
+    if not children:
+        return (element.text or '').strip()
+    result: Dict = {}
+    for child in children:
+        value = _element_to_dict(child)
+        if child.tag in result:
+            if not isinstance(result[child.tag], list):
+                result[child.tag] = [result[child.tag]]
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = value
+    return result
+
+
+def parse_event(body: bytes) -> Dict:
+    """解析推送的XML消息
+
+    Args:
+        body: 请求体
+
+    Returns:
+        Dict: 消息字段
+    """
+    return _element_to_dict(ET.fromstring(body))
+
+
+def publish_event_to_status(event: Dict) -> Dict:
+    """把PUBLISHJOBFINISH事件转换为与freepublish/get接口相同结构的发布状态"""
+    info = event.get('PublishEventInfo', {})
+    status = {
+        'publish_id': info.get('publish_id'),
+        'publish_status': int(info.get('publish_status', -1)),
+        'article_id': info.get('article_id'),
+        'from_event': True,
+    }
+    detail = info.get('article_detail')
+    if isinstance(detail, dict):
+        items = detail.get('item', [])
+        if isinstance(items, dict):
+            items = [items]
+        status['article_detail'] = {'count': int(detail.get('count', len(items))), 'item': items}
+    return status
+
+
+def mass_event_to_status(event: Dict) -> Dict:
+    """把MASSSENDJOBFINISH事件转换为与message/mass/get接口相同结构的群发状态"""
+    return {
+        'msg_id': event.get('MsgID'),
+        'msg_status': 'SEND_SUCCESS' if event.get('Status') == 'send success' else 'SEND_FAIL',
+        'status': event.get('Status'),
+        'total_count': event.get('TotalCount'),
+        'sent_count': event.get('SentCount'),
+        'error_count': event.get('ErrorCount'),
+        'from_event': True,
+    }
+
+
+class EventHub:
+    def __init__(self, retain_seconds: float = 3600):
+        """推送事件与等待者之间的中转
+
+        等待者通过expect获取Future，事件到达时由resolve完成对应的Future。
+        事件先于等待者到达时会暂存一段时间，之后注册的等待者立即得到结果。
+
+        Args:
+            retain_seconds: 未被认领的事件保留时长（秒）
+        """
+        self.retain_seconds = retain_seconds
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self._arrived: Dict[str, tuple] = {}
+
+    def expect(self, key: str) -> Future:
+        """注册等待某个事件"""
+        with self._lock:
+            self._purge()
+            future = self._futures.get(key)
+            if future is None:
+                future = Future()
+                self._futures[key] = future
+            if key in self._arrived:
+                future.set_result(self._arrived.pop(key)[1])
+            return future
+
+    def resolve(self, key: str, status: Dict):
+        """事件到达，完成对应的等待"""
+        with self._lock:
+            future = self._futures.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(status)
+            else:
+                # 没有等待者的事件（例如其它进程发起的任务）在到达时按保留时长清理，不会无限累积
+                self._purge()
+                self._arrived[key] = (time.time(), status)
+
+    def discard(self, key: str):
+        """不再等待某个事件"""
+        with self._lock:
+            self._futures.pop(key, None)
+
+    def _purge(self):
+        expired = time.time() - self.retain_seconds
+        for key in [k for k, (t, _) in self._arrived.items() if t < expired]:
+            del self._arrived[key]
+
+
+class WeChatCallbackServer:
+    def __init__(self, tokens: Dict[str, str], hub: EventHub, host: str = '0.0.0.0', port: int = 8080,
+                 path: str = '/wechat/callback'):
+        """接收微信服务器推送事件的轻量HTTP服务
+
+        只支持明文模式；GET请求用于服务器地址验证，POST请求携带事件XML。
+        每个公众号使用自己的回调地址<path>/<appid>和Token；只有一个公众号时也可以直接使用<path>。
+
+        Args:
+            tokens: appid到公众号后台配置的Token的映射
+            hub: 事件中转
+            host: 监听地址
+            port: 监听端口
+            path: 回调路径
+        """
+        self.tokens = tokens
+        self.hub = hub
+        self.path = path
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _verify(self):
+                """校验路径和签名，返回请求参数和对应的appid，校验失败时返回(None, None)"""
+                url = urlparse(self.path)
+                appid = server.appid_for(url.path)
+                if appid is None:
+                    self._reply(404, b'')
+                    return None, None
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if not check_signature(server.tokens[appid], query.get('signature', ''),
+                                       query.get('timestamp', ''), query.get('nonce', '')):
+                    logger.warning(f'回调签名校验失败: {self.client_address[0]} ({appid})')
+                    self._reply(403, b'')
+                    return None, None
+                return query, appid
+
+            def _reply(self, code: int, body: bytes):
+                self.send_response(code)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                query, _ = self._verify()
+                if query is not None:
+                    self._reply(200, query.get('echostr', '').encode('utf-8'))
+
+            def do_POST(self):
+                query, appid = self._verify()
+                if query is None:
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    server.handle_event(parse_event(self.rfile.read(length)), appid)
+                except ET.ParseError as e:
+                    logger.error(f'回调消息解析失败: {str(e)}')
+                # 微信要求5秒内回复，回复success表示不需要被动回复消息
+                self._reply(200, b'success')
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def appid_for(self, path: str) -> Optional[str]:
+        """根据请求路径找到对应的公众号，路径不属于任何公众号时返回None"""
+        if path == self.path and len(self.tokens) == 1:
+            return next(iter(self.tokens))
+        prefix, _, appid = path.rpartition('/')
+        if prefix == self.path.rstrip('/') and appid in self.tokens:
+            return appid
+        return None
+
+    def handle_event(self, event: Dict, appid: str):
+        """处理一条推送消息
+
+        Args:
+            event: 消息字段
+            appid: 推送消息的公众号
+        """
+        if event.get('MsgType') != 'event':
+            return
+        name = event.get('Event')
+        if name == PUBLISH_JOB_FINISH:
+            status = publish_event_to_status(event)
+            logger.info(f'收到发布完成事件: appid={appid}, publish_id={status["publish_id"]}, '
+                        f'status={status["publish_status"]}')
+            self.hub.resolve(publish_key(status['publish_id'], appid), status)
+        elif name == MASS_SEND_JOB_FINISH:
+            status = mass_event_to_status(event)
+            logger.info(f'收到群发完成事件: appid={appid}, msg_id={status["msg_id"]}, status={status["status"]}')
+            self.hub.resolve(mass_key(status['msg_id'], appid), status)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f'回调服务已启动，端口: {self.port}，路径: {self.path}')
+
+    def stop(self):
+        """停止服务"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# 进程内正在运行的回调服务使用的事件中转
+_running_hub: Optional[EventHub] = None
+
+
+def start_callback_server(config: Dict, accounts: List) -> Optional[WeChatCallbackServer]:
+    """根据配置中的callback段启动回调服务
+
+    所有账号共用一个服务，监听地址取顶层的callback段；每个账号的Token取账号配置中的callback.token，
+    没有配置时使用顶层的callback.token。
+
+    Args:
+        config: 配置信息字典，callback段包含token、host、port、path
+        accounts: 接收推送事件的账号
+
+    Returns:
+        Optional[WeChatCallbackServer]: 没有账号配置Token时返回None
+    """
+    global _running_hub
+    callback = config.get('callback') or {}
+    tokens = {}
+    for account in accounts:
+        token = (account.settings.get('callback') or {}).get('token')
+        if token:
+            tokens[account.appid] = token
+    if not tokens:
+        return None
+    hub = EventHub()
+    server = WeChatCallbackServer(tokens, hub, host=callback.get('host', '0.0.0.0'),
+                                  port=callback.get('port', 8080), path=callback.get('path', '/wechat/callback'))
+    server.start()
+    _running_hub = hub
+    return server
+
+
+def get_running_hub() -> Optional[EventHub]:
+    """获取当前进程中回调服务的事件中转，没有启动回调服务时返回None"""
+    return _running_hub
@@ -0,0 +1,383 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import threading
+from typing import List, Dict, Optional, Set
+
+from core.library_index import get_library_index, scan_directory
+
+logger = logging.getLogger(__name__)
+
+# inotify事件掩码（linux/inotify.h）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# 写入完成、移入移出、删除和新建目录都会让所在目录需要重新扫描；只打开或只修改未关闭的文件不处理
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+              | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+# 默认参数，可以在配置的watch段中覆盖
+DEFAULT_WATCH_OPTIONS = {
+    'debounce': 5.0,             # 目录最后一次变化后等待的秒数，爬虫连续写入时合并为一次扫描
+    'max_delay': 60.0,           # 目录持续变化时最多推迟的秒数
+    'reconcile_interval': 3600,  # 完整核对一次图库的间隔（秒），也是没有inotify时唯一的更新方式
+    'catalog_interval': 600,     # 有更新时重建图库快照的最短间隔（秒）
+}
+
+
+class Inotify:
+    def __init__(self):
+        """通过ctypes调用libc的inotify接口，不依赖第三方库"""
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._ctypes = ctypes
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f'inotify_init1失败: {os.strerror(err)}')
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = self._ctypes.get_errno()
+            raise OSError(err, f'监听目录失败 {path}: {os.strerror(err)}')
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float) -> list:
+        """等待最多timeout秒，返回(wd, mask, name)列表"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def inotify_available() -> bool:
+    return sys.platform.startswith('linux')
+
+
+class LibraryWatcher:
+    def __init__(self, index, base_dir: str, pool=None, derivatives=None, debounce: float = 5.0,
+                 max_delay: float = 60.0, reconcile_interval: float = 3600, catalog_interval: float = 600,
+                 name: str = ''):
+        """在后台线程中监听图库目录，增量更新图库索引
+
+        使用inotify递归监听图库目录：目录中的文件写入完成、移入、删除后，等待debounce秒没有新的变化
+        （或者距第一次变化已经max_delay秒）再扫描该目录，计算新图片的尺寸、哈希和质量评分，
+        并更新作品元数据。启动时和每隔reconcile_interval秒完整核对一次图库，弥补事件队列溢出、
+        监听数量达到上限等情况；没有inotify时只按间隔核对。
+
+        inotify正常工作时，已经扫描过且之后没有变化的目录视为最新，发布时直接读取索引中的记录，
+        选择目录时也使用这里维护的目录列表，不再遍历图库。
+
+        Args:
+            index: 图库索引
+            base_dir: 图库根目录
+            pool: 扫描使用的进程池
+            derivatives: 衍生图缓存
+            debounce: 目录最后一次变化后等待的秒数
+            max_delay: 目录持续变化时最多推迟的秒数
+            reconcile_interval: 完整核对的间隔（秒）
+            catalog_interval: 有更新时重建图库快照的最短间隔（秒）
+            name: 日志中的名称
+        """
+        self.index = index
+        # 保持与发布流程遍历图库时相同的路径形式
+        self.base_dir = base_dir
+        self._prefix = os.path.join(base_dir, '')
+        self.pool = pool
+        self.derivatives = derivatives
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.reconcile_interval = reconcile_interval
+        self.catalog_interval = catalog_interval
+        self.name = name or os.path.basename(self.base_dir)
+
+        self._inotify: Optional[Inotify] = None
+        self._watches: Dict[int, str] = {}
+        self._watched: Dict[str, int] = {}
+        # 等待扫描的目录: (第一次变化时间, 最后一次变化时间)
+        self._pending: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._dirs: Set[str] = set()
+        self._clean: Set[str] = set()
+        # inotify覆盖了全部目录，并且完成了第一次核对
+        self._live = False
+        self._next_reconcile = 0.0
+        self._catalog_dirty = False
+        self._catalog_built = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'events': 0, 'scans': 0, 'reconciles': 0, 'overflows': 0}
+
+    # ---- 发布流程使用的查询 ----
+
+    def is_current(self, directory: str) -> bool:
+        """目录在索引中的记录是否是最新的（扫描后没有发生过变化）"""
+        with self._lock:
+            return self._live and directory in self._clean
+
+    def directories(self) -> Optional[List[str]]:
+        """图库中的所有子目录，监听没有覆盖全部目录时返回None（调用方自己遍历）"""
+        with self._lock:
+            return sorted(self._dirs) if self._live else None
+
+    # ---- 监听 ----
+
+    def _watch_tree(self, root: str):
+        """监听root及其所有子目录，并记录目录列表"""
+        for current, subdirs, _ in os.walk(root):
+            if current != self.base_dir and current != self._prefix:
+                with self._lock:
+                    self._dirs.add(current)
+            if self._inotify is None or current in self._watched:
+                continue
+            try:
+                wd = self._inotify.add_watch(current)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    logger.warning(f'[{self.name}] inotify监听数量达到上限（fs.inotify.max_user_watches），'
+                                   f'改为只按间隔核对')
+                    self._degrade()
+                    return
+                logger.debug(f'[{self.name}] {str(e)}')
+                continue
+            self._watches[wd] = current
+            self._watched[current] = wd
+
+    def _degrade(self):
+        with self._lock:
+            self._live = False
+            self._clean.clear()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._watches.clear()
+        self._watched.clear()
+
+    def _mark_dirty(self, directory: str):
+        """目录及其上级目录（扫描上级目录时会递归包含它）都需要重新扫描"""
+        now = time.monotonic()
+        with self._lock:
+            while directory.startswith(self._prefix):
+                first = self._pending.get(directory, (now, now))[0]
+                self._pending[directory] = (first, now)
+                self._clean.discard(directory)
+                directory = os.path.dirname(directory)
+
+    def _handle(self, events: list):
+        for wd, mask, name in events:
+            self.stats['events'] += 1
+            if mask & IN_Q_OVERFLOW:
+                # 事件丢失，只能通过完整核对找回
+                self.stats['overflows'] += 1
+                logger.warning(f'[{self.name}] inotify事件队列溢出，安排完整核对')
+                with self._lock:
+                    self._live = False
+                    self._clean.clear()
+                self._next_reconcile = 0.0
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                # 目录被删除或移走，监听已经失效
+                self._watches.pop(wd, None)
+                self._watched.pop(directory, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                with self._lock:
+                    for d in [d for d in self._dirs if d == directory or d.startswith(directory + os.sep)]:
+                        self._dirs.discard(d)
+                self._mark_dirty(directory)
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新目录中可能在添加监听之前已经写入了文件，整棵子树都安排扫描
+                    self._watch_tree(path)
+                    for current, _, _ in os.walk(path):
+                        self._mark_dirty(current)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    with self._lock:
+                        for d in [d for d in self._dirs if d == path or d.startswith(path + os.sep)]:
+                            self._dirs.discard(d)
+                    self._mark_dirty(path)
+                continue
+            self._mark_dirty(directory)
+
+    # ---- 扫描 ----
+
+    def _scan(self, directory: str):
+        from core.sidecar import get_directory_metadata
+
+        try:
+            scan_directory(self.index, directory, self.pool, self.derivatives)
+            if os.path.isdir(directory):
+                get_directory_metadata(self.index, directory)
+        except Exception as e:
+            logger.error(f'[{self.name}] 扫描目录失败 {directory}: {str(e)}')
+            return False
+        self.stats['scans'] += 1
+        self._catalog_dirty = True
+        return True
+
+    def _process_pending(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [d for d, (first, last) in self._pending.items()
+                   if now - last >= self.debounce or now - first >= self.max_delay]
+            for d in due:
+                del self._pending[d]
+        # 先扫描子目录再扫描上级目录，上级目录扫描时索引中的记录已经是最新的
+        for directory in sorted(due, key=len, reverse=True):
+            if self._stop.is_set():
+                return
+            if self._scan(directory):
+                with self._lock:
+                    if directory not in self._pending and os.path.isdir(directory):
+                        self._clean.add(directory)
+        if due:
+            logger.info(f'[{self.name}] 已更新{len(due)}个目录的索引')
+
+    def reconcile(self):
+        """完整核对：重新监听并扫描所有目录，删除索引中已经不存在的目录"""
+        start = time.monotonic()
+        with self._lock:
+            self._dirs.clear()
+        self._watch_tree(self.base_dir)
+        with self._lock:
+            directories = sorted(self._dirs, key=len, reverse=True)
+            # 核对开始后发生变化的目录留给事件处理
+            self._pending.clear()
+        scanned = set()
+        for directory in directories:
+            if self._stop.is_set():
+                return
+            if self._scan(directory):
+                scanned.add(directory)
+        for directory in set(self.index.directories()) - set(directories):
+            if not os.path.isdir(directory):
+                self._scan(directory)
+        with self._lock:
+            self._clean = {d for d in scanned if d not in self._pending}
+            self._live = self._inotify is not None
+        self.stats['reconciles'] += 1
+        self._next_reconcile = time.monotonic() + self.reconcile_interval
+        self._rebuild_catalog(force=True)
+        logger.info(f'[{self.name}] 图库核对完成: {len(scanned)}个目录，用时{time.monotonic() - start:.1f}秒'
+                    f'{"" if self._live else "（没有inotify，只按间隔核对）"}')
+
+    def _rebuild_catalog(self, force: bool = False):
+        if not self._catalog_dirty:
+            return
+        if not force and time.monotonic() - self._catalog_built < self.catalog_interval:
+            return
+        try:
+            self.index.build_catalog()
+        except Exception as e:
+            logger.error(f'[{self.name}] 重建图库快照失败: {str(e)}')
+            return
+        self._catalog_dirty = False
+        self._catalog_built = time.monotonic()
+
+    # ---- 线程 ----
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.monotonic() >= self._next_reconcile:
+                self.reconcile()
+                continue
+            with self._lock:
+                deadlines = [min(last + self.debounce, first + self.max_delay)
+                             for first, last in self._pending.values()]
+            timeout = min(deadlines + [self._next_reconcile]) - time.monotonic()
+            timeout = min(max(timeout, 0.05), 1.0)
+            if self._inotify is not None:
+                try:
+                    self._handle(self._inotify.read(timeout))
+                except OSError as e:
+                    logger.error(f'[{self.name}] 读取inotify事件失败: {str(e)}')
+                    self._degrade()
+            else:
+                self._stop.wait(timeout)
+            self._process_pending()
+            self._rebuild_catalog()
+
+    def start(self) -> 'LibraryWatcher':
+        if inotify_available():
+            try:
+                self._inotify = Inotify()
+            except Exception as e:
+                logger.warning(f'[{self.name}] 无法使用inotify，只按间隔核对: {str(e)}')
+        self.index.watcher = self
+        self._thread = threading.Thread(target=self._run, name=f'watch-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.index.watcher is self:
+            self.index.watcher = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+
+def start_library_watchers(accounts, pool=None) -> List[LibraryWatcher]:
+    """为各账号启动图库监听，配置watch为false的账号跳过
+
+    watch段可以包含debounce、max_delay、reconcile_interval、catalog_interval。
+    """
+    from core.derivatives import get_derivative_cache
+
+    watchers = []
+    for account in accounts:
+        options = account.settings.get('watch', {})
+        if options is False:
+            continue
+        options = {**DEFAULT_WATCH_OPTIONS, **(options or {})}
+        index = get_library_index(account)
+        if getattr(index, 'watcher', None) is not None:
+            continue
+        watchers.append(LibraryWatcher(index, account.image_base_dir, pool, get_derivative_cache(account.settings),
+                                       name=account.name, **options).start())
+    return watchers
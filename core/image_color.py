@@ -0,0 +1,233 @@
+import json
+import numpy as np
+from typing import List, Dict, Optional
+
+# 计算颜色特征使用的缩略图最长边
+COLOR_SIZE = 64
+
+# 主色数量（k-means的k）
+DOMINANT_COLORS = 3
+
+# k-means迭代次数，64×64的缩略图几次迭代就已收敛
+KMEANS_ITERATIONS = 8
+
+# 亮度分位数
+LUMA_PERCENTILES = (10, 50, 90)
+
+# 一个目录或整个图库中参与相似度计算的最多图片数（两两距离矩阵的边长）
+MAX_SIMILARITY_POOL = 2048
+
+# 计算每组距离时一次处理的候选行数
+_COST_CHUNK = 256
+
+# 图库索引中保存的颜色特征字段
+COLOR_FIELDS = ('hue', 'saturation', 'value', 'luma_p10', 'luma_p50', 'luma_p90')
+
+
+def rgb_to_hsv(rgb: np.ndarray) -> np.ndarray:
+    """向量化把RGB（0-1）转换为HSV，H为0-360度，S、V为0-1"""
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    delta = maxc - minc
+    safe = np.where(delta > 0, delta, 1)
+    hue = np.select([maxc == r, maxc == g], [(g - b) / safe % 6, (b - r) / safe + 2], (r - g) / safe + 4) * 60
+    hue = np.where(delta > 0, hue, 0)
+    saturation = np.where(maxc > 0, delta / np.where(maxc > 0, maxc, 1), 0)
+    return np.stack([hue, saturation, maxc], axis=-1)
+
+
+def kmeans(pixels: np.ndarray, k: int = DOMINANT_COLORS, iterations: int = KMEANS_ITERATIONS):
+    """对像素做k-means聚类，结果是确定的（按亮度分位数选择初始中心）
+
+    Args:
+        pixels: (n, 3)浮点数组
+        k: 聚类数
+        iterations: 迭代次数
+
+    Returns:
+        tuple: (中心 (k, 3), 每类像素所占比例 (k,))，按比例从大到小排列
+    """
+    k = min(k, len(pixels))
+    order = np.argsort(pixels.sum(axis=1), kind='stable')
+    centers = pixels[order[((np.arange(k) + 0.5) / k * len(pixels)).astype(int)]].copy()
+    for _ in range(iterations):
+        distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(moved, centers):
+            break
+        centers = moved
+    weights = counts / counts.sum()
+    ranked = np.argsort(-weights, kind='stable')
+    return centers[ranked], weights[ranked]
+
+
+def color_features(img: 'Image.Image', size: int = COLOR_SIZE) -> Dict:
+    """在缩略图上计算颜色特征
+
+    Args:
+        img: 已解码的图片（通常是分析用的缩小图）
+        size: 缩略图最长边
+
+    Returns:
+        Dict: hue（饱和度加权的平均色相，度）、saturation、value（平均HSV）、luma_p10/p50/p90（亮度分位数，
+            0-255）、dominant（主色列表，每项为[r, g, b, 比例]）
+    """
+    from PIL import Image
+
+    small = img.convert('RGB')
+    small.thumbnail((size, size), Image.Resampling.BILINEAR)
+    rgb = np.asarray(small, dtype=np.float32).reshape(-1, 3)
+
+    hsv = rgb_to_hsv(rgb / 255)
+    # 色相是角度，按饱和度加权做圆周平均，灰色像素不影响结果
+    angle = np.radians(hsv[:, 0])
+    x = float((hsv[:, 1] * np.cos(angle)).mean())
+    y = float((hsv[:, 1] * np.sin(angle)).mean())
+    luma = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    centers, weights = kmeans(rgb)
+    result = {
+        'hue': float(np.degrees(np.arctan2(y, x)) % 360),
+        'saturation': float(hsv[:, 1].mean()),
+        'value': float(hsv[:, 2].mean()),
+        'dominant': [[round(float(c), 1) for c in center] + [round(float(w), 4)]
+                     for center, w in zip(centers, weights)],
+    }
+    for p, v in zip(LUMA_PERCENTILES, np.percentile(luma, LUMA_PERCENTILES)):
+        result[f'luma_p{p}'] = float(v)
+    return result
+
+
+def parse_dominant(value) -> Optional[list]:
+    """索引中以JSON保存的主色"""
+    if value is None or isinstance(value, list):
+        return value
+    return json.loads(value)
+
+
+def feature_columns(records: List[Dict]) -> Dict[str, np.ndarray]:
+    """把索引记录转换为颜色特征列，缺少特征的记录为NaN"""
+    columns = {name: np.array([np.nan if r.get(name) is None else r[name] for r in records], dtype=np.float64)
+               for name in COLOR_FIELDS}
+    dominant = np.full((len(records), DOMINANT_COLORS, 4), np.nan)
+    for i, record in enumerate(records):
+        colors = parse_dominant(record.get('dominant'))
+        if colors:
+            dominant[i, :len(colors)] = colors[:DOMINANT_COLORS]
+    columns['dominant'] = dominant
+    return columns
+
+
+def feature_matrix(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """相似度计算使用的特征向量，各维度都在0-1附近
+
+    平均色相和饱和度合成一个二维向量（饱和度越低越靠近原点，色相的环形不会造成0度和360度相距很远），
+    加上平均明度、三个亮度分位数和占比最大的主色。
+    """
+    angle = np.radians(columns['hue'])
+    saturation = columns['saturation']
+    top = np.asarray(columns['dominant'], dtype=np.float64)[:, 0, :3] / 255
+    return np.column_stack([
+        saturation * np.cos(angle), saturation * np.sin(angle), columns['value'],
+        columns['luma_p10'] / 255, columns['luma_p50'] / 255, columns['luma_p90'] / 255,
+        top,
+    ])
+
+
+def _hue_alignment(columns, center: float) -> np.ndarray:
+    return columns['saturation'] * np.cos(np.radians(columns['hue'] - center))
+
+
+# 主题评分：分数越高越符合主题
+THEMES = {
+    'bright': lambda c: c['luma_p50'] / 255 + 0.5 * c['luma_p10'] / 255,
+    'dark': lambda c: 1 - c['luma_p50'] / 255 + 0.5 * (1 - c['luma_p90'] / 255),
+    'warm': lambda c: _hue_alignment(c, 30),
+    'cool': lambda c: _hue_alignment(c, 210),
+    'vivid': lambda c: c['saturation'],
+    'muted': lambda c: 1 - c['saturation'],
+}
+
+
+def theme_scores(columns: Dict[str, np.ndarray], theme: str) -> np.ndarray:
+    if theme not in THEMES:
+        raise Exception(f'未知的主题: {theme}，可选: {", ".join(THEMES)}')
+    return np.asarray(THEMES[theme](columns), dtype=np.float64)
+
+
+def select_coherent(features: np.ndarray, count: int, scores: Optional[np.ndarray] = None,
+                    pool_factor: int = 3) -> np.ndarray:
+    """向量化选出特征最接近的一组图片
+
+    有主题评分时只在评分最高的count*pool_factor张中选择；否则在最接近整体中位特征的图片中选择。
+    候选两两计算距离，每张候选和与它最近的count-1张组成一组，取组内平均距离最小的一组；有主题评分时
+    减去组内平均评分，彼此相近而更符合主题的一组优先。缺少特征的图片不参与选择。
+
+    Args:
+        features: (n, d)特征矩阵
+        count: 需要的图片数量
+        scores: 主题评分
+        pool_factor: 候选数量相对count的倍数
+
+    Returns:
+        np.ndarray: 选中图片的下标，按与中心的距离排列
+    """
+    valid = np.flatnonzero(~np.isnan(features).any(axis=1))
+    if scores is not None:
+        valid = valid[~np.isnan(scores[valid])]
+    if count <= 0 or valid.size == 0:
+        return np.empty(0, dtype=np.int64)
+    count = min(count, valid.size)
+
+    pool_size = min(valid.size, MAX_SIMILARITY_POOL)
+    if scores is not None:
+        pool_size = min(pool_size, max(count * pool_factor, count))
+        pool = valid[np.argsort(-scores[valid], kind='stable')[:pool_size]]
+    else:
+        median = np.median(features[valid], axis=0)
+        distance = np.linalg.norm(features[valid] - median, axis=1)
+        pool = valid[np.argsort(distance, kind='stable')[:pool_size]]
+
+    # 用|a|²+|b|²-2a·b原地计算两两距离，只分配一个(n, n)的float32矩阵（2048张约16MB），
+    # 不展开(n, n, d)的差值数组
+    points = features[pool].astype(np.float32)
+    sq = (points * points).sum(axis=1)
+    distances = points @ points.T
+    distances *= -2
+    distances += sq[:, None]
+    distances += sq[None, :]
+    np.maximum(distances, 0, out=distances)
+    np.sqrt(distances, out=distances)
+
+    # 每行是以该候选为中心的一组（包含自己）；分块计算，argpartition的下标数组不超过一块的大小
+    cost = np.empty(len(pool))
+    pool_scores = scores[pool] if scores is not None else None
+    for start in range(0, len(pool), _COST_CHUNK):
+        block = distances[start:start + _COST_CHUNK]
+        groups = np.argpartition(block, count - 1, axis=1)[:, :count]
+        cost[start:start + len(block)] = np.take_along_axis(block, groups, axis=1).mean(axis=1)
+        if pool_scores is not None:
+            cost[start:start + len(block)] -= pool_scores[groups].mean(axis=1)
+    center = int(np.argmin(cost))
+    chosen = np.argsort(distances[center], kind='stable')[:count]
+    return pool[chosen]
+
+
+def select_similar(records: List[Dict], count: int, theme: Optional[str] = None) -> Optional[np.ndarray]:
+    """从索引记录中选出颜色特征最接近（且最符合主题）的count张图片
+
+    Returns:
+        Optional[np.ndarray]: 选中记录的下标；所有记录都没有颜色特征时返回None，调用方按原来的方式选择
+    """
+    if not records:
+        return None
+    columns = feature_columns(records)
+    features = feature_matrix(columns)
+    if np.isnan(features).any(axis=1).all():
+        return None
+    scores = theme_scores(columns, theme) if theme else None
+    return select_coherent(features, count, scores)
@@ -0,0 +1,156 @@
+from PIL import Image
+import numpy as np
+from typing import List, Tuple, Optional, Any, Dict
+
+# 64位整数中置位的个数查表，numpy没有bitwise_count时使用
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image_path: str, hash_size: int = 8) -> int:
+    """计算图片的差值感知哈希（dHash）
+
+    把图片缩小为(hash_size+1)×hash_size的灰度图，比较每行相邻像素的亮度，
+    得到hash_size*hash_size位的哈希。相似图片的哈希汉明距离很小。
+
+    Args:
+        image_path: 图片路径
+        hash_size: 哈希边长，默认8（64位哈希）
+
+    Returns:
+        int: 无符号哈希值
+    """
+    with Image.open(image_path) as img:
+        return dhash_image(img, hash_size)
+
+
+def dhash_image(img: Image.Image, hash_size: int = 8) -> int:
+    """计算已打开图片的dHash"""
+    # JPEG可以直接按缩小的尺寸解码，避免解码整张大图
+    img.draft('L', (hash_size * 8, hash_size * 8))
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def analyze_image(image_path: str, derivatives=None) -> Dict:
+    """解码一次图片，得到尺寸、dHash、质量评分和颜色特征，可以提交到进程池中执行
+
+    提供衍生图缓存时同一次解码还会生成缓存中缺少的各规格衍生图，质量评分和颜色特征使用其中的一级，
+    不再单独解码。
+
+    Args:
+        image_path: 图片路径
+        derivatives: 衍生图缓存（DerivativeCache）
+
+    Returns:
+        Dict: width、height、dhash，sharpness、brightness、dark_ratio、bright_ratio，
+            以及hue、saturation、value、luma_p10/p50/p90、dominant
+    """
+    from core.image_color import color_features
+    from core.image_quality import load_luma, score_luma, ANALYSIS_SIZE
+
+    with Image.open(image_path) as img:
+        width, height = img.size
+        levels = derivatives.generate(image_path, img) if derivatives is not None else {}
+        # 取不小于分析尺寸的最小一级，缩小后与直接解码原图的评分一致
+        min_side = min(ANALYSIS_SIZE, max(width, height))
+        usable = [level for level in levels.values() if max(level.size) >= min_side]
+        if usable:
+            base = min(usable, key=lambda level: level.width)
+        else:
+            # 按分析尺寸缩小解码为彩色图，灰度图和颜色特征都从这一次解码得到
+            img.draft('RGB', (ANALYSIS_SIZE, ANALYSIS_SIZE))
+            base = img.convert('RGB')
+        luma = load_luma(base)
+        colors = color_features(base)
+    result = {'width': width, 'height': height, 'dhash': dhash_image(luma)}
+    result.update(score_luma(np.asarray(luma)))
+    result.update(colors)
+    return result
+
+
+def hamming(a: int, b: int) -> int:
+    """两个哈希的汉明距离"""
+    return (a ^ b).bit_count()
+
+
+def hamming_distances(hashes: np.ndarray, target: int) -> np.ndarray:
+    """向量化计算一组哈希与目标哈希的汉明距离
+
+    Args:
+        hashes: uint64数组
+        target: 目标哈希
+
+    Returns:
+        np.ndarray: 距离数组
+    """
+    xor = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(target))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor).astype(np.int32)
+    return _POPCOUNT_TABLE[xor.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int32)
+
+
+class MultiIndexHash:
+    def __init__(self, max_distance: int, bits: int = 64):
+        """多索引哈希，在大量哈希中快速查找汉明距离不超过max_distance的哈希
+
+        把哈希切成max_distance+1段，根据抽屉原理，距离不超过max_distance的两个哈希
+        至少有一段完全相同。查询时只取出各段精确匹配的候选，再用向量化的汉明距离过滤。
+
+        Args:
+            max_distance: 支持查询的最大距离
+            bits: 哈希位数
+        """
+        self.max_distance = max_distance
+        segments = max_distance + 1
+        bounds = [int(b) for b in np.linspace(0, bits, segments + 1)]
+        # 每一段的(右移位数, 掩码)
+        self._segments = [(bits - hi, (1 << (hi - lo)) - 1) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self._tables: List[dict] = [{} for _ in self._segments]
+        self._hashes = np.empty(1024, dtype=np.uint64)
+        self._items: List[Any] = []
+
+    def _keys(self, h: int):
+        return [(h >> shift) & mask for shift, mask in self._segments]
+
+    def add(self, h: int, item: Any = None):
+        """插入一个哈希"""
+        i = len(self._items)
+        if i == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.empty(len(self._hashes), dtype=np.uint64)])
+        self._hashes[i] = h
+        self._items.append(item)
+        for table, key in zip(self._tables, self._keys(h)):
+            table.setdefault(key, []).append(i)
+
+    def _candidates(self, h: int, k: int):
+        if k > self.max_distance:
+            raise ValueError(f'查询距离{k}超过索引支持的最大距离{self.max_distance}')
+        ids = set()
+        for table, key in zip(self._tables, self._keys(h)):
+            ids.update(table.get(key, ()))
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        return ids, hamming_distances(self._hashes[ids], h)
+
+    def query(self, h: int, k: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """查找距离不超过k的所有哈希
+
+        Returns:
+            List[Tuple[int, Any]]: (距离, 附带数据)列表
+        """
+        k = self.max_distance if k is None else k
+        ids, distances = self._candidates(h, k)
+        mask = distances <= k
+        return [(int(d), self._items[i]) for i, d in zip(ids[mask], distances[mask])]
+
+    def contains_within(self, h: int, k: Optional[int] = None) -> bool:
+        """是否存在距离不超过k的哈希"""
+        k = self.max_distance if k is None else k
+        _, distances = self._candidates(h, k)
+        return bool(distances.size) and int(distances.min()) <= k
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,116 @@
+from PIL import Image
+import numpy as np
+from typing import Dict, List, Optional
+
+# 质量评分使用的灰度图最长边，JPEG可以直接按该尺寸解码
+ANALYSIS_SIZE = 512
+
+# 默认质量阈值，可以在账号配置的quality_thresholds中覆盖；设为None表示不检查该项
+DEFAULT_QUALITY_THRESHOLDS = {
+    'min_width': 300,          # 最小宽度（像素）
+    'min_height': 300,         # 最小高度（像素）
+    'min_sharpness': 20.0,     # 拉普拉斯方差下限，越小越模糊
+    'min_brightness': 20.0,    # 平均亮度下限（0-255）
+    'max_brightness': 235.0,   # 平均亮度上限（0-255）
+    'max_dark_ratio': 0.85,    # 接近全黑的像素比例上限
+    'max_bright_ratio': 0.85,  # 接近全白的像素比例上限
+}
+
+
+def load_luma(img: Image.Image, size: int = ANALYSIS_SIZE) -> Image.Image:
+    """把图片解码为最长边不超过size的灰度图"""
+    img.draft('L', (size, size))
+    luma = img.convert('L')
+    if max(luma.size) > size:
+        luma.thumbnail((size, size), Image.Resampling.BILINEAR)
+    return luma
+
+
+def score_luma(luma: np.ndarray) -> Dict[str, float]:
+    """根据灰度像素计算清晰度和曝光指标
+
+    清晰度为拉普拉斯算子响应的方差；曝光指标为平均亮度，以及亮度低于16、高于239的像素比例。
+
+    Args:
+        luma: 二维灰度数组
+
+    Returns:
+        Dict[str, float]: sharpness、brightness、dark_ratio、bright_ratio
+    """
+    pixels = np.asarray(luma, dtype=np.float32)
+    if pixels.shape[0] < 3 or pixels.shape[1] < 3:
+        sharpness = 0.0
+    else:
+        laplacian = (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+                     - 4 * pixels[1:-1, 1:-1])
+        sharpness = float(laplacian.var())
+    histogram = np.bincount(np.asarray(luma, dtype=np.uint8).ravel(), minlength=256)
+    total = max(int(histogram.sum()), 1)
+    return {
+        'sharpness': sharpness,
+        'brightness': float(np.dot(histogram, np.arange(256)) / total),
+        'dark_ratio': float(histogram[:16].sum() / total),
+        'bright_ratio': float(histogram[240:].sum() / total),
+    }
+
+
+def quality_thresholds(settings: Dict) -> Dict:
+    """合并账号配置中的quality_thresholds与默认阈值"""
+    thresholds = dict(DEFAULT_QUALITY_THRESHOLDS)
+    thresholds.update(settings.get('quality_thresholds') or {})
+    return thresholds
+
+
+def quality_mask(columns: Dict[str, np.ndarray], thresholds: Optional[Dict], count: int) -> np.ndarray:
+    """按列判断是否满足质量阈值，值为NaN（尚未评分或未知）的指标视为通过
+
+    Args:
+        columns: width、height、sharpness、brightness、dark_ratio、bright_ratio各列
+        thresholds: 质量阈值，为None时全部通过
+        count: 行数
+
+    Returns:
+        np.ndarray: 布尔数组
+    """
+    keep = np.ones(count, dtype=bool)
+    if not thresholds or not count:
+        return keep
+
+    checks = [
+        ('width', 'min_width', np.greater_equal),
+        ('height', 'min_height', np.greater_equal),
+        ('sharpness', 'min_sharpness', np.greater_equal),
+        ('brightness', 'min_brightness', np.greater_equal),
+        ('brightness', 'max_brightness', np.less_equal),
+        ('dark_ratio', 'max_dark_ratio', np.less_equal),
+        ('bright_ratio', 'max_bright_ratio', np.less_equal),
+    ]
+    for field, key, compare in checks:
+        limit = thresholds.get(key)
+        if limit is None:
+            continue
+        values = columns[field]
+        keep &= np.isnan(values) | compare(values, limit)
+    return keep
+
+
+def passes_quality(records: List[Dict], thresholds: Optional[Dict]) -> np.ndarray:
+    """向量化判断一组索引记录是否满足质量阈值
+
+    尚未评分的记录（字段为None）视为通过，避免旧索引中的图片被误删。
+
+    Args:
+        records: 图库索引记录
+        thresholds: 质量阈值，为None时全部通过
+
+    Returns:
+        np.ndarray: 布尔数组
+    """
+    if not thresholds or not records:
+        return np.ones(len(records), dtype=bool)
+
+    def column(name):
+        return np.array([np.nan if r.get(name) is None else r[name] for r in records], dtype=np.float64)
+
+    names = ('width', 'height', 'sharpness', 'brightness', 'dark_ratio', 'bright_ratio')
+    return quality_mask({name: column(name) for name in names}, thresholds, len(records))
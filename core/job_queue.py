@@ -0,0 +1,372 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Optional, Callable, Any
+
+from core.log import log_context
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    run_id TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, available_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_run ON jobs(run_id, kind);
+'''
+
+
+class JobNotReady(Exception):
+    """任务的前置条件尚未满足，稍后重新执行，不计入重试次数"""
+
+    def __init__(self, message: str = '', delay: float = 10):
+        super().__init__(message)
+        self.delay = delay
+
+
+class JobAbandoned(Exception):
+    """任务无法通过重试完成（例如超过了截止时间），直接进入死信"""
+
+
+class Job:
+    def __init__(self, row: sqlite3.Row):
+        """从数据库行构造任务对象"""
+        self.id = row['id']
+        self.kind = row['kind']
+        self.payload = json.loads(row['payload'])
+        self.run_id = row['run_id']
+        self.status = row['status']
+        self.attempts = row['attempts']
+        self.max_attempts = row['max_attempts']
+        self.lease_owner = row['lease_owner']
+        self.lease_expires = row['lease_expires']
+        self.result = json.loads(row['result']) if row['result'] else None
+        self.last_error = row['last_error']
+
+    def __repr__(self):
+        return f'Job(id={self.id}, kind={self.kind!r}, status={self.status!r}, attempts={self.attempts})'
+
+
+class JobQueue:
+    def __init__(self, db_path: str, retry_base_delay: float = 10):
+        """基于SQLite的本地持久化任务队列
+
+        多个进程（同一台机器或共享卷）可以同时租用任务。租约到期未完成的任务
+        会被重新分配，超过最大尝试次数的任务进入死信状态。
+
+        Args:
+            db_path: 数据库文件路径
+            retry_base_delay: 失败重试的基础间隔（秒），按指数退避增长
+        """
+        self.db_path = db_path
+        self.retry_base_delay = retry_base_delay
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: Dict, run_id: Optional[str] = None,
+                max_attempts: int = 5, delay: float = 0) -> int:
+        """添加任务
+
+        Args:
+            kind: 任务类型
+            payload: 任务参数，必须可以序列化为JSON
+            run_id: 所属的发布批次ID
+            max_attempts: 最大尝试次数
+            delay: 延迟多少秒后才可以被租用
+
+        Returns:
+            int: 任务ID
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            'INSERT INTO jobs (kind, payload, run_id, max_attempts, available_at, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (kind, json.dumps(payload, ensure_ascii=False), run_id, max_attempts, now + delay, now, now)
+        )
+        return cursor.lastrowid
+
+    def lease(self, owner: str, kinds: Optional[List[str]] = None,
+              visibility_timeout: float = 300) -> Optional[Job]:
+        """租用一个可执行的任务
+
+        可执行的任务包括到期的排队任务和租约已过期的任务（执行它的worker可能已经退出）。
+
+        Args:
+            owner: 租用者标识
+            kinds: 只租用这些类型的任务，为None时不限制
+            visibility_timeout: 租约时长（秒），期间其它worker看不到该任务
+
+        Returns:
+            Optional[Job]: 租到的任务，没有可执行任务时返回None
+        """
+        conn = self._conn()
+        now = time.time()
+        kind_filter = ''
+        params: List[Any] = [now, now]
+        if kinds:
+            kind_filter = f' AND kind IN ({",".join("?" * len(kinds))})'
+            params.extend(kinds)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE ((status = 'queued' AND available_at <= ?) "
+                    "OR (status = 'leased' AND lease_expires < ?))" + kind_filter +
+                    ' ORDER BY available_at, id LIMIT 1',
+                    params
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+
+                # 租约过期且已用完尝试次数的任务直接进入死信
+                if row['status'] == 'leased' and row['attempts'] >= row['max_attempts']:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'dead', last_error = ?, lease_owner = NULL, updated_at = ? "
+                        'WHERE id = ?',
+                        (f'租约过期: {row["lease_owner"]}', now, row['id'])
+                    )
+                    logger.warning(f'任务{row["id"]}({row["kind"]})租约过期且超过最大尝试次数，已进入死信')
+                    continue
+
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                    'attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                    (owner, now + visibility_timeout, now, row['id'])
+                )
+                leased = conn.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+                conn.execute('COMMIT')
+                return Job(leased)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def extend(self, job: Job, visibility_timeout: float = 300) -> bool:
+        """延长租约（心跳）
+
+        Returns:
+            bool: 租约仍归当前worker所有时返回True
+        """
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (time.time() + visibility_timeout, time.time(), job.id, job.lease_owner)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job: Job, result: Any = None) -> bool:
+        """标记任务完成
+
+        Returns:
+            bool: 租约已被其它worker接管时返回False，结果被丢弃
+        """
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_owner = NULL, lease_expires = NULL, "
+            "updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job.id, job.lease_owner)
+        )
+        return cursor.rowcount == 1
+
+    def checkpoint(self, job: Job, result: Any) -> bool:
+        """保存任务的中间结果，任务失败或租约过期后重新执行时从job.result读取，完成时被最终结果覆盖
+
+        用于有外部副作用的任务（例如已经创建的草稿），重试时可以跳过已经完成的步骤。
+
+        Returns:
+            bool: 租约已被其它worker接管时返回False
+        """
+        cursor = self._conn().execute(
+            "UPDATE jobs SET result = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job.id, job.lease_owner)
+        )
+        if cursor.rowcount == 1:
+            job.result = result
+        return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> str:
+        """标记任务失败，未超过最大尝试次数时按指数退避重新排队
+
+        Args:
+            job: 任务
+            error: 错误信息
+            retry: 为False时不再重试，直接进入死信
+
+        Returns:
+            str: 任务的新状态（queued或dead）
+        """
+        now = time.time()
+        if not retry or job.attempts >= job.max_attempts:
+            status, available_at = 'dead', now
+        else:
+            status = 'queued'
+            available_at = now + self.retry_base_delay * (2 ** (job.attempts - 1))
+        self._conn().execute(
+            'UPDATE jobs SET status = ?, available_at = ?, last_error = ?, lease_owner = NULL, '
+            "lease_expires = NULL, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (status, available_at, error, now, job.id, job.lease_owner)
+        )
+        return status
+
+    def defer(self, job: Job, delay: float):
+        """任务尚未就绪，延迟后重新排队，不消耗尝试次数"""
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, available_at = ?, "
+            "lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + delay, now, job.id, job.lease_owner)
+        )
+
+    def get(self, job_id: int) -> Optional[Job]:
+        """按ID查询任务"""
+        row = self._conn().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return Job(row) if row else None
+
+    def run_jobs(self, run_id: str, kind: Optional[str] = None) -> List[Job]:
+        """查询某个发布批次的任务"""
+        if kind:
+            rows = self._conn().execute(
+                'SELECT * FROM jobs WHERE run_id = ? AND kind = ? ORDER BY id', (run_id, kind)
+            ).fetchall()
+        else:
+            rows = self._conn().execute('SELECT * FROM jobs WHERE run_id = ? ORDER BY id', (run_id,)).fetchall()
+        return [Job(row) for row in rows]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """按任务类型统计各状态的任务数"""
+        stats: Dict[str, Dict[str, int]] = {}
+        for row in self._conn().execute('SELECT kind, status, COUNT(*) AS n FROM jobs GROUP BY kind, status'):
+            stats.setdefault(row['kind'], {})[row['status']] = row['n']
+        return stats
+
+    def dead_letters(self, limit: int = 100) -> List[Job]:
+        """列出死信任务"""
+        rows = self._conn().execute(
+            "SELECT * FROM jobs WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [Job(row) for row in rows]
+
+    def requeue_dead(self, job_ids: Optional[List[int]] = None) -> int:
+        """将死信任务重新排队并清零尝试次数
+
+        Args:
+            job_ids: 要重新排队的任务ID，为None时处理全部死信
+
+        Returns:
+            int: 重新排队的任务数
+        """
+        now = time.time()
+        if job_ids is None:
+            cursor = self._conn().execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? "
+                "WHERE status = 'dead'", (now, now)
+            )
+        else:
+            cursor = self._conn().execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? "
+                f"WHERE status = 'dead' AND id IN ({','.join('?' * len(job_ids))})",
+                [now, now, *job_ids]
+            )
+        return cursor.rowcount
+
+
+def default_worker_id() -> str:
+    """生成worker标识：主机名:进程号:线程号"""
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def run_worker(queue: JobQueue, handlers: Dict[str, Callable[[Job, JobQueue], Any]],
+               worker_id: Optional[str] = None, visibility_timeout: float = 300,
+               poll_interval: float = 1, stop_event: Optional[threading.Event] = None,
+               max_jobs: Optional[int] = None) -> int:
+    """worker主循环：租用任务、执行处理函数并回写结果
+
+    处理函数执行期间会定期延长租约；worker异常退出时租约过期，任务会被其它worker接管。
+
+    Args:
+        queue: 任务队列
+        handlers: 任务类型到处理函数的映射，处理函数返回值作为任务结果保存
+        worker_id: worker标识
+        visibility_timeout: 租约时长（秒）
+        poll_interval: 没有任务时的轮询间隔（秒）
+        stop_event: 设置后worker在当前任务完成后退出
+        max_jobs: 最多处理的任务数，为None时一直运行
+
+    Returns:
+        int: 处理的任务数
+    """
+    worker_id = worker_id or default_worker_id()
+    stop_event = stop_event or threading.Event()
+    kinds = list(handlers)
+    processed = 0
+
+    while not stop_event.is_set() and (max_jobs is None or processed < max_jobs):
+        job = queue.lease(worker_id, kinds, visibility_timeout)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        # 心跳线程：在租约过期前续租
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(visibility_timeout / 3):
+                if not queue.extend(job, visibility_timeout):
+                    logger.warning(f'{job} 的租约已被其它worker接管')
+                    return
+
+        heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+        heartbeat_thread.start()
+        # 处理函数及其调用的模块输出的日志都带上任务所属的发布流程、账号、阶段和处理的文件
+        with log_context(run_id=job.run_id, account=job.payload.get('account'), stage=job.kind,
+                         image=job.payload.get('path')):
+            try:
+                result = handlers[job.kind](job, queue)
+            except JobNotReady as e:
+                queue.defer(job, e.delay)
+                logger.debug(f'{job} 尚未就绪: {str(e)}')
+            except JobAbandoned as e:
+                queue.fail(job, str(e), retry=False)
+                logger.error(f'{job} 已放弃（dead）: {str(e)}')
+            except Exception as e:
+                status = queue.fail(job, str(e))
+                logger.error(f'{job} 执行失败（{status}）: {str(e)}')
+            else:
+                if not queue.complete(job, result):
+                    logger.warning(f'{job} 完成时租约已失效，结果被丢弃')
+            finally:
+                done.set()
+                heartbeat_thread.join()
+        processed += 1
+
+    return processed
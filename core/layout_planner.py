@@ -0,0 +1,73 @@
+import numpy as np
+from typing import List, Optional, Tuple
+
+
+def plan_pairs(ratios) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """把图片两两配对，使每对图片的宽高比差异之和最小
+
+    在一维上，按宽高比排序后相邻配对就是最优匹配。图片数量为奇数时需要留出一张：
+    留出排序后第k张（k必须是偶数位置）的代价等于k之前偶数位置的相邻差之和加上k之后
+    奇数位置的相邻差之和，用前缀和一次向量化计算所有k的代价后取最小值。
+
+    Args:
+        ratios: 每张图片的宽高比
+
+    Returns:
+        Tuple[List[Tuple[int, int]], Optional[int]]: (按宽高比排列的配对下标, 未配对的下标)
+    """
+    r = np.asarray(ratios, dtype=np.float64)
+    n = r.size
+    if n < 2:
+        return [], (0 if n == 1 else None)
+    order = np.argsort(r, kind='stable')
+    sorted_r = r[order]
+    diffs = np.diff(sorted_r)
+
+    if n % 2 == 0:
+        skip = None
+        kept = order
+    else:
+        # even_before[j]：前j个相邻差中偶数位置之和；odd_suffix[j]：位置j及之后奇数位置之和
+        even_mask = (np.arange(n - 1) % 2 == 0)
+        even_before = np.concatenate(([0.0], np.cumsum(np.where(even_mask, diffs, 0.0))))
+        odd_suffix = np.concatenate((np.cumsum(np.where(~even_mask, diffs, 0.0)[::-1])[::-1], [0.0]))
+        candidates = np.arange(0, n, 2)
+        # 留出第k张时，k之前按(0,1)(2,3)…配对，k之后按(k+1,k+2)…配对
+        costs = even_before[candidates] + odd_suffix[np.minimum(candidates + 1, n - 1)]
+        k = int(candidates[np.argmin(costs)])
+        skip = int(order[k])
+        kept = np.delete(order, k)
+
+    pairs = [(int(a), int(b)) for a, b in kept.reshape(-1, 2)]
+    return pairs, skip
+
+
+def pair_order(ratios) -> List[int]:
+    """配对后的图片顺序：每两张为一对，未配对的图片放在最后"""
+    pairs, skip = plan_pairs(ratios)
+    order = [i for pair in pairs for i in pair]
+    if skip is not None:
+        order.append(skip)
+    return order
+
+
+def tight_window(ratios, count: int) -> List[int]:
+    """选出宽高比最接近的count张图片（排序后滑动窗口，O(n log n)）
+
+    Args:
+        ratios: 每张图片的宽高比
+        count: 需要的图片数量
+
+    Returns:
+        List[int]: 选中图片的下标，按宽高比排列
+    """
+    r = np.asarray(ratios, dtype=np.float64)
+    order = np.argsort(r, kind='stable')
+    if count >= r.size:
+        return [int(i) for i in order]
+    if count <= 0:
+        return []
+    sorted_r = r[order]
+    spans = sorted_r[count - 1:] - sorted_r[:r.size - count + 1]
+    start = int(np.argmin(spans))
+    return [int(i) for i in order[start:start + count]]
@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# images表的字段及类型，新增字段时追加到这里，打开旧数据库时会自动补齐
+_IMAGE_COLUMNS = [
+    ('path', 'TEXT PRIMARY KEY'),
+    ('dir', 'TEXT NOT NULL'),
+    ('size', 'INTEGER'),
+    ('mtime', 'REAL'),
+    ('width', 'INTEGER'),
+    ('height', 'INTEGER'),
+    ('dhash', 'INTEGER'),
+    ('sharpness', 'REAL'),
+    ('brightness', 'REAL'),
+    ('dark_ratio', 'REAL'),
+    ('bright_ratio', 'REAL'),
+    ('published', 'INTEGER NOT NULL DEFAULT 0'),
+    ('published_at', 'REAL'),
+    ('hue', 'REAL'),
+    ('saturation', 'REAL'),
+    ('value', 'REAL'),
+    ('luma_p10', 'REAL'),
+    ('luma_p50', 'REAL'),
+    ('luma_p90', 'REAL'),
+    ('dominant', 'TEXT'),
+]
+
+# sidecars表缓存每个目录的作品元数据（来自*_result.json）
+_SIDECAR_COLUMNS = [
+    ('dir', 'TEXT PRIMARY KEY'),
+    ('path', 'TEXT NOT NULL'),
+    ('size', 'INTEGER'),
+    ('mtime', 'REAL'),
+    ('aweme_id', 'TEXT'),
+    ('create_time', 'TEXT'),
+    ('desc', 'TEXT'),
+    ('hashtags', 'TEXT'),
+    ('author_nickname', 'TEXT'),
+    ('author_uid', 'TEXT'),
+]
+
+
+def to_signed64(h: int) -> int:
+    """SQLite只能保存有符号64位整数"""
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def to_unsigned64(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+
+class LibraryIndex:
+    def __init__(self, db_path: str):
+        """图库索引，记录每张图片的尺寸、感知哈希和发布状态
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._tree_lock = threading.Lock()
+        self._published_trees = {}
+        self._catalog_lock = threading.Lock()
+        self._catalog = None
+        self._catalog_version = None
+        # 后台监听（LibraryWatcher）运行时指向它，用于判断目录的记录是否最新
+        self.watcher = None
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._migrate()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self):
+        conn = self._conn()
+        for table, table_columns in (('images', _IMAGE_COLUMNS), ('sidecars', _SIDECAR_COLUMNS)):
+            columns = ', '.join(f'"{name}" {decl}' for name, decl in table_columns)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+            existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for name, decl in table_columns:
+                if name not in existing:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN "{name}" {decl}')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_images_dir ON images(dir)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_images_published ON images(published)')
+        conn.commit()
+
+    def get_dir(self, directory: str) -> Dict[str, Dict]:
+        """读取目录中所有图片的索引记录"""
+        rows = self._conn().execute('SELECT * FROM images WHERE dir = ?', (directory,)).fetchall()
+        return {row['path']: self._row_to_dict(row) for row in rows}
+
+    def get_tree(self, directory: str) -> List[Dict]:
+        """读取目录及其子目录中所有图片的索引记录（按路径前缀查询，不依赖扫描时记录的dir）"""
+        prefix = directory.rstrip(os.sep) + os.sep
+        rows = self._conn().execute('SELECT * FROM images WHERE path >= ? AND path < ? ORDER BY path',
+                                    (prefix, prefix[:-1] + chr(ord(os.sep) + 1))).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def directories(self) -> List[str]:
+        """索引中出现过的扫描目录"""
+        return [row['dir'] for row in self._conn().execute('SELECT DISTINCT dir FROM images')]
+
+    def get(self, path: str) -> Optional[Dict]:
+        row = self._conn().execute('SELECT * FROM images WHERE path = ?', (path,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        if record.get('dhash') is not None:
+            record['dhash'] = to_unsigned64(record['dhash'])
+        if record.get('dominant') is not None:
+            record['dominant'] = json.loads(record['dominant'])
+        return record
+
+    def upsert(self, records: Iterable[Dict]):
+        """插入或更新索引记录，只写入记录中出现的字段"""
+        conn = self._conn()
+        for record in records:
+            record = dict(record)
+            if record.get('dhash') is not None:
+                record['dhash'] = to_signed64(record['dhash'])
+            if record.get('dominant') is not None:
+                record['dominant'] = json.dumps(record['dominant'])
+            names = list(record)
+            updates = ', '.join(f'{n} = excluded.{n}' for n in names if n != 'path')
+            conn.execute(
+                f'INSERT INTO images ({", ".join(names)}) VALUES ({", ".join("?" * len(names))}) '
+                f'ON CONFLICT(path) DO UPDATE SET {updates}',
+                [record[n] for n in names]
+            )
+        conn.commit()
+
+    def remove_missing(self, directory: str, present: Iterable[str]) -> int:
+        """删除目录中已经不存在的图片记录"""
+        present = set(present)
+        missing = [p for p in self.get_dir(directory) if p not in present]
+        conn = self._conn()
+        conn.executemany('DELETE FROM images WHERE path = ?', [(p,) for p in missing])
+        conn.commit()
+        return len(missing)
+
+    def get_sidecar(self, directory: str) -> Optional[Dict]:
+        """读取目录缓存的作品元数据"""
+        row = self._conn().execute('SELECT * FROM sidecars WHERE dir = ?', (directory,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record['hashtags'] = json.loads(record['hashtags'] or '[]')
+        return record
+
+    def upsert_sidecar(self, record: Dict):
+        """写入目录的作品元数据"""
+        record = dict(record, hashtags=json.dumps(record.get('hashtags') or [], ensure_ascii=False))
+        names = [name for name, _ in _SIDECAR_COLUMNS]
+        columns = ', '.join(f'"{n}"' for n in names)
+        conn = self._conn()
+        conn.execute(f'INSERT OR REPLACE INTO sidecars ({columns}) VALUES ({", ".join("?" * len(names))})',
+                     [record.get(n) for n in names])
+        conn.commit()
+
+    def mark_published(self, paths: Iterable[str]):
+        """把图片标记为已发布（或已被选入待发布的文章）"""
+        paths = list(paths)
+        now = time.time()
+        conn = self._conn()
+        conn.executemany('UPDATE images SET published = 1, published_at = ? WHERE path = ?',
+                         [(now, p) for p in paths])
+        conn.commit()
+        catalog = self.catalog()
+        if catalog is not None:
+            catalog.mark_published(paths)
+        with self._tree_lock:
+            if self._published_trees:
+                for p in paths:
+                    record = self.get(p)
+                    if record and record.get('dhash') is not None:
+                        for tree in self._published_trees.values():
+                            tree.add(record['dhash'], p)
+
+    def release_published(self, paths: Iterable[str]):
+        """撤销mark_published：图片被选中但草稿或群发没有成功，重新变为可选
+
+        已发布哈希的多索引哈希表不支持删除，清空后在下次查询时从数据库重建。
+        """
+        paths = list(paths)
+        if not paths:
+            return
+        conn = self._conn()
+        conn.executemany('UPDATE images SET published = 0, published_at = NULL WHERE path = ?',
+                         [(p,) for p in paths])
+        conn.commit()
+        catalog = self.catalog()
+        if catalog is not None:
+            catalog.mark_published(paths, published=False)
+        with self._tree_lock:
+            self._published_trees.clear()
+        logger.info(f'已释放{len(paths)}张没有发出的图片')
+
+    @property
+    def catalog_dir(self) -> str:
+        return os.path.splitext(self.db_path)[0] + '_catalog'
+
+    def build_catalog(self):
+        """把当前索引导出为列式快照（LibraryCatalog），替换旧快照"""
+        from core.catalog import build_catalog
+
+        with self._catalog_lock:
+            self._catalog = build_catalog(self, self.catalog_dir)
+            self._catalog_version = os.stat(os.path.join(self.catalog_dir, 'meta.json')).st_mtime_ns
+            return self._catalog
+
+    def catalog(self):
+        """映射列式快照，没有生成过时返回None；快照被其它进程重建后重新映射
+
+        快照只包含生成时已经入库的图片，之后发布的图片会在快照中同步标记。
+        """
+        try:
+            version = os.stat(os.path.join(self.catalog_dir, 'meta.json')).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._catalog_lock:
+            if self._catalog is None or self._catalog_version != version:
+                from core.catalog import LibraryCatalog
+
+                try:
+                    self._catalog = LibraryCatalog(self.catalog_dir)
+                except Exception as e:
+                    logger.warning(f'无法打开图库快照: {str(e)}')
+                    return None
+                self._catalog_version = version
+            return self._catalog
+
+    def published_hashes(self, max_distance: int):
+        """已发布图片哈希的多索引哈希表，首次调用时从数据库构建，之后增量更新"""
+        from core.image_hash import MultiIndexHash
+
+        with self._tree_lock:
+            tree = self._published_trees.get(max_distance)
+            if tree is None:
+                tree = MultiIndexHash(max_distance)
+                rows = self._conn().execute(
+                    'SELECT path, dhash FROM images WHERE published = 1 AND dhash IS NOT NULL'
+                )
+                for row in rows:
+                    tree.add(to_unsigned64(row['dhash']), row['path'])
+                self._published_trees[max_distance] = tree
+            return tree
+
+    def is_near_published(self, h: int, max_distance: int) -> bool:
+        """哈希与某张已发布图片的距离是否不超过max_distance"""
+        return self.published_hashes(max_distance).contains_within(h, max_distance)
+
+
+def list_images(directory: str) -> List[str]:
+    """递归列出目录中的图片文件"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for f in files:
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, f))
+    return paths
+
+
+def scan_directory(index: LibraryIndex, directory: str, pool=None, derivatives=None) -> List[Dict]:
+    """增量扫描目录，为新增或修改过的图片计算尺寸、感知哈希、质量评分和颜色特征
+
+    文件大小和修改时间与索引一致且各项特征都已计算的图片直接使用索引中的记录，不再解码；
+    旧索引中缺少颜色特征的图片会补算一次。
+
+    Args:
+        index: 图库索引
+        directory: 图片目录
+        pool: 进程池，为None时在当前进程计算
+        derivatives: 衍生图缓存，提供时在同一次解码中生成封面、正文等规格的衍生图
+
+    Returns:
+        List[Dict]: 目录中所有有效图片的索引记录
+    """
+    from core.image_hash import analyze_image
+    from core.image_quality import ANALYSIS_SIZE
+    from core.memory_governor import get_memory_governor, decoded_footprint
+
+    known = index.get_dir(directory)
+    present = []
+    stale = []
+    for path in list_images(directory):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        present.append(path)
+        record = known.get(path)
+        if (record is None or record['size'] != st.st_size or record['mtime'] != st.st_mtime
+                or record['dhash'] is None or record['sharpness'] is None or record['hue'] is None):
+            stale.append((path, st.st_size, st.st_mtime))
+
+    if stale:
+        paths = [p for p, _, _ in stale]
+        if pool is not None:
+            # 按文件头估计解码占用的内存，总量不超过预算时才提交
+            governor = get_memory_governor()
+            max_width = derivatives.decode_width if derivatives is not None else ANALYSIS_SIZE
+            futures = [governor.submit(pool, decoded_footprint(p, max_width), analyze_image, p, derivatives)
+                       for p in paths]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+        else:
+            results = []
+            for p in paths:
+                try:
+                    results.append(analyze_image(p, derivatives))
+                except Exception as e:
+                    results.append(e)
+
+        records = []
+        for (path, size, mtime), result in zip(stale, results):
+            if isinstance(result, Exception):
+                logger.error(f'读取图片失败: {path}, 错误: {str(result)}')
+                continue
+            records.append(dict(result, path=path, dir=directory, size=size, mtime=mtime))
+        index.upsert(records)
+
+    index.remove_missing(directory, present)
+    rows = index.get_dir(directory)
+    return [rows[p] for p in present if p in rows]
+
+
+_indexes: Dict[str, LibraryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def library_db_path(account) -> str:
+    return account.settings.get('library_index_path') or os.path.join(account.data_dir, 'library.db')
+
+
+def catalog_meta(account) -> Optional[Dict]:
+    """读取账号图库快照的元数据（不映射快照），没有生成过时返回None"""
+    path = os.path.join(os.path.splitext(library_db_path(account))[0] + '_catalog', 'meta.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def get_library_index(account) -> LibraryIndex:
+    """获取账号的图库索引（同一进程内复用）"""
+    db_path = library_db_path(account)
+    with _indexes_lock:
+        if db_path not in _indexes:
+            _indexes[db_path] = LibraryIndex(db_path)
+        return _indexes[db_path]
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(context)s%(message)s'
+
+# 结构化日志附带的上下文字段
+CONTEXT_FIELDS = ('run_id', 'account', 'stage', 'image')
+
+_context: contextvars.ContextVar[Dict] = contextvars.ContextVar('log_context', default={})
+
+_setup_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+
+
+@contextmanager
+def log_context(**fields):
+    """在with块内为当前线程（协程）的所有日志附加上下文字段，例如run_id、stage、image
+
+    线程池中的任务不会继承调用方的上下文，需要在任务函数内部重新设置。
+    """
+    token = _context.set({**_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """把任务提交到线程池，任务在提交时的日志上下文中执行"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ContextFilter(logging.Filter):
+    """在产生日志的线程中把上下文字段写入日志记录，extra中显式传入的字段优先"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in _context.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，包含时间、级别、模块、消息以及存在的上下文字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式，%(context)s为run_id和stage组成的前缀，没有上下文时为空"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        tags = [str(getattr(record, name)) for name in ('run_id', 'stage') if getattr(record, name, None)]
+        record.context = f'[{" ".join(tags)}] ' if tags else ''
+        return super().format(record)
+
+
+def setup_logging(level=logging.INFO, log_file: Optional[str] = None, json_lines: bool = False,
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, console: bool = True,
+                  fmt: str = TEXT_FORMAT) -> QueueListener:
+    """配置非阻塞日志
+
+    根日志器只挂一个QueueHandler，业务线程只把日志记录放进内存队列；格式化和写文件都在
+    QueueListener的后台线程中完成，每个输出目标（控制台、文件）只有一个处理器。
+    重复调用时先停止之前的监听线程再重新配置。
+
+    Args:
+        level: 日志级别
+        log_file: 日志文件路径，为None时不写文件
+        json_lines: 文件是否使用JSON Lines格式（控制台始终使用文本格式）
+        max_bytes: 单个日志文件的最大字节数，超过后轮转
+        backup_count: 保留的历史日志文件数
+        console: 是否输出到控制台
+        fmt: 文本格式
+
+    Returns:
+        QueueListener: 日志监听器
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+        handlers = []
+        if console:
+            stream_handler = logging.StreamHandler(sys.stderr)
+            stream_handler.setFormatter(TextFormatter(fmt))
+            handlers.append(stream_handler)
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                               encoding='utf-8')
+            file_handler.setFormatter(JsonFormatter() if json_lines else TextFormatter(fmt))
+            handlers.append(file_handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+
+def setup_logging_from_config(config: Dict, log_file: Optional[str] = None, **overrides) -> QueueListener:
+    """按配置中的logging段配置日志
+
+    logging段可以包含level、file、json、max_bytes、backup_count；log_file参数是命令默认的日志文件，
+    配置了file时以配置为准。
+    """
+    options = config.get('logging') or {}
+    kwargs = dict(
+        level=getattr(logging, str(options.get('level', 'INFO')).upper(), logging.INFO),
+        log_file=options.get('file', log_file),
+        json_lines=options.get('json', False),
+        max_bytes=options.get('max_bytes', 10 * 1024 * 1024),
+        backup_count=options.get('backup_count', 5),
+    )
+    kwargs.update(overrides)
+    return setup_logging(**kwargs)
+
+
+def shutdown_logging():
+    """停止监听线程，队列中剩余的日志会先全部写出"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,262 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Optional, Iterable, Set
+
+from core.article_mirror import get_article_mirror
+
+logger = logging.getLogger(__name__)
+
+# 需要清点的永久素材类型，thumb素材包含在image中；图文素材已由草稿箱代替，不再清点
+MATERIAL_TYPES = ('image', 'video', 'voice')
+
+# batchget_material每页最多20个
+PAGE_SIZE = 20
+
+# 接口调用次数超过限制
+API_LIMIT_ERRCODE = 45009
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS materials (
+    media_id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT,
+    url TEXT,
+    update_time INTEGER,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_materials_type ON materials(type, update_time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    type TEXT PRIMARY KEY,
+    total_count INTEGER,
+    synced_at REAL
+);
+'''
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        """限制每秒的调用次数，rate不大于0时不限制"""
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                time.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class MaterialInventory:
+    def __init__(self, db_path: str):
+        """永久素材清单，保存账号下所有永久素材的media_id、类型和更新时间
+
+        Args:
+            db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _known(self, media_ids: List[str]) -> Dict[str, int]:
+        rows = self._conn().execute(
+            f'SELECT media_id, update_time FROM materials WHERE media_id IN ({", ".join("?" * len(media_ids))})',
+            media_ids
+        ).fetchall()
+        return {row['media_id']: row['update_time'] for row in rows}
+
+    def count(self, type: Optional[str] = None) -> int:
+        """本地清单中的素材数量"""
+        if type is None:
+            return self._conn().execute('SELECT COUNT(*) FROM materials').fetchone()[0]
+        return self._conn().execute('SELECT COUNT(*) FROM materials WHERE type = ?', (type,)).fetchone()[0]
+
+    def items(self, type: Optional[str] = None) -> List[Dict]:
+        """本地清单中的素材，按更新时间从旧到新排列"""
+        if type is None:
+            rows = self._conn().execute('SELECT * FROM materials ORDER BY update_time').fetchall()
+        else:
+            rows = self._conn().execute('SELECT * FROM materials WHERE type = ? ORDER BY update_time',
+                                        (type,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def remove(self, media_ids: Iterable[str]):
+        conn = self._conn()
+        conn.executemany('DELETE FROM materials WHERE media_id = ?', [(m,) for m in media_ids])
+        conn.commit()
+
+    def sync_type(self, wechat, type: str, limiter: Optional[RateLimiter] = None) -> Dict:
+        """增量同步一种素材
+
+        素材列表按更新时间从新到旧排列，从第一页开始读取，直到遇到一整页都已在清单中、
+        并且本地数量与线上总数一致为止。数量不一致（有素材在别处被删除）时读完所有页，
+        并删除本次没有出现的记录。
+
+        Args:
+            wechat: WeChatArticle实例
+            type: 素材类型
+            limiter: 接口调用限速
+
+        Returns:
+            Dict: total（线上总数）、new（新增或更新）、pages（读取页数）、removed（删除的过期记录）
+        """
+        conn = self._conn()
+        scan_start = time.time()
+        offset = 0
+        pages = 0
+        new = 0
+        total = None
+        full_scan = False
+        while True:
+            if limiter:
+                limiter.wait()
+            result = wechat.batchget_material(type, offset, PAGE_SIZE)
+            pages += 1
+            total = result.get('total_count', 0)
+            items = result.get('item') or []
+            if not items:
+                full_scan = True
+                break
+
+            known = self._known([item['media_id'] for item in items])
+            changed = [item for item in items if known.get(item['media_id']) != item.get('update_time')]
+            conn.executemany(
+                'INSERT INTO materials (media_id, type, name, url, update_time, seen_at) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(media_id) DO UPDATE SET type = excluded.type, name = excluded.name, '
+                'url = excluded.url, update_time = excluded.update_time, seen_at = excluded.seen_at',
+                [(item['media_id'], type, item.get('name'), item.get('url'), item.get('update_time'), scan_start)
+                 for item in items]
+            )
+            conn.commit()
+            new += len(changed)
+            offset += len(items)
+
+            if offset >= total:
+                full_scan = True
+                break
+            if not changed and self.count(type) == total:
+                break
+
+        removed = 0
+        if full_scan:
+            # 读完了所有页，没有出现的记录对应的素材已经被删除
+            removed = conn.execute('DELETE FROM materials WHERE type = ? AND seen_at < ?',
+                                   (type, scan_start)).rowcount
+        conn.execute(
+            'INSERT INTO sync_state (type, total_count, synced_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(type) DO UPDATE SET total_count = excluded.total_count, synced_at = excluded.synced_at',
+            (type, total, time.time())
+        )
+        conn.commit()
+        return {'total': total, 'new': new, 'pages': pages, 'removed': removed}
+
+    def sync(self, wechat, types: Iterable[str] = MATERIAL_TYPES, rate: float = 5.0) -> Dict[str, Dict]:
+        """增量同步所有类型的素材
+
+        Args:
+            wechat: WeChatArticle实例
+            types: 素材类型
+            rate: 每秒最多调用的接口次数
+
+        Returns:
+            Dict[str, Dict]: 每种素材的同步结果
+        """
+        limiter = RateLimiter(rate)
+        return {type: self.sync_type(wechat, type, limiter) for type in types}
+
+
+def get_material_inventory(account) -> MaterialInventory:
+    """打开账号的永久素材清单"""
+    return MaterialInventory(os.path.join(account.data_dir, 'materials.db'))
+
+
+def local_references(account) -> Set[str]:
+    """本地状态中仍可能被使用的素材：积压处理的封面和视频、视频素材缓存"""
+    from core.backlog import get_backlog_state
+    from core.video import VideoMediaCache
+
+    media_ids = set()
+    state = get_backlog_state(account)
+    for dir_state in state.dirs.values():
+        if dir_state.get('thumb_media_id'):
+            media_ids.add(dir_state['thumb_media_id'])
+        media_ids.update(dir_state.get('videos', {}).values())
+    media_ids.update(entry['media_id'] for entry in VideoMediaCache(account.video_cache_file)._load().values())
+    return media_ids
+
+
+def collect_garbage(wechat, account, inventory: Optional[MaterialInventory] = None, apply: bool = False,
+                    min_age_days: float = 7, rate: float = 2.0, limit: Optional[int] = None) -> Dict:
+    """删除没有被任何草稿、已发布文章或本地状态引用的永久素材
+
+    先增量同步素材清单和草稿/已发布文章镜像，再从镜像和本地状态中收集引用。最近min_age_days天内
+    更新的素材不会删除，正在进行中的发布任务上传的封面也因此不会被误删。
+
+    Args:
+        wechat: WeChatArticle实例
+        account: 发布账号
+        inventory: 素材清单，默认为账号的清单
+        apply: 为False时只统计不删除
+        min_age_days: 只删除更新时间早于这么多天的素材
+        rate: 每秒最多调用的接口次数
+        limit: 本次最多删除的素材数
+
+    Returns:
+        Dict: total、referenced、candidates、deleted、failed
+    """
+    inventory = inventory or get_material_inventory(account)
+    limiter = RateLimiter(rate)
+    for type in MATERIAL_TYPES:
+        inventory.sync_type(wechat, type, limiter)
+
+    mirror = get_article_mirror(account)
+    mirror.sync(wechat, limiter=limiter)
+    media_ids, urls = mirror.references()
+    media_ids |= local_references(account)
+
+    cutoff = time.time() - min_age_days * 86400
+    items = inventory.items()
+    referenced = [i for i in items if i['media_id'] in media_ids or (i['url'] and i['url'] in urls)]
+    referenced_ids = {i['media_id'] for i in referenced}
+    candidates = [i for i in items
+                  if i['media_id'] not in referenced_ids and (i['update_time'] or 0) < cutoff]
+    if limit is not None:
+        candidates = candidates[:limit]
+
+    stats = {'total': len(items), 'referenced': len(referenced), 'candidates': len(candidates),
+             'deleted': 0, 'failed': 0}
+    if not apply:
+        return stats
+
+    for item in candidates:
+        limiter.wait()
+        try:
+            wechat.delete_material(item['media_id'])
+        except Exception as e:
+            stats['failed'] += 1
+            logger.error(f'删除素材失败: {item["media_id"]}, 错误: {str(e)}')
+            if str(API_LIMIT_ERRCODE) in str(e):
+                logger.warning('接口调用次数已达上限，停止删除')
+                break
+            continue
+        inventory.remove([item['media_id']])
+        stats['deleted'] += 1
+    logger.info(f'[{account.name}] 清理永久素材完成，回收{stats["deleted"]}个（共{stats["total"]}个，'
+                f'引用{stats["referenced"]}个，失败{stats["failed"]}个）')
+    return stats
@@ -0,0 +1,255 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 解码后每个像素占用的字节数（RGB，Pillow按4字节对齐保存）
+BYTES_PER_PIXEL = 4
+
+# 解码时同时存在的副本数：原图、转换模式或缩放后的副本
+COPIES_IN_FLIGHT = 2
+
+# 没有配置预算时使用物理内存的这个比例
+DEFAULT_BUDGET_FRACTION = 0.5
+
+# 采样进程内存的间隔（秒）
+RSS_SAMPLE_INTERVAL = 0.2
+
+_governor_lock = threading.Lock()
+_governor = None
+
+
+def image_dimensions(path: str):
+    """只读取文件头得到图片尺寸和格式，不解码像素"""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.width, img.height, img.format
+
+
+def decoded_footprint(path: str, max_width: Optional[int] = None) -> int:
+    """按文件头中的尺寸估计解码一张图片需要的内存（字节）
+
+    Args:
+        path: 图片路径
+        max_width: 只需要这个宽度时，JPEG可以按1/2、1/4、1/8缩小解码
+
+    Returns:
+        int: 估计的字节数，读取文件头失败时按文件大小的10倍估计
+    """
+    try:
+        width, height, fmt = image_dimensions(path)
+    except Exception:
+        return os.path.getsize(path) * 10
+    if max_width and fmt == 'JPEG':
+        scale = 1
+        while scale < 8 and width // (scale * 2) >= max_width:
+            scale *= 2
+        width, height = width // scale, height // scale
+    return width * height * BYTES_PER_PIXEL * COPIES_IN_FLIGHT
+
+
+def total_memory() -> Optional[int]:
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class MemoryGovernor:
+    def __init__(self, budget_bytes: int):
+        """按内存预算准入图片处理任务
+
+        提交任务前按文件头估计解码占用的内存，已准入任务的估计之和不超过预算时才提交，否则等待
+        其它任务完成。单个任务超过预算时只在没有其它任务进行时准入，不会永远等待。
+        无论进程池有多少个进程，同时解码的图片占用的内存都不会超过预算。
+
+        Args:
+            budget_bytes: 内存预算（字节）
+        """
+        self.budget = budget_bytes
+        self.reserved = 0
+        self.peak_reserved = 0
+        self.admitted = 0
+        self.waited = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int):
+        start = time.monotonic()
+        with self._cond:
+            while self.reserved and self.reserved + nbytes > self.budget:
+                self._cond.wait()
+            self.reserved += nbytes
+            self.peak_reserved = max(self.peak_reserved, self.reserved)
+            self.admitted += 1
+            self.waited += time.monotonic() - start
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.reserved -= nbytes
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, nbytes: int):
+        """在with块内占用nbytes预算"""
+        self.acquire(nbytes)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
+
+    def submit(self, pool, footprint: int, fn, *args, **kwargs):
+        """准入后把任务提交到进程池，任务结束（包括失败）时归还预算
+
+        Args:
+            pool: 进程池，为None时在当前线程执行并返回已完成的Future
+            footprint: 任务估计占用的内存（字节）
+            fn: 任务函数
+
+        Returns:
+            Future: 任务的Future
+        """
+        from concurrent.futures import Future
+
+        self.acquire(footprint)
+        if pool is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self.release(footprint)
+            return future
+        try:
+            future = pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self.release(footprint)
+            raise
+        future.add_done_callback(lambda _: self.release(footprint))
+        return future
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {'budget_mb': round(self.budget / 1024 / 1024, 1),
+                    'peak_reserved_mb': round(self.peak_reserved / 1024 / 1024, 1),
+                    'admitted': self.admitted, 'waited_seconds': round(self.waited, 2)}
+
+    def reset_stats(self):
+        with self._cond:
+            self.peak_reserved = self.reserved
+            self.admitted = 0
+            self.waited = 0.0
+
+
+def get_memory_governor(budget_mb: Optional[float] = None) -> MemoryGovernor:
+    """获取进程内共享的内存准入控制器
+
+    Args:
+        budget_mb: 预算（MB），只在第一次调用时生效；为None时使用物理内存的一半
+
+    Returns:
+        MemoryGovernor: 共享的准入控制器
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            if budget_mb:
+                budget = int(budget_mb * 1024 * 1024)
+            else:
+                budget = int((total_memory() or 4 * 1024 ** 3) * DEFAULT_BUDGET_FRACTION)
+            _governor = MemoryGovernor(budget)
+        return _governor
+
+
+def _rss(pid: int) -> int:
+    """进程当前的常驻内存（字节），进程已退出时为0"""
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _pool_pids(pool) -> Iterable[int]:
+    processes = getattr(pool, '_processes', None) or {}
+    return list(processes)
+
+
+class RssMonitor:
+    def __init__(self, pool=None, interval: float = RSS_SAMPLE_INTERVAL):
+        """在后台线程中定期采样当前进程和进程池子进程的常驻内存，记录总和的峰值
+
+        只在有/proc的系统（Linux）上采样子进程；其它系统只记录当前进程的峰值。
+
+        Args:
+            pool: 进程池（ProcessPoolExecutor）
+            interval: 采样间隔（秒）
+        """
+        self.pool = pool
+        self.interval = interval
+        self.peak_total = 0
+        self.peak_main = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        main = _rss(os.getpid())
+        if not main:
+            import resource
+            # ru_maxrss在Linux上以KB为单位，在macOS上以字节为单位
+            main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        total = main + sum(_rss(pid) for pid in _pool_pids(self.pool))
+        self.peak_main = max(self.peak_main, main)
+        self.peak_total = max(self.peak_total, total)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self) -> 'RssMonitor':
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name='rss-monitor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> Dict:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sample()
+        return {'peak_rss_mb': round(self.peak_total / 1024 / 1024, 1),
+                'peak_main_rss_mb': round(self.peak_main / 1024 / 1024, 1)}
+
+
+@contextmanager
+def track_peak_rss(label: str, pool=None, governor: Optional[MemoryGovernor] = None):
+    """记录一次运行的内存峰值，结束时输出到日志
+
+    Args:
+        label: 日志中的运行名称
+        pool: 进程池，子进程的内存计入总和
+        governor: 内存准入控制器，提供时一并报告预算占用的峰值
+
+    Yields:
+        Dict: 运行结束后填入peak_rss_mb等统计
+    """
+    report = {}
+    monitor = RssMonitor(pool).start()
+    if governor is not None:
+        governor.reset_stats()
+    try:
+        yield report
+    finally:
+        report.update(monitor.stop())
+        if governor is not None:
+            report.update(governor.stats())
+            logger.info(f'[{label}] 峰值内存{report["peak_rss_mb"]}MB（主进程{report["peak_main_rss_mb"]}MB），'
+                        f'图片解码预算占用峰值{report["peak_reserved_mb"]}MB/{report["budget_mb"]}MB，'
+                        f'等待准入{report["waited_seconds"]}秒')
+        else:
+            logger.info(f'[{label}] 峰值内存{report["peak_rss_mb"]}MB（主进程{report["peak_main_rss_mb"]}MB）')
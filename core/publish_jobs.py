@@ -0,0 +1,264 @@
+import os
+import time
+import uuid
+import logging
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import List, Dict, Optional
+
+from core.accounts import Account, get_shared_session
+from core.job_queue import JobQueue, Job, JobNotReady, JobAbandoned
+from core.event_server import get_running_hub, mass_key
+from core.library_index import get_library_index
+from core.sidecar import get_directory_metadata, clean_desc
+from core.video import find_videos, upload_video, video_cover_for
+from core.article_mirror import source_key
+from core.publisher import get_unprocessed_directory, get_random_images, build_article, image_ratios, theme_selection
+
+logger = logging.getLogger(__name__)
+
+# 发布流程拆分后的任务类型
+RENDER_COVER = 'render_cover'
+UPLOAD_IMAGE = 'upload_image'
+UPLOAD_VIDEO = 'upload_video'
+CREATE_DRAFT = 'create_draft'
+SEND_POLL = 'send_poll'
+
+
+class PublishJobs:
+    def __init__(self, accounts: List[Account], mass_poll_delay: float = 30, mass_send_timeout: float = 3600,
+                 event_wait: float = 60):
+        """把auto_publish的各个步骤拆成可持久化的队列任务
+
+        一次发布（run）包含：渲染并上传封面、逐张上传图片和视频、创建草稿、群发并查询状态。
+        前三类任务互不依赖，可以由任意多个worker并行执行；创建草稿任务在它们
+        完成前会推迟执行。
+
+        Args:
+            accounts: 账号列表，任务通过账号名称引用账号
+            mass_poll_delay: 群发后第一次查询状态前等待的秒数
+            mass_send_timeout: 群发后超过这个秒数仍在发送中时放弃查询，任务进入死信
+            event_wait: 当前进程运行回调服务时，每次查询前等待群发完成事件的最长秒数
+        """
+        self.accounts = {account.name: account for account in accounts}
+        self.mass_poll_delay = mass_poll_delay
+        self.mass_send_timeout = mass_send_timeout
+        self.event_wait = event_wait
+
+    def _account(self, name: str) -> Account:
+        if name not in self.accounts:
+            raise Exception(f'未知账号: {name}')
+        return self.accounts[name]
+
+    def _wechat(self, account: Account):
+        # worker本身就是独立进程，图片在当前进程内编码即可
+        return account.get_wechat(session=get_shared_session(account.settings.get('http_pool_size', 10)))
+
+    def _run_dir(self, account: Account, run_id: str) -> str:
+        run_dir = os.path.join(account.data_dir, 'runs', run_id)
+        os.makedirs(run_dir, exist_ok=True)
+        return run_dir
+
+    def handlers(self) -> Dict:
+        """任务类型到处理函数的映射，供run_worker使用"""
+        return {
+            RENDER_COVER: self.render_cover,
+            UPLOAD_IMAGE: self.upload_image,
+            UPLOAD_VIDEO: self.upload_video,
+            CREATE_DRAFT: self.create_draft,
+            SEND_POLL: self.send_poll,
+        }
+
+    def enqueue_run(self, queue: JobQueue, account_name: str, directory: Optional[str] = None) -> Optional[str]:
+        """为账号创建一次发布，把全部任务写入队列
+
+        Args:
+            queue: 任务队列
+            account_name: 账号名称
+            directory: 图片目录，为None时自动选择一个未处理的目录
+
+        Returns:
+            Optional[str]: 发布批次ID，没有可处理的目录时返回None
+        """
+        from core.derivatives import get_derivative_cache
+        from core.image_quality import quality_thresholds
+
+        account = self._account(account_name)
+        directory = directory or get_unprocessed_directory(account)
+        if not directory:
+            return None
+
+        index = get_library_index(account)
+        max_distance = account.settings.get('near_duplicate_distance', 6)
+        quality = quality_thresholds(account.settings)
+        theme, theme_size = theme_selection(account.settings)
+        image_paths = get_random_images(directory, theme_size, index=index, max_distance=max_distance,
+                                        quality=quality, derivatives=get_derivative_cache(account.settings),
+                                        theme=theme)
+        cover_paths = get_random_images(directory, 3, index=index, max_distance=max_distance, even=False,
+                                        quality=quality, theme=theme)
+        if (not image_paths or len(cover_paths) < 3) and not video_cover_for(account, directory):
+            raise Exception(f'目录中没有足够的有效图片: {directory}')
+
+        run_id = uuid.uuid4().hex
+        queue.enqueue(RENDER_COVER, {'account': account.name, 'directory': directory,
+                                     'cover_paths': cover_paths}, run_id=run_id)
+        for i, path in enumerate(image_paths):
+            queue.enqueue(UPLOAD_IMAGE, {'account': account.name, 'path': path, 'index': i}, run_id=run_id)
+        for path in find_videos(directory):
+            queue.enqueue(UPLOAD_VIDEO, {'account': account.name, 'directory': directory, 'path': path},
+                          run_id=run_id)
+        # 选中的图片记录在创建草稿任务中，草稿创建成功后才标记为已发布；批次失败时图片仍然可选
+        queue.enqueue(CREATE_DRAFT, {'account': account.name, 'directory': directory,
+                                     'image_count': len(image_paths), 'image_paths': image_paths,
+                                     'cover_paths': cover_paths}, run_id=run_id, max_attempts=3)
+        logger.info(f'[{account.name}] 已创建发布批次 {run_id}: {directory}，共{len(image_paths)}张图片')
+        return run_id
+
+    def render_cover(self, job: Job, queue: JobQueue) -> Dict:
+        """渲染拼接封面、压缩并上传为永久缩略图素材"""
+        from core.create_cover import create_merged_cover, merged_cover_footprint
+        from core.compress_image import compress_image
+        from core.derivatives import get_derivative_cache
+        from core.memory_governor import get_memory_governor
+
+        account = self._account(job.payload['account'])
+        run_dir = self._run_dir(account, job.run_id)
+        cover_paths = job.payload.get('cover_paths') or []
+        if len(cover_paths) >= 3:
+            derivatives = get_derivative_cache(account.settings)
+            with get_memory_governor().admit(merged_cover_footprint(cover_paths, derivatives)):
+                merged_cover_path = create_merged_cover(job.payload['directory'],
+                                                        os.path.join(run_dir, 'merged_cover.jpg'),
+                                                        image_paths=cover_paths, derivatives=derivatives)
+        else:
+            merged_cover_path = video_cover_for(account, job.payload['directory'])
+            if not merged_cover_path:
+                raise Exception(f'目录中没有足够的封面图片: {job.payload["directory"]}')
+        thumb_path = compress_image(merged_cover_path, os.path.join(run_dir, 'thumb_merged_cover.jpg'))
+        result = self._wechat(account).upload_permanent_material(thumb_path, 'thumb')
+        return {'thumb_media_id': result['media_id']}
+
+    def upload_image(self, job: Job, queue: JobQueue) -> Dict:
+        """上传一张文章内图片"""
+        account = self._account(job.payload['account'])
+        path = job.payload['path']
+        if not os.path.exists(path):
+            raise Exception(f'图片不存在: {path}')
+        url = self._wechat(account).upload_article_image(path)
+        return {'index': job.payload['index'], 'url': url}
+
+    def upload_video(self, job: Job, queue: JobQueue) -> Dict:
+        """上传一个视频为永久素材（按内容哈希缓存media_id）"""
+        account = self._account(job.payload['account'])
+        metadata = get_directory_metadata(get_library_index(account), job.payload['directory'])
+        title = clean_desc(metadata.get('desc', '')) if metadata else ''
+        return {'media_id': upload_video(self._wechat(account), account, job.payload['path'], title)}
+
+    def create_draft(self, job: Job, queue: JobQueue) -> Dict:
+        """等待封面和图片上传完成后创建草稿，并添加群发任务
+
+        生成的文章和草稿的media_id在每一步之后保存为任务的中间结果，任务在创建草稿后失败或worker退出时，
+        重试直接使用已经创建的草稿，批次中已经有群发任务时也不再添加，不会重复群发。
+        """
+        account = self._account(job.payload['account'])
+        progress = dict(job.result or {})
+        if progress.get('media_id'):
+            logger.info(f'[{account.name}] 使用已创建的草稿 {progress["media_id"]}')
+            return self._enqueue_send(job, queue, account, progress)
+
+        covers = queue.run_jobs(job.run_id, RENDER_COVER)
+        if any(c.status == 'dead' for c in covers):
+            raise Exception('封面任务已失败，无法创建草稿')
+        if not covers or covers[0].status != 'done':
+            raise JobNotReady('封面尚未上传')
+
+        uploads = queue.run_jobs(job.run_id, UPLOAD_IMAGE)
+        videos = queue.run_jobs(job.run_id, UPLOAD_VIDEO)
+        pending = [u for u in uploads + videos if u.status not in ('done', 'dead')]
+        if pending:
+            raise JobNotReady(f'还有{len(pending)}个图片或视频未上传')
+
+        # 与原流程一致：上传失败的图片直接跳过
+        done = sorted((u for u in uploads if u.status == 'done'), key=lambda u: u.result['index'])
+        image_urls = [u.result['url'] for u in done]
+        video_media_ids = [v.result['media_id'] for v in videos if v.status == 'done']
+        if not image_urls and not video_media_ids:
+            raise Exception('没有成功上传的图片，无法创建文章')
+
+        # build_article会增加文章计数，重试时使用上次生成的文章
+        article = progress.get('article')
+        if article is None:
+            index = get_library_index(account)
+            metadata = get_directory_metadata(index, job.payload['directory'])
+            ratios = image_ratios(index, [u.payload['path'] for u in done])
+            article = build_article(image_urls, account, metadata, video_media_ids, ratios,
+                                    source_key(account, job.payload['directory']))
+            article['thumb_media_id'] = covers[0].result['thumb_media_id']
+            progress.update(article=article, image_count=len(image_urls))
+            if not queue.checkpoint(job, progress):
+                raise Exception('任务租约已被其它worker接管')
+
+        media_id = self._wechat(account).create_draft([article])
+        logger.info(f'[{account.name}] 草稿创建成功，media_id: {media_id}')
+        progress['media_id'] = media_id
+        queue.checkpoint(job, progress)
+        return self._enqueue_send(job, queue, account, progress)
+
+    @staticmethod
+    def _enqueue_send(job: Job, queue: JobQueue, account: Account, progress: Dict) -> Dict:
+        """草稿创建后把选中的图片标记为已发布，并添加群发任务；批次中已经有群发任务时跳过"""
+        get_library_index(account).mark_published(set(job.payload.get('image_paths', [])) |
+                                                  set(job.payload.get('cover_paths', [])))
+        if not queue.run_jobs(job.run_id, SEND_POLL):
+            queue.enqueue(SEND_POLL, {'account': account.name, 'media_id': progress['media_id']},
+                          run_id=job.run_id, max_attempts=1)
+        return {'media_id': progress['media_id'], 'image_count': progress.get('image_count')}
+
+    def send_poll(self, job: Job, queue: JobQueue) -> Dict:
+        """群发草稿；群发成功后另建一个查询任务轮询发送状态
+
+        群发只允许执行一次（max_attempts=1），状态查询任务可以多次重试。当前进程运行回调服务时，
+        查询前先等待MASSSENDJOBFINISH事件，查询接口只作为兜底。超过截止时间仍在发送中的任务进入死信。
+        """
+        account = self._account(job.payload['account'])
+        wechat = self._wechat(account)
+        msg_id = job.payload.get('msg_id')
+
+        if msg_id is None:
+            result = wechat.send_mass_message(job.payload['media_id'], send_ignore_reprint=1, is_to_all=True)
+            logger.info(f'[{account.name}] 群发任务创建成功，msg_id: {result["msg_id"]}')
+            queue.enqueue(SEND_POLL, {**job.payload, 'msg_id': result['msg_id'],
+                                      'deadline': time.time() + self.mass_send_timeout},
+                          run_id=job.run_id, max_attempts=10, delay=self.mass_poll_delay)
+            return {'msg_id': result['msg_id']}
+
+        deadline = job.payload.get('deadline', float('inf'))
+        hub = get_running_hub()
+        status = None
+        if hub is not None:
+            # 事件先于查询任务到达时由事件中转暂存，expect会立即得到结果
+            key = mass_key(msg_id, account.appid)
+            future = hub.expect(key)
+            try:
+                status = future.result(timeout=max(0, min(self.event_wait, deadline - time.time())))
+            except FutureTimeout:
+                pass
+            finally:
+                hub.discard(key)
+        if status is None:
+            status = wechat.query_mass_status(msg_id)
+
+        if status['msg_status'] == 'SENDING':
+            if time.time() >= deadline:
+                raise JobAbandoned(f'群发超过{self.mass_send_timeout}秒仍未完成: {msg_id}')
+            # 仍在发送中不算失败，推迟后再查；没有推送事件时间隔随查询次数增长
+            polls = job.payload.get('polls', 0)
+            delay = 0 if hub is not None else min(self.mass_poll_delay * (2 ** polls), 600)
+            queue.enqueue(SEND_POLL, {**job.payload, 'polls': polls + 1}, run_id=job.run_id,
+                          max_attempts=10, delay=min(delay, max(0, deadline - time.time())))
+            return {'msg_status': 'SENDING'}
+        if status['msg_status'] != 'SEND_SUCCESS':
+            # 群发的最终状态，重新查询也不会改变
+            raise JobAbandoned(f'群发失败: {status}')
+        logger.info(f'[{account.name}] 群发状态: {status}')
+        return status
@@ -0,0 +1,619 @@
+import os
+import json
+import time
+import random
+import hashlib
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from core.accounts import Account, get_shared_session, get_shared_encode_pool
+from core.library_index import get_library_index
+from core.sidecar import get_directory_metadata, format_title, format_digest, clean_desc
+from core.video import find_videos, upload_video, video_cover_for
+from core.article_template import render_fitting
+from core.article_mirror import source_key, mirrored_directories
+from core.log import log_context, submit_with_context
+
+logger = logging.getLogger(__name__)
+
+# 一篇草稿最多包含的图文消息数
+MAX_ARTICLES_PER_DRAFT = 8
+
+_count_lock = threading.Lock()
+
+def retry_on_error(max_retries=3, delay=5):
+    """错误重试装饰器
+
+    Args:
+        max_retries: 最大重试次数
+        delay: 重试间隔（秒）
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            retries = 0
+            while retries < max_retries:
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    retries += 1
+                    if retries == max_retries:
+                        logger.error(f'{func.__name__} 最终失败: {str(e)}')
+                        raise
+                    logger.warning(f'{func.__name__} 失败，正在重试 ({retries}/{max_retries}): {str(e)}')
+                    time.sleep(delay)
+            return None
+        return wrapper
+    return decorator
+
+@retry_on_error(max_retries=3)
+def get_unprocessed_directories(account: Account, limit: int = 1) -> list:
+    """随机获取账号图库中若干个未处理的目录，并标记为已处理
+
+    草稿和已发布文章镜像中已有的目录同样视为已处理（只读取本地镜像，不调用接口）。
+
+    Args:
+        account: 发布账号
+        limit: 最多返回的目录数
+
+    Returns:
+        list: 目录路径列表，所有目录都已处理时返回空列表
+    """
+    processed_dirs_file = account.processed_dirs_file
+    processed_dirs = account.read_processed_dirs()
+
+    # 后台监听维护着完整的目录列表时不再遍历图库
+    watcher = get_library_index(account).watcher
+    all_dirs = watcher.directories() if watcher is not None else None
+    if all_dirs is None:
+        all_dirs = []
+        for root, dirs, _ in os.walk(account.image_base_dir):
+            for d in dirs:
+                dir_path = os.path.join(root, d)
+                all_dirs.append(dir_path)
+
+    processed = set(processed_dirs)
+    unprocessed_dirs = [d for d in all_dirs if d not in processed]
+    mirrored = mirrored_directories(account, unprocessed_dirs)
+    if mirrored:
+        logger.info(f'[{account.name}] 跳过{len(mirrored)}个已有草稿或已发布的目录')
+        unprocessed_dirs = [d for d in unprocessed_dirs if d not in mirrored]
+    unprocessed_dirs = exclude_exhausted(account, unprocessed_dirs)
+
+    if not unprocessed_dirs:
+        logger.info(f'[{account.name}] 所有目录都已处理完毕')
+        return []
+
+    selected_dirs = random.sample(unprocessed_dirs, min(limit, len(unprocessed_dirs)))
+    processed_dirs.extend(selected_dirs)
+
+    os.makedirs(os.path.dirname(processed_dirs_file), exist_ok=True)
+    with open(processed_dirs_file, 'w', encoding='utf-8') as f:
+        json.dump(processed_dirs, f, indent=4, ensure_ascii=False)
+
+    return selected_dirs
+
+def exclude_exhausted(account: Account, directories: list) -> list:
+    """按图库快照排除可用图片不足的目录
+
+    在快照的各列上一次向量化计算每个目录中未发布且质量达标的图片数，少于min_candidate_images
+    （默认3张，拼接封面需要的数量）且没有视频的目录不会被选中。快照中没有的目录（新目录）保留。
+    """
+    from core.image_quality import quality_thresholds
+
+    catalog = get_library_index(account).catalog()
+    if catalog is None or not directories:
+        return directories
+    min_images = account.settings.get('min_candidate_images', 3)
+    counts = catalog.candidates_per_dir(catalog.candidate_mask(quality_thresholds(account.settings)))
+    kept = []
+    for directory in directories:
+        dir_id = catalog.find_dir(directory)
+        if dir_id is None or counts[dir_id] >= min_images or find_videos(directory):
+            kept.append(directory)
+    if len(kept) < len(directories):
+        logger.info(f'[{account.name}] 跳过{len(directories) - len(kept)}个可用图片不足{min_images}张的目录')
+    return kept
+
+def get_unprocessed_directory(account: Account) -> str:
+    """获取账号图库中未处理的目录"""
+    selected_dirs = get_unprocessed_directories(account, 1)
+    return selected_dirs[0] if selected_dirs else None
+
+@retry_on_error(max_retries=3)
+def get_article_count(account: Account) -> int:
+    """获取账号的文章序号"""
+    try:
+        with open(account.article_count_file, 'r') as f:
+            count = int(f.read().strip())
+        return count
+    except:
+        return 3
+
+@retry_on_error(max_retries=3)
+def update_article_count(account: Account, count: int):
+    """更新账号的文章序号"""
+    count_file = account.article_count_file
+    os.makedirs(os.path.dirname(count_file), exist_ok=True)
+    with open(count_file, 'w') as f:
+        f.write(str(count))
+
+def build_article(image_urls: list, account: Account, metadata: dict = None, video_media_ids: list = None,
+                  image_ratios: list = None, source: str = None) -> dict:
+    """根据已上传的图片URL生成图文消息，并递增账号的文章序号
+
+    Args:
+        image_urls: 图片URL列表
+        account: 发布账号
+        metadata: 目录的作品元数据，提供时根据作品描述生成标题和摘要
+        video_media_ids: 视频素材的media_id列表，视频放在图片之前
+        image_ratios: 与图片一一对应的高宽比，用于选择布局（账号配置layout可以指定布局）
+        source: 来源目录标记（source_key），写入正文供草稿镜像反查目录
+
+    Returns:
+        dict: 图文消息（thumb_media_id尚未设置）
+    """
+    if len(image_urls) % 2 != 0:
+        image_urls = image_urls[:-1]
+
+    html_content, _ = render_fitting(image_urls, image_ratios, account.settings.get('layout', 'auto'),
+                                     video_media_ids, source or '')
+
+    # 多篇文章并行准备时，序号的读取和递增必须是原子的
+    with _count_lock:
+        count = get_article_count(account)
+        update_article_count(account, count + 1)
+
+    article_data = {
+        'title': format_title(metadata, count, account.settings),
+        'author': account.settings.get('author', 'hao'),
+        'digest': format_digest(metadata, count),
+        'content': html_content,
+        'thumb_media_id': None,
+        'need_open_comment': 1,
+        'only_fans_can_comment': 0
+    }
+
+    return article_data
+
+def theme_selection(settings: dict) -> tuple:
+    """账号配置的主题（theme）和主题文章的图片数（theme_size，默认8）；没有配置主题时为(None, None)"""
+    theme = settings.get('theme')
+    return theme, (settings.get('theme_size', 8) if theme else None)
+
+def upload_content_images(wechat, image_paths: list) -> tuple:
+    """并行上传文章内图片，同时进行的请求数由wechat.upload_limiter按接口的响应情况自适应调整
+
+    Returns:
+        tuple: (图片URL列表, 上传成功的图片路径列表)，上传失败的图片被跳过
+    """
+    def upload(img_path):
+        if not os.path.exists(img_path):
+            logger.error(f'图片不存在: {img_path}', extra={'image': img_path})
+            return None
+        try:
+            url = wechat.upload_article_image(img_path)
+            logger.info(f'图片上传成功: {url}', extra={'image': img_path})
+            return url
+        except Exception as e:
+            logger.error(f'图片上传失败: {str(e)}', extra={'image': img_path})
+            return None
+
+    if not image_paths:
+        return [], []
+    workers = max(1, min(len(image_paths), wechat.upload_limiter.max_limit))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [submit_with_context(executor, upload, path) for path in image_paths]
+        results = [(path, future.result()) for path, future in zip(image_paths, futures)]
+    return [url for _, url in results if url], [path for path, url in results if url]
+
+def image_ratios(index, image_paths: list) -> list:
+    """从图库索引读取图片的高宽比，索引中没有的图片为None"""
+    ratios = []
+    for path in image_paths:
+        record = index.get(path)
+        ok = record and record.get('width') and record.get('height')
+        ratios.append(record['height'] / record['width'] if ok else None)
+    return ratios
+
+def collect_video_ids(video_futures: list) -> list:
+    """等待视频上传完成，上传失败的视频直接跳过"""
+    media_ids = []
+    for future in video_futures:
+        try:
+            media_ids.append(future.result())
+        except Exception as e:
+            logger.error(f'视频上传失败: {str(e)}')
+    return media_ids
+
+def exclude_near_duplicates(records: list, index, max_distance: int) -> list:
+    """排除与已发布图片或同一批中已选图片过于相似的图片
+
+    Args:
+        records: 图库索引记录列表（包含dhash）
+        index: 图库索引
+        max_distance: 汉明距离不超过该值视为重复
+
+    Returns:
+        list: 保留的记录
+    """
+    from core.image_hash import MultiIndexHash
+
+    kept = []
+    # 已选图片放入多索引哈希，每张候选只和分段命中的少数已选图片比较
+    kept_hashes = MultiIndexHash(max_distance)
+    for record in records:
+        h = record.get('dhash')
+        if h is None:
+            continue
+        if index.is_near_published(h, max_distance):
+            continue
+        if kept_hashes.contains_within(h):
+            continue
+        kept.append(record)
+        kept_hashes.add(h)
+    return kept
+
+@retry_on_error(max_retries=3)
+def get_random_images(folder: str, count: int = None, index=None, max_distance: int = None,
+                      even: bool = True, pool=None, quality: dict = None, derivatives=None,
+                      theme: str = None) -> list:
+    """从指定文件夹及其子目录随机选择图片，确保选择的图片具有相似的宽高比
+
+    Args:
+        folder: 根目录路径
+        count: 需要的图片数量，如果为None则返回所有图片
+        index: 图库索引，提供时从索引读取尺寸，并可以排除近似重复的图片
+        max_distance: 感知哈希汉明距离阈值，为None时不排除重复图片（需要提供index）
+        even: 是否保证返回偶数数量的图片
+        pool: 扫描新图片时使用的进程池
+        quality: 质量阈值，提供时排除分辨率过低、模糊或曝光异常的图片（需要提供index）
+        derivatives: 衍生图缓存，扫描新图片时在同一次解码中生成衍生图（需要提供index）
+        theme: 主题（image_color.THEMES），提供时选出颜色特征最接近、最符合主题的count张图片，
+            主题优先于宽高比（需要提供index）
+
+    Returns:
+        list: 图片路径列表
+    """
+    if not os.path.exists(folder):
+        logger.error(f'文件夹不存在: {folder}')
+        return []
+
+    import numpy as np
+
+    # 图片路径和对应的宽高比（数组），不为每张图片构造元组
+    paths, ratios = [], np.empty(0)
+
+    if index is not None:
+        from core.library_index import scan_directory
+
+        watcher = getattr(index, 'watcher', None)
+        if watcher is not None and watcher.is_current(folder):
+            # 后台监听已经把目录的变化写入索引，不需要再扫描
+            records = index.get_tree(folder)
+        else:
+            records = scan_directory(index, folder, pool, derivatives)
+        if quality:
+            from core.image_quality import passes_quality
+
+            keep = passes_quality(records, quality)
+            if not keep.all():
+                logger.info(f'排除了{int((~keep).sum())}张质量不达标的图片: {folder}')
+                records = [r for r, k in zip(records, keep) if k]
+        if max_distance is not None:
+            before = len(records)
+            records = exclude_near_duplicates(records, index, max_distance)
+            if len(records) < before:
+                logger.info(f'排除了{before - len(records)}张近似重复的图片: {folder}')
+        if theme and records:
+            from core.image_color import select_similar
+
+            chosen = select_similar(records, len(records) if count is None else count, theme)
+            if chosen is not None:
+                records = [records[i] for i in chosen]
+        paths = [r['path'] for r in records]
+        ratios = np.fromiter((r['width'] / r['height'] for r in records), dtype=np.float64, count=len(records))
+    else:
+        from PIL import Image
+
+        sizes = []
+        # 递归遍历目录
+        for root, _, files in os.walk(folder):
+            for f in files:
+                if f.lower().endswith(('.jpg', '.jpeg', '.png')):
+                    try:
+                        img_path = os.path.join(root, f)
+                        with Image.open(img_path) as img:
+                            sizes.append(img.size)
+                            paths.append(img_path)
+                    except Exception as e:
+                        logger.error(f'读取图片失败: {f}, 错误: {str(e)}')
+        if sizes:
+            sizes = np.asarray(sizes, dtype=np.float64)
+            ratios = sizes[:, 0] / sizes[:, 1]
+
+    if not paths:
+        logger.error(f'目录中没有有效图片: {folder}')
+        return []
+
+    from core.layout_planner import pair_order, tight_window
+
+    # 未指定数量时返回全部图片：宽高比最接近的两张相邻成对（两栏布局同一行高度一致），
+    # 数量为奇数时最难配对的一张放在最后
+    if count is None:
+        return [paths[i] for i in pair_order(ratios)]
+
+    # 确保请求的数量为偶数
+    if even and count % 2 != 0:
+        count -= 1
+
+    # 选出宽高比最接近的一组图片，数量不足时返回全部
+    selected = [paths[i] for i in tight_window(ratios, count)]
+    if even and len(selected) % 2 != 0:
+        selected = selected[:-1]
+    return selected
+
+def render_cover(cover_images: list, video_cover: str, directory: str, output_path: str, derivatives=None) -> str:
+    """生成目录的拼接封面，图片不足时使用视频封面；位于模块顶层，可以提交到进程池中执行"""
+    from core.create_cover import create_merged_cover
+
+    if len(cover_images) < 3:
+        return video_cover
+    return create_merged_cover(directory, output_path, image_paths=cover_images, derivatives=derivatives)
+
+def select_cover_images(content_images: list, video_cover: str, index, theme: str = None) -> list:
+    """从已选出的文章图片中选择宽高比最接近的3张作为封面，不再重新扫描目录
+
+    提供主题时改为选择颜色最接近、最符合主题的3张。
+    """
+    from core.image_color import select_similar
+    from core.layout_planner import tight_window
+
+    if not content_images and not video_cover:
+        raise Exception('目录中没有可用的图片')
+    records = [index.get(path) for path in content_images]
+    if theme and len(records) >= 3:
+        chosen = select_similar(records, 3, theme)
+        if chosen is not None and len(chosen) == 3:
+            return [content_images[i] for i in chosen]
+    ratios = [r['width'] / r['height'] for r in records]
+    cover_images = [content_images[i] for i in tight_window(ratios, 3)] if content_images else []
+    if len(cover_images) < 3 and not video_cover:
+        raise Exception('无法获取封面图片')
+    return cover_images
+
+def _file_version(path: str) -> tuple:
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+def build_prepare_graph(wechat, account: Account, directory: str, encode_pool) -> 'StageGraph':
+    """把一个目录的准备过程表示为阶段图
+
+    各阶段只通过声明的输入输出相互依赖：获取access_token、读取元数据、上传视频与扫描图片同时开始，
+    图片选出后封面渲染、压缩、上传缩略图这一支与文章内图片上传同时进行，最后汇总成图文消息。
+    封面渲染和压缩在进程池中执行，输出按输入图片的内容缓存。
+    """
+    from core.check_image import check_image
+    from core.compress_image import compress_image
+    from core.create_cover import merged_cover_footprint
+    from core.derivatives import get_derivative_cache
+    from core.image_quality import quality_thresholds
+    from core.stage_graph import Stage, StageGraph, PROCESS
+
+    index = get_library_index(account)
+    max_distance = account.settings.get('near_duplicate_distance', 6)
+    quality = quality_thresholds(account.settings)
+    derivatives = get_derivative_cache(account.settings)
+    theme, theme_size = theme_selection(account.settings)
+
+    # 每个目录使用独立的封面文件，避免同一草稿中的多篇文章或多个账号互相覆盖
+    cover_dir = os.path.join(account.data_dir, 'covers')
+    os.makedirs(cover_dir, exist_ok=True)
+    key = hashlib.md5(directory.encode('utf-8')).hexdigest()[:12]
+    merged_cover_path = os.path.join(cover_dir, f'{key}_merged_cover.jpg')
+    thumb_image_path = os.path.join(cover_dir, f'{key}_thumb_merged_cover.jpg')
+
+    def scan():
+        # 先选出去重且质量达标的文章图片，封面从同一批图片中选择；新图片在扫描时一次生成全部衍生图
+        return get_random_images(directory, theme_size, index=index, max_distance=max_distance,
+                                 pool=encode_pool, quality=quality, derivatives=derivatives, theme=theme)
+
+    def upload_videos(metadata):
+        video_title = clean_desc(metadata.get('desc', '')) if metadata else ''
+        with ThreadPoolExecutor(max_workers=2) as video_executor:
+            futures = [video_executor.submit(upload_video, wechat, account, path, video_title)
+                       for path in find_videos(directory)]
+            return collect_video_ids(futures)
+
+    def upload_thumb(thumb_path):
+        logger.info(check_image(thumb_path))
+        media_id = wechat.upload_permanent_material(thumb_path, 'thumb')['media_id']
+        logger.info(f'封面图片上传成功，media_id: {media_id}')
+        return media_id
+
+    def assemble(image_urls, uploaded_paths, video_media_ids, metadata, thumb_media_id):
+        if not image_urls and not video_media_ids:
+            raise Exception('没有成功上传的图片，无法创建文章')
+        ratios = image_ratios(index, uploaded_paths)
+        article = build_article(image_urls, account, metadata, video_media_ids, ratios,
+                                source_key(account, directory))
+        article['thumb_media_id'] = thumb_media_id
+        return article
+
+    def cover_key(cover_images, video_cover, *args, **kwargs):
+        return tuple(_file_version(p) for p in cover_images) or _file_version(video_cover), kwargs['output_path']
+
+    return StageGraph(f'{account.name}/{os.path.basename(directory)}', [
+        Stage('token', wechat.warm_up, optional=True),
+        Stage('metadata', get_directory_metadata, kwargs={'index': index, 'directory': directory},
+              optional=True),
+        Stage('video_cover', video_cover_for, kwargs={'account': account, 'directory': directory}),
+        Stage('content_images', scan),
+        Stage('video_media_ids', upload_videos, inputs=['metadata'], optional=True, default=[]),
+        Stage('cover_images', select_cover_images, inputs=['content_images', 'video_cover'],
+              kwargs={'index': index, 'theme': theme}),
+        Stage('cover', render_cover, inputs=['cover_images', 'video_cover'], executor=PROCESS,
+              kwargs={'directory': directory, 'output_path': merged_cover_path, 'derivatives': derivatives},
+              footprint=lambda images, *args, **kwargs: merged_cover_footprint(images, derivatives),
+              cache_key=cover_key, cache_valid=os.path.exists),
+        Stage('thumb', compress_image, inputs=['cover'], executor=PROCESS,
+              kwargs={'output_path': thumb_image_path},
+              cache_key=lambda cover, output_path: (_file_version(cover), output_path), cache_valid=os.path.exists),
+        Stage('thumb_media_id', upload_thumb, inputs=['thumb']),
+        Stage('images', lambda paths: upload_content_images(wechat, paths), inputs=['content_images'],
+              outputs=['image_urls', 'uploaded_paths']),
+        Stage('article', assemble,
+              inputs=['image_urls', 'uploaded_paths', 'video_media_ids', 'metadata', 'thumb_media_id']),
+    ])
+
+def prepare_article(wechat, account: Account, directory: str, encode_pool, selected: set = None) -> dict:
+    """把一个图片目录准备成一篇带封面的图文消息
+
+    生成并上传该目录自己的拼接封面，上传文章内图片并生成正文。各步骤按build_prepare_graph中的
+    依赖关系尽量同时执行，结束时在日志中输出关键路径。选中的图片不在这里标记为已发布，
+    由调用方在草稿或群发成功后标记，失败时图片仍然可选。
+
+    Args:
+        wechat: WeChatArticle实例
+        account: 发布账号
+        directory: 图片目录
+        encode_pool: 图片编码进程池
+        selected: 提供时把文章和封面选中的图片加入这个集合
+
+    Returns:
+        dict: 图文消息，失败时返回None
+    """
+    from core.memory_governor import get_memory_governor
+
+    logger.info(f'[{account.name}] 正在准备目录: {directory}')
+    graph = build_prepare_graph(wechat, account, directory, encode_pool)
+    run = graph.run(process_pool=encode_pool, governor=get_memory_governor())
+    try:
+        article = run.value('article')
+    except Exception as e:
+        logger.error(f'创建文章失败: {directory}: {str(e)}')
+        return None
+
+    if selected is not None:
+        selected.update(run.value('content_images'))
+        selected.update(run.value('cover_images'))
+    return article
+
+def prepare_articles(wechat, account: Account, directories: list, encode_pool, selected: set = None) -> list:
+    """并行准备多篇图文消息，单篇失败不影响其它文章
+
+    Args:
+        wechat: WeChatArticle实例
+        account: 发布账号
+        directories: 图片目录列表
+        encode_pool: 图片编码进程池
+        selected: 提供时把各篇文章选中的图片加入这个集合
+
+    Returns:
+        list: 成功准备的图文消息，顺序与目录顺序一致
+    """
+    def prepare(directory):
+        try:
+            return prepare_article(wechat, account, directory, encode_pool, selected)
+        except Exception as e:
+            logger.error(f'[{account.name}] 准备目录失败 {directory}: {str(e)}')
+            return None
+
+    with log_context(stage='prepare'), ThreadPoolExecutor(max_workers=max(1, len(directories))) as executor:
+        futures = [submit_with_context(executor, prepare, d) for d in directories]
+        articles = [future.result() for future in futures]
+    return [article for article in articles if article]
+
+@retry_on_error(max_retries=3)
+def auto_publish(account: Account) -> bool:
+    """为指定账号自动发布文章
+
+    积压处理已暂存草稿时直接群发最早的一篇；否则现场准备。账号配置了batch_size
+    （最多8）时，一次取多个未处理目录打包成一篇多图文草稿，只消耗一次群发次数。
+    每次发布的日志都带有同一个run_id。
+
+    Returns:
+        bool: 群发任务已经创建时返回True，没有可发布的内容时返回False
+    """
+    from core.memory_governor import get_memory_governor, track_peak_rss
+
+    with log_context(run_id=uuid.uuid4().hex, account=account.name, stage='publish'), \
+            track_peak_rss(account.name, get_shared_encode_pool(account.settings.get('encode_workers')),
+                           get_memory_governor()):
+        try:
+            return _auto_publish(account)
+        finally:
+            account.save_upload_limit()
+
+
+def _auto_publish(account: Account) -> bool:
+    from core.backlog import claim_staged_draft, mark_draft_sent, release_staged_draft
+    from core.event_server import get_running_hub
+
+    logger.info(f'[{account.name}] 开始自动发布流程')
+    settings = account.settings
+    batch_size = max(1, min(settings.get('batch_size', 1), MAX_ARTICLES_PER_DRAFT))
+
+    try:
+        session = get_shared_session(settings.get('http_pool_size', 10))
+        encode_pool = get_shared_encode_pool(settings.get('encode_workers'))
+        wechat = account.get_wechat(session=session, encode_pool=encode_pool)
+        selected_images = set()
+
+        # 积压处理已经暂存了草稿时直接群发，不再临时准备；群发成功后才标记为已发送
+        staged = claim_staged_draft(account)
+        if staged:
+            media_id = staged['media_id']
+            logger.info(f'[{account.name}] 使用暂存草稿 {media_id}（{len(staged["dirs"])}篇文章）')
+        else:
+            selected_dirs = get_unprocessed_directories(account, batch_size)
+            if not selected_dirs:
+                logger.info(f'[{account.name}] 没有可处理的目录')
+                return False
+
+            logger.info(f'[{account.name}] 选择处理目录: {selected_dirs}')
+            articles = prepare_articles(wechat, account, selected_dirs, encode_pool, selected_images)
+            if not articles:
+                logger.error('创建文章失败')
+                return False
+
+            # 创建草稿
+            logger.info(f'正在创建草稿（{len(articles)}篇文章）...')
+            media_id = wechat.create_draft(articles)
+            logger.info(f'草稿创建成功，media_id: {media_id}')
+
+        # 群发文章
+        logger.info('正在群发文章...')
+        try:
+            result = wechat.send_mass_message(
+                media_id,
+                send_ignore_reprint=1,  # 忽略原创校验
+                is_to_all=True,  # 发送给所有用户
+                tag_id=None
+            )
+        except Exception:
+            if staged:
+                # 释放认领，重试时仍然发送这个草稿
+                release_staged_draft(account, media_id)
+            raise
+        if staged:
+            mark_draft_sent(account, media_id, result['msg_id'])
+        # 群发成功后才把选中的图片标记为已发布，之前任何一步失败时图片仍然可选
+        get_library_index(account).mark_published(selected_images)
+        logger.info(f'群发任务创建成功，msg_id: {result["msg_id"]}')
+
+        # 等待群发完成：优先使用推送事件，未启动回调服务时退化为指数退避轮询
+        try:
+            status = wechat.wait_for_mass_send(result['msg_id'], event_hub=get_running_hub())
+            logger.info(f'群发状态: {status}')
+        except Exception as e:
+            # 群发任务已经创建，当天的群发次数已经占用
+            logger.error(f'[{account.name}] 群发{result["msg_id"]}没有成功完成: {str(e)}')
+        return True
+
+    except Exception as e:
+        logger.error(f'[{account.name}] 发布过程出错: {str(e)}')
+        raise
@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import logging
+from typing import Dict, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+# 抖音下载目录中每个作品附带的元数据文件
+SIDECAR_SUFFIX = '_result.json'
+
+# 需要从元数据文件中提取的顶层字段
+SIDECAR_FIELDS = ('aweme_id', 'create_time', 'desc', 'author')
+
+_HASHTAG_RE = re.compile(r'#([^\s#]+)')
+
+_decoder = json.JSONDecoder()
+
+# 完整的JSON值后面只可能出现的字符
+_VALUE_END = ' \t\r\n,:]}'
+
+
+class _JsonStream:
+    def __init__(self, f, chunk_size: int = 8192):
+        """按块读取JSON文本，只解码需要的值，其余的值逐字符跳过"""
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # 丢弃已经消费的部分，缓冲区只保留当前值
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳过空白并返回下一个字符，文件结束时返回空字符串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f'JSON格式错误，期望{char!r}')
+        self.pos += 1
+
+    def decode(self):
+        """解码下一个完整的值，缓冲区中的数据不完整时继续读取"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # 数字可能被块边界截断（例如12.5只读到了12），值后面是分隔符或文件已经结束时才是完整的
+                if (end < len(self.buf) and self.buf[end] in _VALUE_END) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                value, self.pos = _decoder.raw_decode(self.buf, self.pos)
+                return value
+
+    def skip(self):
+        """跳过下一个值，不构造任何对象"""
+        first = self.peek()
+        if first not in '{["':
+            self.decode()
+            return
+        depth = 0
+        in_string = False
+        escaped = False
+        while True:
+            buf = self.buf
+            i = self.pos
+            while i < len(buf):
+                c = buf[i]
+                i += 1
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif c == '\\':
+                        escaped = True
+                    elif c == '"':
+                        in_string = False
+                        if depth == 0:
+                            self.pos = i
+                            return
+                elif c == '"':
+                    in_string = True
+                elif c in '{[':
+                    depth += 1
+                elif c in '}]':
+                    depth -= 1
+                    if depth == 0:
+                        self.pos = i
+                        return
+            self.pos = i
+            if not self._fill():
+                raise ValueError('JSON文件不完整')
+
+
+def extract_fields(path: str, fields: Iterable[str] = SIDECAR_FIELDS, chunk_size: int = 8192) -> Dict:
+    """从JSON对象中流式提取指定的顶层字段
+
+    逐块读取文件，不需要的字段直接跳过；所有字段都找到后立即停止读取，
+    不会把整个文件读入内存。
+
+    Args:
+        path: JSON文件路径
+        fields: 需要的顶层字段名
+        chunk_size: 每次读取的字符数
+
+    Returns:
+        Dict: 找到的字段
+    """
+    wanted = set(fields)
+    result = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f, chunk_size)
+        stream.expect('{')
+        while wanted and stream.peek() not in ('}', ''):
+            key = stream.decode()
+            stream.expect(':')
+            if key in wanted:
+                result[key] = stream.decode()
+                wanted.discard(key)
+            else:
+                stream.skip()
+            if stream.peek() == ',':
+                stream.pos += 1
+    return result
+
+
+def parse_sidecar(path: str) -> Dict:
+    """把元数据文件解析为索引记录：描述、话题标签、发布时间、作者和作品ID"""
+    raw = extract_fields(path)
+    desc = raw.get('desc') or ''
+    author = raw.get('author') if isinstance(raw.get('author'), dict) else {}
+    return {
+        'aweme_id': str(raw.get('aweme_id') or ''),
+        'create_time': raw.get('create_time') or '',
+        'desc': desc,
+        'hashtags': _HASHTAG_RE.findall(desc),
+        'author_nickname': author.get('nickname') or '',
+        'author_uid': str(author.get('uid') or ''),
+    }
+
+
+def find_sidecar(directory: str) -> Optional[str]:
+    """目录中的元数据文件路径，没有时返回None"""
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return None
+    for name in names:
+        if name.endswith(SIDECAR_SUFFIX):
+            return os.path.join(directory, name)
+    return None
+
+
+def get_directory_metadata(index, directory: str) -> Optional[Dict]:
+    """读取目录的作品元数据，优先使用图库索引中的缓存
+
+    元数据文件的大小和修改时间与缓存一致时不会重新解析。
+
+    Args:
+        index: 图库索引
+        directory: 图片目录
+
+    Returns:
+        Optional[Dict]: 元数据，目录中没有元数据文件或解析失败时返回None
+    """
+    path = find_sidecar(directory)
+    if path is None:
+        return None
+    st = os.stat(path)
+    cached = index.get_sidecar(directory)
+    if cached and cached['path'] == path and cached['size'] == st.st_size and cached['mtime'] == st.st_mtime:
+        return cached
+
+    try:
+        record = parse_sidecar(path)
+    except Exception as e:
+        logger.error(f'解析元数据失败: {path}, 错误: {str(e)}')
+        return None
+    record.update(dir=directory, path=path, size=st.st_size, mtime=st.st_mtime)
+    index.upsert_sidecar(record)
+    return record
+
+
+def clean_desc(desc: str) -> str:
+    """去掉描述中的话题标签和多余的空白"""
+    return re.sub(r'\s+', ' ', _HASHTAG_RE.sub('', desc)).strip(' 。，,.~～')
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def format_title(metadata: Optional[Dict], count: int, settings: Dict) -> str:
+    """根据作品描述生成标题，没有描述时使用账号配置的默认标题
+
+    Args:
+        metadata: 目录元数据
+        count: 文章序号
+        settings: 账号配置，title_template可以使用{desc}、{author}和{count}
+
+    Returns:
+        str: 不超过32个字的标题
+    """
+    desc = clean_desc(metadata.get('desc', '')) if metadata else ''
+    if not desc:
+        return settings.get('default_title', '女朋友壁纸 | 第{count}弹来咯').format(count=count)
+    template = settings.get('title_template', '{desc} | 第{count}弹')
+    suffix = template.replace('{desc}', '').format(count=count, author=metadata.get('author_nickname', ''))
+    desc = _truncate(desc, max(8, 32 - len(suffix)))
+    return _truncate(template.format(desc=desc, count=count, author=metadata.get('author_nickname', '')), 32)
+
+
+def format_digest(metadata: Optional[Dict], count: int) -> str:
+    """根据作品描述和话题标签生成摘要，没有描述时使用默认摘要"""
+    if not metadata or not (metadata.get('desc') or metadata.get('hashtags')):
+        return f'精选女朋友壁纸第{count}期'
+    parts = [clean_desc(metadata.get('desc', ''))]
+    parts.extend(f'#{tag}' for tag in metadata.get('hashtags', []))
+    return _truncate(' '.join(p for p in parts if p), 120)
@@ -0,0 +1,304 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Optional, Callable, Any, Iterable
+
+from core.log import submit_with_context
+
+logger = logging.getLogger(__name__)
+
+# 阶段状态
+OK = 'ok'
+CACHED = 'cached'
+FALLBACK = 'fallback'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+
+class Stage:
+    def __init__(self, name: str, fn: Callable, inputs: Iterable[str] = (), outputs: Optional[Iterable[str]] = None,
+                 executor: str = THREAD, kwargs: Optional[Dict] = None, optional: bool = False, default: Any = None,
+                 cache_key: Optional[Callable] = None, cache_valid: Optional[Callable] = None,
+                 footprint: Optional[Callable] = None):
+        """执行图中的一个阶段
+
+        输入按inputs的顺序作为位置参数传给fn，kwargs为固定的关键字参数。
+
+        Args:
+            name: 阶段名称
+            fn: 阶段函数；executor为process时必须是模块顶层函数
+            inputs: 依赖的值的名称（初始值或其它阶段的输出）
+            outputs: 输出的值的名称，默认为阶段名称；多个输出时fn返回同样长度的元组
+            executor: thread在线程池中执行，process提交到进程池（没有进程池时在线程池中执行）
+            kwargs: 固定的关键字参数
+            optional: 失败时是否使用default作为输出，不影响依赖它的阶段
+            default: optional阶段失败时的输出
+            cache_key: 接收与fn相同的输入，返回缓存键；为None时不缓存
+            cache_valid: 检查缓存的输出是否仍然可用（例如文件是否存在）
+            footprint: 接收与fn相同的输入，返回估计占用的内存（字节），进程阶段按内存预算准入
+        """
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs) if outputs else (name,)
+        self.executor = executor
+        self.kwargs = kwargs or {}
+        self.optional = optional
+        self.default = default
+        self.cache_key = cache_key
+        self.cache_valid = cache_valid
+        self.footprint = footprint
+
+    def __repr__(self):
+        return f'Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})'
+
+
+class StageCache:
+    def __init__(self, max_entries: int = 256):
+        """进程内的阶段输出缓存，超过max_entries时淘汰最久没有使用的条目"""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_default_cache = StageCache()
+
+
+def _admit_and_run(governor, process_pool, stage: Stage, args: list):
+    """估计内存、等待准入后把阶段提交到进程池，并等待结果"""
+    footprint = stage.footprint(*args, **stage.kwargs)
+    return governor.submit(process_pool, footprint, stage.fn, *args, **stage.kwargs).result()
+
+
+class GraphRun:
+    def __init__(self, stages: Dict[str, Stage], producers: Dict[str, str]):
+        """一次执行的结果：各阶段的状态、错误、起止时间和输出的值"""
+        self.stages = stages
+        self.producers = producers
+        self.values: Dict[str, Any] = {}
+        self.status: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.started: Dict[str, float] = {}
+        self.finished: Dict[str, float] = {}
+        self.wall_time = 0.0
+
+    def value(self, name: str):
+        """读取输出的值，产生它的阶段失败或被跳过时抛出异常"""
+        if name in self.values:
+            return self.values[name]
+        stage = self.producers.get(name)
+        raise Exception(f'阶段{stage}没有完成: {self.errors.get(stage, self.status.get(stage, "未执行"))}')
+
+    def duration(self, name: str) -> float:
+        return self.finished.get(name, 0.0) - self.started.get(name, 0.0)
+
+    def critical_path(self) -> List[str]:
+        """决定总耗时的阶段链：从最后完成的阶段开始，每次回溯到它的输入中最晚完成的阶段"""
+        done = [name for name in self.finished if self.status.get(name) != SKIPPED]
+        if not done:
+            return []
+        path = [max(done, key=lambda n: self.finished[n])]
+        while True:
+            upstream = {self.producers[i] for i in self.stages[path[-1]].inputs if i in self.producers}
+            upstream = [n for n in upstream if n in self.finished]
+            if not upstream:
+                break
+            path.append(max(upstream, key=lambda n: self.finished[n]))
+        return path[::-1]
+
+    def report(self) -> Dict:
+        return {
+            'wall_seconds': round(self.wall_time, 2),
+            'critical_path': [{'stage': n, 'seconds': round(self.duration(n), 2)} for n in self.critical_path()],
+            'stages': {n: {'status': s, 'seconds': round(self.duration(n), 2), 'error': self.errors.get(n)}
+                       for n, s in self.status.items()},
+        }
+
+    def summary(self) -> str:
+        path = ' → '.join(f'{n} {self.duration(n):.2f}s' for n in self.critical_path())
+        busy = sum(self.duration(n) for n in self.finished)
+        failed = [n for n, s in self.status.items() if s in (FAILED, FALLBACK)]
+        text = f'总耗时{self.wall_time:.2f}s（各阶段合计{busy:.2f}s），关键路径: {path or "无"}'
+        if failed:
+            text += f'，失败的阶段: {", ".join(failed)}'
+        return text
+
+
+class StageGraph:
+    def __init__(self, name: str, stages: Iterable[Stage] = ()):
+        """由阶段和它们声明的输入输出组成的有向无环图
+
+        输入全部就绪的阶段立即开始执行，互不依赖的阶段在线程池和进程池中同时进行。阶段失败时只有
+        直接或间接依赖它的阶段被跳过，其它阶段继续执行；optional阶段失败时使用默认输出。
+        声明了cache_key的阶段的输出保存在进程内缓存中，输入相同时不再执行。
+
+        Args:
+            name: 执行图名称，用于日志
+            stages: 阶段列表
+        """
+        self.name = name
+        self.stages: Dict[str, Stage] = OrderedDict()
+        self.producers: Dict[str, str] = {}
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage: Stage) -> Stage:
+        if stage.name in self.stages:
+            raise Exception(f'阶段名称重复: {stage.name}')
+        for output in stage.outputs:
+            if output in self.producers:
+                raise Exception(f'{output}已经由阶段{self.producers[output]}输出')
+            self.producers[output] = stage.name
+        self.stages[stage.name] = stage
+        return stage
+
+    def _check(self, initial: Dict):
+        missing = {i for s in self.stages.values() for i in s.inputs
+                   if i not in self.producers and i not in initial}
+        if missing:
+            raise Exception(f'执行图{self.name}缺少输入: {", ".join(sorted(missing))}')
+        # 拓扑排序检查环
+        pending = {n: {self.producers[i] for i in s.inputs if i in self.producers} for n, s in self.stages.items()}
+        while pending:
+            ready = [n for n, deps in pending.items() if not deps & pending.keys()]
+            if not ready:
+                raise Exception(f'执行图{self.name}存在循环依赖: {", ".join(sorted(pending))}')
+            for n in ready:
+                del pending[n]
+
+    @staticmethod
+    def _submit(stage: Stage, args: list, threads, process_pool, governor) -> Future:
+        if stage.executor == PROCESS and process_pool is not None:
+            if governor is not None and stage.footprint is not None:
+                # 准入可能要等其它任务归还预算，在线程池中等待，不阻塞调度循环提交其它阶段
+                return submit_with_context(threads, _admit_and_run, governor, process_pool, stage, args)
+            return process_pool.submit(stage.fn, *args, **stage.kwargs)
+        return submit_with_context(threads, stage.fn, *args, **stage.kwargs)
+
+    def run(self, initial: Optional[Dict] = None, process_pool=None, governor=None,
+            cache: Optional[StageCache] = None, max_threads: Optional[int] = None) -> GraphRun:
+        """执行所有阶段
+
+        Args:
+            initial: 初始值
+            process_pool: 进程池，process阶段提交到这里
+            governor: 内存准入控制器，声明了footprint的进程阶段按预算准入
+            cache: 阶段输出缓存，默认为进程内共享的缓存
+            max_threads: 线程池大小，默认为阶段数
+
+        Returns:
+            GraphRun: 执行结果
+        """
+        initial = dict(initial or {})
+        self._check(initial)
+        cache = cache if cache is not None else _default_cache
+        result = GraphRun(self.stages, self.producers)
+        result.values.update(initial)
+        start = time.monotonic()
+        remaining = OrderedDict(self.stages)
+        running = {}
+
+        def finish(name, status, outputs=None, error=None):
+            result.status[name] = status
+            result.finished[name] = time.monotonic() - start
+            result.started.setdefault(name, result.finished[name])
+            if outputs is not None:
+                result.values.update(zip(self.stages[name].outputs, outputs))
+            if error is not None:
+                result.errors[name] = error
+
+        def split(stage, value):
+            return (value,) if len(stage.outputs) == 1 else tuple(value)
+
+        workers = max_threads or max(1, len(self.stages))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.name) as threads:
+            while remaining or running:
+                # 依赖失败的阶段直接跳过，错误信息沿用最初失败的阶段
+                for name, stage in list(remaining.items()):
+                    upstream = [self.producers.get(i) for i in stage.inputs
+                                if result.status.get(self.producers.get(i)) in (FAILED, SKIPPED)]
+                    if upstream:
+                        del remaining[name]
+                        cause = upstream[0]
+                        error = result.errors[cause]
+                        finish(name, SKIPPED, error=error if result.status[cause] == SKIPPED else f'{cause}: {error}')
+
+                for name, stage in list(remaining.items()):
+                    if not all(i in result.values for i in stage.inputs):
+                        continue
+                    del remaining[name]
+                    args = [result.values[i] for i in stage.inputs]
+                    key = None
+                    if stage.cache_key is not None:
+                        try:
+                            key = (self.name, name, stage.cache_key(*args, **stage.kwargs))
+                        except Exception as e:
+                            logger.debug(f'阶段{name}无法计算缓存键: {str(e)}')
+                        cached = cache.get(key) if key is not None else None
+                        if cached is not None:
+                            value = cached[0]
+                            if stage.cache_valid is None or stage.cache_valid(value):
+                                finish(name, CACHED, split(stage, value))
+                                continue
+                            cache.discard(key)
+
+                    result.started[name] = time.monotonic() - start
+                    try:
+                        future = self._submit(stage, args, threads, process_pool, governor)
+                    except Exception as e:
+                        future = Future()
+                        future.set_exception(e)
+                    running[future] = (name, key)
+
+                if not running:
+                    if remaining:
+                        # 剩余阶段的输入永远不会就绪（检查已经排除了这种情况，这里只是防御）
+                        for name in list(remaining):
+                            finish(name, SKIPPED, error='输入没有就绪')
+                        remaining.clear()
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, key = running.pop(future)
+                    stage = self.stages[name]
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        if stage.optional:
+                            logger.warning(f'[{self.name}] 阶段{name}失败，使用默认值: {str(e)}')
+                            finish(name, FALLBACK, split(stage, stage.default), str(e))
+                        else:
+                            logger.error(f'[{self.name}] 阶段{name}失败: {str(e)}')
+                            finish(name, FAILED, error=str(e))
+                        continue
+                    if key is not None:
+                        cache.put(key, (value,))
+                    finish(name, OK, split(stage, value))
+
+        result.wall_time = time.monotonic() - start
+        logger.info(f'[{self.name}] {result.summary()}')
+        return result
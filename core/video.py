@@ -0,0 +1,236 @@
+import os
+import json
+import uuid
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, BinaryIO
+
+# 永久视频素材的限制
+MAX_VIDEO_SIZE_MB = 10
+MAX_VIDEO_DURATION = 600  # 秒
+
+VIDEO_EXTENSIONS = ('.mp4',)
+
+# 需要进入查找子box的容器
+_CONTAINER_BOXES = {b'moov', b'trak', b'mdia'}
+
+# 多个线程可能同时写同一个缓存文件
+_cache_lock = threading.Lock()
+
+
+def _iter_boxes(f: BinaryIO, start: int, end: int):
+    """遍历[start, end)范围内的box，返回(类型, 内容起始位置, 内容结束位置)，只读取box头"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:  # 64位长度
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:  # 一直到文件末尾
+            size = end - pos
+        if size < header_size:
+            raise Exception(f'MP4文件结构错误: box {box_type!r} 长度为{size}')
+        yield box_type, pos + header_size, min(pos + size, end)
+        pos += size
+
+
+def read_mp4_info(path: str) -> Dict:
+    """只解析MP4的box头和moov中的mvhd/tkhd，得到时长和分辨率，不读取媒体数据
+
+    Args:
+        path: 视频文件路径
+
+    Returns:
+        Dict: size（字节）、duration（秒）、width、height
+    """
+    size = os.path.getsize(path)
+    info = {'size': size, 'duration': None, 'width': None, 'height': None}
+    with open(path, 'rb') as f:
+        def walk(start, end):
+            for box_type, body_start, body_end in _iter_boxes(f, start, end):
+                if box_type in _CONTAINER_BOXES:
+                    walk(body_start, body_end)
+                elif box_type == b'mvhd':
+                    f.seek(body_start)
+                    version = f.read(1)[0]
+                    f.seek(body_start + 4)
+                    if version == 1:
+                        _, _, timescale, duration = struct.unpack('>QQIQ', f.read(28))
+                    else:
+                        _, _, timescale, duration = struct.unpack('>IIII', f.read(16))
+                    if timescale:
+                        info['duration'] = duration / timescale
+                elif box_type == b'tkhd' and not info['width']:
+                    # 宽高是tkhd最后8个字节中的16.16定点数，音频轨道为0
+                    f.seek(body_end - 8)
+                    width, height = struct.unpack('>II', f.read(8))
+                    if width and height:
+                        info['width'], info['height'] = width >> 16, height >> 16
+
+        walk(0, size)
+    if info['duration'] is None:
+        raise Exception(f'不是有效的MP4文件（缺少moov/mvhd）: {path}')
+    return info
+
+
+def check_video(path: str, max_size_mb: float = MAX_VIDEO_SIZE_MB,
+                max_duration: float = MAX_VIDEO_DURATION) -> Dict:
+    """检查视频是否符合永久素材的大小和时长限制，不符合时抛出异常
+
+    Returns:
+        Dict: 视频信息
+    """
+    info = read_mp4_info(path)
+    size_mb = info['size'] / (1024 * 1024)
+    if size_mb > max_size_mb:
+        raise Exception(f'视频大小（{size_mb:.2f}MB）超过{max_size_mb}MB限制')
+    if info['duration'] > max_duration:
+        raise Exception(f'视频时长（{info["duration"]:.0f}秒）超过{max_duration}秒限制')
+    return info
+
+
+class MultipartFileStream:
+    def __init__(self, field: str, file_path: str, content_type: str = 'application/octet-stream',
+                 fields: Optional[Dict[str, str]] = None, chunk_size: int = 64 * 1024):
+        """以流的方式生成multipart/form-data请求体，文件内容按块从磁盘读取
+
+        实现了read和__len__，requests会带上Content-Length并分块发送，内存占用与文件大小无关。
+
+        Args:
+            field: 文件字段名
+            file_path: 文件路径
+            content_type: 文件的MIME类型
+            fields: 额外的普通表单字段
+            chunk_size: 每次读取的字节数
+        """
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.chunk_size = chunk_size
+        parts = []
+        for name, value in (fields or {}).items():
+            parts.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                         f'{value}\r\n'.encode('utf-8'))
+        filename = os.path.basename(file_path)
+        parts.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                     f'filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n'.encode('utf-8'))
+        self._head = b''.join(parts)
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self._file = open(file_path, 'rb')
+        self._length = len(self._head) + os.path.getsize(file_path) + len(self._tail)
+        self._stage = 0
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.chunk_size
+        while self._stage < 3:
+            if self._stage == 0:
+                self._stage = 1
+                return self._head
+            if self._stage == 1:
+                chunk = self._file.read(size)
+                if chunk:
+                    return chunk
+                self._file.close()
+                self._stage = 2
+            if self._stage == 2:
+                self._stage = 3
+                return self._tail
+        return b''
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+
+class VideoMediaCache:
+    def __init__(self, path: str):
+        """按视频内容哈希缓存已上传的永久素材media_id，同一个视频只上传一次
+
+        Args:
+            path: 缓存文件路径
+        """
+        self.path = path
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, sha256: str) -> Optional[str]:
+        with _cache_lock:
+            entry = self._load().get(sha256)
+        return entry['media_id'] if entry else None
+
+    def put(self, sha256: str, media_id: str, source_path: str):
+        with _cache_lock:
+            cache = self._load()
+            cache[sha256] = {'media_id': media_id, 'path': source_path, 'uploaded_at': time.time()}
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+def find_videos(directory: str) -> List[str]:
+    """目录中的视频文件"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for f in sorted(files):
+            if f.lower().endswith(VIDEO_EXTENSIONS):
+                paths.append(os.path.join(root, f))
+    return paths
+
+
+def video_cover_for(account, directory: str) -> Optional[str]:
+    """没有图片的视频目录使用的封面图片（账号配置video_cover_path），目录中没有视频或未配置时返回None"""
+    cover = account.settings.get('video_cover_path')
+    if cover and os.path.exists(cover) and find_videos(directory):
+        return cover
+    return None
+
+
+def upload_video(wechat, account, path: str, title: str = '') -> str:
+    """检查并上传视频为永久素材，内容相同的视频直接使用缓存的media_id
+
+    Args:
+        wechat: WeChatArticle实例
+        account: 发布账号
+        path: 视频路径
+        title: 视频标题
+
+    Returns:
+        str: 视频素材的media_id
+    """
+    from core.content_hash import hash_file
+
+    sha256 = hash_file(path)
+    cache = VideoMediaCache(account.video_cache_file)
+    media_id = cache.get(sha256)
+    if media_id:
+        return media_id
+    check_video(path)
+    result = wechat.upload_permanent_material(path, 'video', description={
+        'title': title or os.path.splitext(os.path.basename(path))[0][:30],
+        'introduction': title,
+    })
+    cache.put(sha256, result['media_id'], path)
+    return result['media_id']
+
@@ -1,21 +1,90 @@
+import re
 import json
 import time
 import os
-import requests
-from typing import List, Dict, Union, Optional
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Dict, Union, Optional, Callable
+
+from core.adaptive_limit import AdaptiveLimiter, classify_result, THROTTLED, ERROR
+from core.event_server import EventHub, publish_key, mass_key
+from core.video import MultipartFileStream, MAX_VIDEO_SIZE_MB
+from core.article_template import check_content_size
+
+PUBLISH_STATUS_DESC = {
+    0: '发布成功',
+    1: '发布中',
+    2: '原创失败',
+    3: '常规失败',
+    4: '平台审核不通过',
+    5: '成功后用户删除所有文章',
+    6: '成功后系统封禁所有文章'
+}
+
+# 正文中引用本地文件的图片，publish_article会先上传再替换为微信图片URL
+_IMG_SRC_RE = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]+)(")', re.IGNORECASE)
+
+PUBLISH_MODES = ('publish', 'mass', 'draft')
 
 class WeChatArticle:
-    def __init__(self, appid: str, appsecret: str):
+    def __init__(self, appid: str, appsecret: str, session: Optional['requests.Session'] = None,
+                 token_cache_path: Optional[str] = None, encode_pool: Optional[Executor] = None,
+                 derivatives=None, upload_limiter: Optional[AdaptiveLimiter] = None):
         """初始化微信公众号文章发布器
 
         Args:
             appid: 微信公众号的AppID
             appsecret: 微信公众号的AppSecret
+            session: 共享的HTTP会话（连接池），为None时创建独立会话
+            token_cache_path: access_token缓存文件路径，为None时只缓存在内存中
+            encode_pool: 共享的图片编码进程池，为None时在当前进程内编码
+            derivatives: 衍生图缓存（DerivativeCache），提供时正文图片直接使用缓存中的衍生图
+            upload_limiter: 上传接口的自适应并发上限，为None时使用默认参数
         """
         self.appid = appid
         self.appsecret = appsecret
+        if session is None:
+            # requests只在真正调用接口时才导入，不影响命令行的启动速度
+            import requests
+            session = requests.Session()
+        self.session = session
+        self.token_cache_path = token_cache_path
+        self.encode_pool = encode_pool
+        self.derivatives = derivatives
+        # 所有上传请求（多个线程共用同一实例）都要先取得名额，并发数随接口的响应情况调整
+        self.upload_limiter = upload_limiter or AdaptiveLimiter()
         self.access_token = None
         self.token_expires = 0
+        # 多个线程同时发现token过期时只刷新一次
+        self._token_lock = threading.Lock()
+        self._load_token_cache()
+
+    def _load_token_cache(self):
+        """从缓存文件读取access_token，避免每次启动都重新获取"""
+        if not self.token_cache_path or not os.path.exists(self.token_cache_path):
+            return
+        try:
+            with open(self.token_cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        if cache.get('appid') == self.appid:
+            self.access_token = cache.get('access_token')
+            self.token_expires = cache.get('expires_at', 0)
+
+    def _save_token_cache(self):
+        """写入access_token缓存文件（先写临时文件再替换）"""
+        if not self.token_cache_path:
+            return
+        os.makedirs(os.path.dirname(self.token_cache_path) or '.', exist_ok=True)
+        tmp_path = self.token_cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'appid': self.appid,
+                'access_token': self.access_token,
+                'expires_at': self.token_expires
+            }, f)
+        os.replace(tmp_path, self.token_cache_path)
 
     def _get_access_token(self) -> str:
         """获取或刷新access_token
@@ -26,16 +95,25 @@ class WeChatArticle:
         if self.access_token and time.time() < self.token_expires - 300:  # 提前5分钟刷新
             return self.access_token
 
-        url = f'https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={self.appid}&secret={self.appsecret}'
-        response = requests.get(url)
-        result = response.json()
+        with self._token_lock:
+            if self.access_token and time.time() < self.token_expires - 300:
+                return self.access_token
 
-        if 'access_token' in result:
-            self.access_token = result['access_token']
-            self.token_expires = time.time() + result['expires_in']
-            return self.access_token
-        else:
-            raise Exception(f'获取access_token失败: {result}')
+            url = f'https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={self.appid}&secret={self.appsecret}'
+            response = self.session.get(url)
+            result = response.json()
+
+            if 'access_token' in result:
+                self.access_token = result['access_token']
+                self.token_expires = time.time() + result['expires_in']
+                self._save_token_cache()
+                return self.access_token
+            else:
+                raise Exception(f'获取access_token失败: {result}')
+
+    def warm_up(self) -> str:
+        """提前获取access_token，与其它准备工作同时进行，之后的接口调用不再等待"""
+        return self._get_access_token()
 
     def upload_image(self, image_path: str, type: str = 'image') -> str:
         """上传图片素材
@@ -57,8 +135,7 @@ class WeChatArticle:
         url = f'https://api.weixin.qq.com/cgi-bin/media/upload?access_token={self._get_access_token()}&type={type}'
         with open(image_path, 'rb') as f:
             files = {'media': f}
-            response = requests.post(url, files=files)
-            result = response.json()
+            result = self._upload(url, files=files)
             print(result)
 
             if 'media_id' in result:
@@ -68,43 +145,41 @@ class WeChatArticle:
             else:
                 raise Exception(f'上传图片失败: {result}')
 
-    def upload_article_image(self, image_path: str) -> str:
+    def upload_article_image(self, image_path: str, profile: str = 'article') -> str:
         """上传图文消息内的图片获取URL
 
         Args:
             image_path: 图片文件路径
+            profile: 使用的衍生图规格，article为单栏宽度，column为两栏宽度（需要衍生图缓存）
 
         Returns:
             str: 图片URL
         """
-        # 压缩图片
-        from PIL import Image
-        import io
-
-        # 读取原始图片
-        with Image.open(image_path) as img:
-            # 计算新的分辨率（保持宽高比，最大宽度为1920像素）
-            max_width = 1920
-            if img.width > max_width:
-                ratio = max_width / img.width
-                new_size = (max_width, int(img.height * ratio))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-            # 将图片转换为JPEG格式并压缩
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=85, optimize=True)
-            output.seek(0)
-
-            # 上传压缩后的图片
-            url = f'https://api.weixin.qq.com/cgi-bin/media/uploadimg?access_token={self._get_access_token()}'
-            files = {'media': ('image.jpg', output, 'image/jpeg')}
-            response = requests.post(url, files=files)
-            result = response.json()
+        if self.derivatives is not None:
+            # 缓存命中时只读取文件；没有命中时解码一次原图生成全部规格
+            from core.derivatives import read_derivative
+            encode, args = read_derivative, (self.derivatives, image_path, profile)
+        else:
+            from core.compress_image import encode_article_image
+            encode, args = encode_article_image, (image_path,)
 
-            if 'url' in result:
-                return result['url']
-            else:
-                raise Exception(f'上传文章图片失败: {result}')
+        # 压缩图片（配置了共享进程池时在池中编码，避免阻塞上传线程）；按文件头估计解码占用的内存，
+        # 超出内存预算时等待其它图片处理完成
+        from core.memory_governor import get_memory_governor, decoded_footprint
+
+        max_width = self.derivatives.decode_width if self.derivatives is not None else None
+        data = get_memory_governor().submit(self.encode_pool, decoded_footprint(image_path, max_width),
+                                            encode, *args).result()
+
+        # 上传压缩后的图片
+        url = f'https://api.weixin.qq.com/cgi-bin/media/uploadimg?access_token={self._get_access_token()}'
+        files = {'media': ('image.jpg', data, 'image/jpeg')}
+        result = self._upload(url, files=files)
+
+        if 'url' in result:
+            return result['url']
+        else:
+            raise Exception(f'上传文章图片失败: {result}')
 
     def create_draft(self, articles: List[Dict]) -> str:
         """创建草稿
@@ -115,6 +190,10 @@ class WeChatArticle:
         Returns:
             str: 草稿的media_id
         """
+        # 正文超过接口限制时直接报错，不浪费一次接口调用
+        for article in articles:
+            check_content_size(article.get('content', ''))
+
         url = f'https://api.weixin.qq.com/cgi-bin/draft/add?access_token={self._get_access_token()}'
         data = {
             'articles': articles
@@ -122,7 +201,7 @@ class WeChatArticle:
         # 使用ensure_ascii=False确保中文字符不会被转义为Unicode编码
         json_data = json.dumps(data, ensure_ascii=False)
         headers = {'Content-Type': 'application/json; charset=utf-8'}
-        response = requests.post(url, data=json_data.encode('utf-8'), headers=headers)
+        response = self.session.post(url, data=json_data.encode('utf-8'), headers=headers)
         result = response.json()
 
         if 'media_id' in result:
@@ -143,7 +222,7 @@ class WeChatArticle:
         data = {
             'media_id': media_id
         }
-        response = requests.post(url, json=data)
+        response = self.session.post(url, json=data)
         result = response.json()
 
         if result.get('errcode') == 0:
@@ -164,53 +243,97 @@ class WeChatArticle:
         data = {
             'publish_id': publish_id
         }
-        response = requests.post(url, json=data)
+        response = self.session.post(url, json=data)
         result = response.json()
 
-        status_map = {
-            0: '发布成功',
-            1: '发布中',
-            2: '原创失败',
-            3: '常规失败',
-            4: '平台审核不通过',
-            5: '成功后用户删除所有文章',
-            6: '成功后系统封禁所有文章'
-        }
-
         if 'publish_status' in result:
-            result['status_desc'] = status_map.get(result['publish_status'], '未知状态')
+            result['status_desc'] = PUBLISH_STATUS_DESC.get(result['publish_status'], '未知状态')
             return result
         else:
             raise Exception(f'获取发布状态失败: {result}')
 
-    def wait_for_publish(self, publish_id: str, timeout: int = 300, interval: int = 5) -> Dict:
-        """等待发布完成
+    def _wait_for_completion(self, key: str, poll: Callable[[], Dict], is_done: Callable[[Dict], bool],
+                             timeout: float, interval: float, max_interval: float,
+                             event_hub: Optional[EventHub]) -> Dict:
+        """等待异步任务完成：优先等待推送事件，轮询接口只作为收不到事件时的补充
+
+        有事件中转时每隔max_interval才查询一次接口；没有时从interval开始轮询，间隔指数增长。
 
         Args:
-            publish_id: 发布任务的ID
+            key: 事件键
+            poll: 查询状态的函数
+            is_done: 判断状态是否为最终状态
             timeout: 超时时间（秒）
-            interval: 轮询间隔（秒）
+            interval: 初始轮询间隔（秒）
+            max_interval: 最大轮询间隔（秒）
+            event_hub: 推送事件中转，为None时只轮询
 
         Returns:
-            Dict: 最终的发布状态信息
+            Dict: 最终状态
         """
-        start_time = time.time()
-        while True:
-            if time.time() - start_time > timeout:
-                raise Exception('发布等待超时')
+        deadline = time.time() + timeout
+        future = event_hub.expect(key) if event_hub is not None else None
+        if future is not None:
+            # 事件通常在任务完成时就会到达，查询只是兜底，不需要在前几秒密集调用接口
+            interval = max_interval
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Exception(f'等待超时: {key}')
+                wait = min(interval, remaining)
+
+                if future is not None:
+                    try:
+                        return future.result(timeout=wait)
+                    except FutureTimeout:
+                        pass
+                else:
+                    time.sleep(wait)
+
+                status = poll()
+                if is_done(status):
+                    return status
+                interval = min(interval * 2, max_interval)
+        finally:
+            if event_hub is not None:
+                event_hub.discard(key)
+
+    def wait_for_publish(self, publish_id: str, timeout: int = 300, interval: int = 5,
+                         max_interval: int = 60, event_hub: Optional[EventHub] = None) -> Dict:
+        """等待发布完成
 
-            status = self.get_publish_status(publish_id)
-            if status['publish_status'] != 1:  # 不是发布中状态
-                return status
+        配置了event_hub时优先使用PUBLISHJOBFINISH推送事件，轮询作为兜底。
 
-            time.sleep(interval)
+        Args:
+            publish_id: 发布任务的ID
+            timeout: 超时时间（秒）
+            interval: 初始轮询间隔（秒）
+            max_interval: 最大轮询间隔（秒）
+            event_hub: 推送事件中转
 
-    def upload_permanent_material(self, file_path: str, type: str = 'image') -> Dict:
+        Returns:
+            Dict: 最终的发布状态信息
+        """
+        status = self._wait_for_completion(
+            publish_key(publish_id, self.appid),
+            poll=lambda: self.get_publish_status(publish_id),
+            is_done=lambda s: s['publish_status'] != 1,  # 不是发布中状态
+            timeout=timeout, interval=interval, max_interval=max_interval, event_hub=event_hub
+        )
+        status.setdefault('status_desc', PUBLISH_STATUS_DESC.get(status['publish_status'], '未知状态'))
+        return status
+
+    def upload_permanent_material(self, file_path: str, type: str = 'image',
+                                  description: Optional[Dict] = None) -> Dict:
         """上传永久素材
 
+        请求体按块从磁盘读取，上传视频等大文件时不会把整个文件读入内存。
+
         Args:
             file_path: 文件路径
             type: 素材类型，可选值：image（图片）、voice（语音）、video（视频）、thumb（缩略图）
+            description: 视频素材的描述，包含title和introduction
 
         Returns:
             Dict: 包含上传结果的字典，永久图片素材会返回url
@@ -223,19 +346,26 @@ class WeChatArticle:
             raise Exception(f'图片大小（{file_size:.2f}MB）超过10MB限制')
         elif type == 'voice' and file_size > 2:  # 语音限制2MB
             raise Exception(f'语音大小（{file_size:.2f}MB）超过2MB限制')
-        elif type == 'video' and file_size > 10:  # 视频限制10MB
-            raise Exception(f'视频大小（{file_size:.2f}MB）超过10MB限制')
+        elif type == 'video' and file_size > MAX_VIDEO_SIZE_MB:  # 视频限制10MB
+            raise Exception(f'视频大小（{file_size:.2f}MB）超过{MAX_VIDEO_SIZE_MB}MB限制')
+
+        fields = {}
+        if type == 'video':
+            description = description or {'title': os.path.splitext(os.path.basename(file_path))[0], 'introduction': ''}
+            fields['description'] = json.dumps(description, ensure_ascii=False)
+        content_type = 'video/mp4' if type == 'video' else 'application/octet-stream'
 
         url = f'https://api.weixin.qq.com/cgi-bin/material/add_material?access_token={self._get_access_token()}&type={type}'
-        with open(file_path, 'rb') as f:
-            files = {'media': f}
-            response = requests.post(url, files=files)
-            result = response.json()
+        body = MultipartFileStream('media', file_path, content_type, fields)
+        try:
+            result = self._upload(url, data=body, headers={'Content-Type': body.content_type})
+        finally:
+            body.close()
 
-            if 'media_id' in result:
-                return result
-            else:
-                raise Exception(f'上传永久素材失败: {result}')
+        if 'media_id' in result:
+            return result
+        else:
+            raise Exception(f'上传永久素材失败: {result}')
 
     def send_mass_message(self, media_id: str, send_ignore_reprint: int = 0, is_to_all: bool = True, tag_id: Optional[int] = None) -> Dict:
         """群发图文消息
@@ -264,7 +394,7 @@ class WeChatArticle:
             'msgtype': 'mpnews',
             'send_ignore_reprint': send_ignore_reprint
         }
-        response = requests.post(url, json=data)
+        response = self.session.post(url, json=data)
         result = response.json()
 
         if result.get('errcode') == 0:
@@ -272,27 +402,172 @@ class WeChatArticle:
         else:
             raise Exception(f'群发消息失败: {result}')
 
-    def get_mass_status(self, msg_id: str) -> Dict:
-        """查询群发消息发送状态
+    def query_mass_status(self, msg_id: str) -> Dict:
+        """查询群发消息发送状态，发送中或发送失败时不抛出异常
 
         Args:
             msg_id: 群发消息的msg_id
 
         Returns:
-            Dict: 群发状态信息
+            Dict: 群发状态信息，msg_status为SEND_SUCCESS、SENDING、SEND_FAIL或DELETE
         """
         url = f'https://api.weixin.qq.com/cgi-bin/message/mass/get?access_token={self._get_access_token()}'
         data = {
             'msg_id': msg_id
         }
-        response = requests.post(url, json=data)
+        response = self.session.post(url, json=data)
         result = response.json()
 
+        if 'msg_status' in result:
+            return result
+        else:
+            raise Exception(f'查询群发状态失败: {result}')
+
+    def get_mass_status(self, msg_id: str) -> Dict:
+        """查询群发消息发送状态
+
+        Args:
+            msg_id: 群发消息的msg_id
+
+        Returns:
+            Dict: 群发状态信息
+        """
+        result = self.query_mass_status(msg_id)
+
         if result.get('msg_status') == 'SEND_SUCCESS':
             return result
         else:
             raise Exception(f'查询群发状态失败: {result}')
 
+    def wait_for_mass_send(self, msg_id: str, timeout: int = 600, interval: int = 5,
+                           max_interval: int = 60, event_hub: Optional[EventHub] = None) -> Dict:
+        """等待群发完成
+
+        配置了event_hub时优先使用MASSSENDJOBFINISH推送事件，轮询作为兜底。
+
+        Args:
+            msg_id: 群发消息的msg_id
+            timeout: 超时时间（秒）
+            interval: 初始轮询间隔（秒）
+            max_interval: 最大轮询间隔（秒）
+            event_hub: 推送事件中转
+
+        Returns:
+            Dict: 群发成功时的状态信息
+        """
+        status = self._wait_for_completion(
+            mass_key(msg_id, self.appid),
+            poll=lambda: self.query_mass_status(msg_id),
+            is_done=lambda s: s.get('msg_status') != 'SENDING',
+            timeout=timeout, interval=interval, max_interval=max_interval, event_hub=event_hub
+        )
+        if status.get('msg_status') != 'SEND_SUCCESS':
+            raise Exception(f'群发失败: {status}')
+        return status
+
+    def _local_images(self, content: str) -> List[str]:
+        return [src for _, src, _ in _IMG_SRC_RE.findall(content)
+                if not src.startswith(('http://', 'https://', '//')) and os.path.isfile(src)]
+
+    def publish_article(self, articles: List[Dict], mode: str = 'publish', send_ignore_reprint: int = 0,
+                        is_to_all: bool = True, tag_id: Optional[int] = None, timeout: int = 600,
+                        event_hub: Optional[EventHub] = None) -> Dict:
+        """上传素材、创建草稿、发布或群发并等待完成
+
+        文章的thumb_path（本地封面图片，上传为永久缩略图素材）和正文中src为本地文件路径的图片会先并行上传，
+        同时进行的请求数由upload_limiter控制，同一个文件只上传一次。等待完成时优先使用推送事件，
+        没有收到事件时按指数增长的间隔轮询。
+
+        Args:
+            articles: 图文消息列表，可以用thumb_path代替thumb_media_id
+            mode: publish为发布（freepublish），mass为群发，draft为只创建草稿
+            send_ignore_reprint: 群发时被判定为转载是否继续群发
+            is_to_all: 群发时是否发送给全部用户
+            tag_id: 群发到的标签
+            timeout: 等待发布或群发完成的超时时间（秒）
+            event_hub: 推送事件中转，默认为当前进程中回调服务的事件中转
+
+        Returns:
+            Dict: media_id、mode、publish_id或msg_id、status（最终状态）、articles（每篇文章的title和url，
+            群发和只创建草稿时url为None）、uploads（上传的图片和封面数）、timings（各阶段耗时，秒）
+        """
+        if mode not in PUBLISH_MODES:
+            raise Exception(f'未知的发布方式: {mode}')
+        if event_hub is None:
+            from core.event_server import get_running_hub
+            event_hub = get_running_hub()
+
+        timings = {}
+        start = time.time()
+
+        # 收集需要上传的本地文件，去重后并行上传
+        thumbs = {a['thumb_path'] for a in articles if a.get('thumb_path')}
+        images = {src for a in articles for src in self._local_images(a.get('content', ''))}
+        uploaded = {}
+        if thumbs or images:
+            with ThreadPoolExecutor(max_workers=max(1, min(len(thumbs) + len(images),
+                                                           self.upload_limiter.max_limit))) as executor:
+                futures = {('thumb', path): executor.submit(self.upload_permanent_material, path, 'thumb')
+                           for path in thumbs}
+                futures.update({('image', path): executor.submit(self.upload_article_image, path)
+                                for path in images})
+                errors = []
+                for (kind, path), future in futures.items():
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(f'{path}: {str(e)}')
+                        continue
+                    uploaded[(kind, path)] = result['media_id'] if kind == 'thumb' else result
+            if errors:
+                raise Exception(f'上传文章素材失败: {"; ".join(errors)}')
+        timings['upload'] = round(time.time() - start, 2)
+
+        payload = []
+        for article in articles:
+            article = dict(article)
+            thumb_path = article.pop('thumb_path', None)
+            if thumb_path:
+                article['thumb_media_id'] = uploaded[('thumb', thumb_path)]
+            if not article.get('thumb_media_id'):
+                raise Exception(f'文章缺少封面: {article.get("title")}')
+            if article.get('content'):
+                article['content'] = _IMG_SRC_RE.sub(
+                    lambda m: m.group(1) + uploaded.get(('image', m.group(2)), m.group(2)) + m.group(3),
+                    article['content'])
+            payload.append(article)
+
+        step = time.time()
+        media_id = self.create_draft(payload)
+        timings['draft'] = round(time.time() - step, 2)
+        result = {
+            'media_id': media_id,
+            'mode': mode,
+            'status': None,
+            'articles': [{'title': a.get('title'), 'url': None} for a in payload],
+            'uploads': {'images': len(images), 'thumbs': len(thumbs)},
+            'timings': timings,
+        }
+
+        step = time.time()
+        if mode == 'publish':
+            result['publish_id'] = self.publish_draft(media_id)
+            status = self.wait_for_publish(result['publish_id'], timeout=timeout, event_hub=event_hub)
+            result['status'] = status
+            if status['publish_status'] != 0:
+                raise Exception(f'发布失败: {status["status_desc"]}')
+            items = status.get('article_detail', {}).get('item', [])
+            for entry, item in zip(result['articles'], sorted(items, key=lambda i: i.get('idx', 0))):
+                entry['url'] = item.get('article_url')
+        elif mode == 'mass':
+            sent = self.send_mass_message(media_id, send_ignore_reprint=send_ignore_reprint,
+                                          is_to_all=is_to_all, tag_id=tag_id)
+            result['msg_id'] = sent['msg_id']
+            result['status'] = self.wait_for_mass_send(sent['msg_id'], timeout=timeout, event_hub=event_hub)
+        timings['publish'] = round(time.time() - step, 2)
+        timings['total'] = round(time.time() - start, 2)
+        return result
+
     def delete_mass_message(self, msg_id: str, article_idx: Optional[int] = None) -> Dict:
         """删除群发消息
 
@@ -308,10 +583,125 @@ class WeChatArticle:
             'msg_id': msg_id,
             'article_idx': article_idx if article_idx else 0
         }
-        response = requests.post(url, json=data)
+        response = self.session.post(url, json=data)
+        result = response.json()
+
+        if result.get('errcode') == 0:
+            return result
+        else:
+            raise Exception(f'删除群发消息失败: {result}')
+
+    def _upload(self, url: str, **kwargs) -> Dict:
+        """在自适应并发上限内发送上传请求，按耗时和错误码调整上限
+
+        Returns:
+            Dict: 接口返回的JSON
+        """
+        from requests.exceptions import Timeout, ConnectionError
+
+        token = self.upload_limiter.acquire()
+        outcome = ERROR
+        try:
+            result = self.session.post(url, **kwargs).json()
+            outcome = classify_result(result)
+            return result
+        except (Timeout, ConnectionError):
+            outcome = THROTTLED
+            raise
+        finally:
+            self.upload_limiter.release(token, outcome)
+
+    def _post_json(self, url: str, data: Dict) -> Dict:
+        """发送JSON请求，返回的中文内容按UTF-8解码"""
+        response = self.session.post(url, data=json.dumps(data, ensure_ascii=False).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json; charset=utf-8'})
+        return json.loads(response.content.decode('utf-8'))
+
+    def get_material_count(self) -> Dict:
+        """获取永久素材总数
+
+        Returns:
+            Dict: voice_count、video_count、image_count、news_count
+        """
+        url = f'https://api.weixin.qq.com/cgi-bin/material/get_materialcount?access_token={self._get_access_token()}'
+        result = self.session.get(url).json()
+
+        if 'image_count' in result:
+            return result
+        else:
+            raise Exception(f'获取素材总数失败: {result}')
+
+    def batchget_material(self, type: str = 'image', offset: int = 0, count: int = 20) -> Dict:
+        """分页获取永久素材列表，按更新时间从新到旧排列
+
+        Args:
+            type: 素材类型，可选值：image、video、voice（缩略图包含在image中）
+            offset: 从第几个素材开始
+            count: 返回的素材数量，取值1到20
+
+        Returns:
+            Dict: total_count、item_count和item列表（media_id、name、update_time、url）
+        """
+        url = f'https://api.weixin.qq.com/cgi-bin/material/batchget_material?access_token={self._get_access_token()}'
+        result = self._post_json(url, {'type': type, 'offset': offset, 'count': count})
+
+        if 'item' in result:
+            return result
+        else:
+            raise Exception(f'获取素材列表失败: {result}')
+
+    def delete_material(self, media_id: str) -> Dict:
+        """删除永久素材
+
+        Args:
+            media_id: 要删除的素材的media_id
+
+        Returns:
+            Dict: 删除结果
+        """
+        url = f'https://api.weixin.qq.com/cgi-bin/material/del_material?access_token={self._get_access_token()}'
+        response = self.session.post(url, json={'media_id': media_id})
         result = response.json()
 
         if result.get('errcode') == 0:
             return result
         else:
-            raise Exception(f'删除群发消息失败: {result}')
\ No newline at end of file
+            raise Exception(f'删除永久素材失败: {result}')
+
+    def batchget_draft(self, offset: int = 0, count: int = 20, no_content: bool = False) -> Dict:
+        """分页获取草稿列表，按更新时间从新到旧排列
+
+        Args:
+            offset: 从第几个草稿开始
+            count: 返回的草稿数量，取值1到20
+            no_content: 为True时不返回正文
+
+        Returns:
+            Dict: total_count、item_count和item列表（media_id、content.news_item、update_time）
+        """
+        url = f'https://api.weixin.qq.com/cgi-bin/draft/batchget?access_token={self._get_access_token()}'
+        result = self._post_json(url, {'offset': offset, 'count': count, 'no_content': int(no_content)})
+
+        if 'item' in result:
+            return result
+        else:
+            raise Exception(f'获取草稿列表失败: {result}')
+
+    def batchget_published(self, offset: int = 0, count: int = 20, no_content: bool = False) -> Dict:
+        """分页获取已发布的文章列表，按更新时间从新到旧排列
+
+        Args:
+            offset: 从第几篇开始
+            count: 返回的数量，取值1到20
+            no_content: 为True时不返回正文
+
+        Returns:
+            Dict: total_count、item_count和item列表（article_id、content.news_item、update_time）
+        """
+        url = f'https://api.weixin.qq.com/cgi-bin/freepublish/batchget?access_token={self._get_access_token()}'
+        result = self._post_json(url, {'offset': offset, 'count': count, 'no_content': int(no_content)})
+
+        if 'item' in result:
+            return result
+        else:
+            raise Exception(f'获取已发布文章列表失败: {result}')
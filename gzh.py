@@ -0,0 +1,10 @@
+import os
+import sys
+
+# 添加项目根目录到系统路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import os
+import sys
+import argparse
+import logging
+import multiprocessing
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+# 导入核心模块
+from core.accounts import load_config, load_accounts
+from core.job_queue import JobQueue, run_worker
+from core.log import setup_logging_from_config
+from core.memory_governor import get_memory_governor, total_memory, DEFAULT_BUDGET_FRACTION
+from core.publish_jobs import PublishJobs
+
+logger = logging.getLogger(__name__)
+
+WORKER_LOG_FORMAT = '%(asctime)s - %(process)d - %(levelname)s - %(context)s%(message)s'
+
+def get_queue(config: dict) -> JobQueue:
+    """根据配置打开任务队列"""
+    db_path = config.get('job_queue_path', os.path.join(root_dir, 'data', 'jobs.db'))
+    return JobQueue(db_path, retry_base_delay=config.get('job_retry_delay', 10))
+
+def worker_process(visibility_timeout: float, memory_budget_mb: float = None):
+    """单个worker进程的入口"""
+    config = load_config()
+    # 每个进程分得总内存预算的一份
+    get_memory_governor(memory_budget_mb)
+    # 每个worker进程有自己的日志监听线程，多个进程轮转同一个文件会互相覆盖，文件名带上进程号
+    options = dict(config.get('logging') or {})
+    if options.get('file'):
+        base, ext = os.path.splitext(options['file'])
+        options['file'] = f'{base}.{os.getpid()}{ext}'
+    setup_logging_from_config(dict(config, logging=options), fmt=WORKER_LOG_FORMAT)
+    jobs = PublishJobs(load_accounts(config))
+    run_worker(get_queue(config), jobs.handlers(), visibility_timeout=visibility_timeout)
+
+def main():
+    parser = argparse.ArgumentParser(description='发布任务队列')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    work = subparsers.add_parser('work', help='启动worker进程')
+    work.add_argument('--workers', type=int, default=2, help='worker进程数')
+    work.add_argument('--visibility-timeout', type=float, default=300, help='任务租约时长（秒）')
+
+    enqueue = subparsers.add_parser('enqueue', help='为账号创建一次发布')
+    enqueue.add_argument('--account', help='账号名称，默认为全部账号')
+    enqueue.add_argument('--dir', help='图片目录，默认自动选择未处理的目录')
+
+    subparsers.add_parser('stats', help='查看队列状态')
+    subparsers.add_parser('dead', help='查看死信任务')
+    retry = subparsers.add_parser('retry-dead', help='重新排队死信任务')
+    retry.add_argument('ids', nargs='*', type=int, help='任务ID，默认全部')
+
+    args = parser.parse_args()
+    config = load_config()
+    setup_logging_from_config(config)
+    queue = get_queue(config)
+
+    if args.command == 'work':
+        total_mb = config.get('memory_budget_mb') or (total_memory() or 0) * DEFAULT_BUDGET_FRACTION / 1024 / 1024
+        budget_mb = total_mb / args.workers or None
+        processes = [multiprocessing.Process(target=worker_process, args=(args.visibility_timeout, budget_mb))
+                     for _ in range(args.workers)]
+        for p in processes:
+            p.start()
+        try:
+            for p in processes:
+                p.join()
+        except KeyboardInterrupt:
+            for p in processes:
+                p.terminate()
+    elif args.command == 'enqueue':
+        accounts = load_accounts(config)
+        jobs = PublishJobs(accounts)
+        names = [args.account] if args.account else [a.name for a in accounts]
+        for name in names:
+            run_id = jobs.enqueue_run(queue, name, args.dir)
+            print(f'{name}: {run_id or "没有可处理的目录"}')
+    elif args.command == 'stats':
+        for kind, counts in sorted(queue.stats().items()):
+            print(f'{kind}: ' + ', '.join(f'{status}={n}' for status, n in sorted(counts.items())))
+    elif args.command == 'dead':
+        for job in queue.dead_letters():
+            print(f'{job.id}\t{job.kind}\t{job.run_id}\t{job.last_error}')
+    elif args.command == 'retry-dead':
+        print(f'已重新排队{queue.requeue_dead(args.ids or None)}个任务')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+import os
+import sys
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+from core.cli import main
+
+# 批量处理积压目录，生成暂存草稿，等同于 python gzh.py prepare
+if __name__ == '__main__':
+    sys.exit(main(['prepare'] + sys.argv[1:]))
@@ -1,5 +1,4 @@
 import os
-import json
 import sys
 
 # 添加项目根目录到系统路径
@@ -8,38 +7,17 @@ root_dir = os.path.dirname(current_dir)
 sys.path.insert(0, root_dir)
 
 # 导入核心模块
+from core.accounts import load_config
 from core.wechat_article import WeChatArticle
 from core.check_image import check_image
 from core.compress_image import compress_image
 
-def load_config(config_path: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.json')) -> dict:
-    """加载配置文件
-
-    Args:
-        config_path: 配置文件路径
-
-    Returns:
-        dict: 配置信息
-    """
-    if not os.path.exists(config_path):
-        config = {
-            'appid': 'wx068a368be317edd0',
-            'appsecret': '5a2d58d2f0c47c44c5d5fed196f7b96d'
-        }
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        print(f'请先在{config_path}中配置公众号的appid和appsecret')
-        exit(1)
-
-    with open(config_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def create_article(wechat=None, image_paths=None):
+def create_article(image_paths=None):
     """创建示例文章
     
     Args:
-        wechat: WeChatArticle实例，用于上传图片
-        image_paths: 要上传的图片路径列表，如果为None则使用占位符URL
+        image_paths: 文章内图片的本地路径列表，发布时由publish_article上传并替换为微信图片URL；
+            如果为None则使用占位符URL
         
     Returns:
         list: 文章数据列表
@@ -47,20 +25,9 @@ def create_article(wechat=None, image_paths=None):
     # 创建500字的隐形文本（使用极小字体和透明颜色）
     invisible_text = "<p style='font-size:1px;color:rgba(255,255,255,0.01);'>" + "微信公众号文章模板" * 100 + "</p>"
     
-    # 上传图片并获取微信图片URL
-    image_urls = []
-    if wechat and image_paths:
-        print('正在上传文章内图片...')
-        for img_path in image_paths:
-            if os.path.exists(img_path):
-                try:
-                    url = wechat.upload_article_image(img_path)
-                    image_urls.append(url)
-                    print(f'图片上传成功: {url}')
-                except Exception as e:
-                    print(f'图片上传失败: {str(e)}')
+    image_urls = [p for p in (image_paths or []) if os.path.exists(p)]
     
-    # 如果没有成功上传的图片，使用占位符
+    # 如果没有可用的图片，使用占位符
     if not image_urls:
         image_urls = [
             'https://mmbiz.qpic.cn/mmbiz_jpg/placeholder1/640?wx_fmt=jpeg',
@@ -86,7 +53,7 @@ def create_article(wechat=None, image_paths=None):
         'digest': '这是文章摘要，会显示在文章列表中',
         'content': content,
         'content_source_url': 'https://example.com/source',
-        'thumb_media_id': None,  # 初始化为None，后续会更新为实际的media_id
+        'thumb_path': None,  # 封面图片路径，发布时上传为缩略图素材
         'need_open_comment': 1,
         'only_fans_can_comment': 0
     }
@@ -114,26 +81,16 @@ def main():
         thumb_path = os.path.join(root_dir, 'thumb_2.jpg')
         compress_image(cover_path, thumb_path, 64)  # 缩略图限制64KB
         
-        # 上传封面图片
-        try:
-            thumb_media_id = wechat.upload_image(thumb_path, 'thumb')
-            print(f'封面图片上传成功，media_id: {thumb_media_id}')
-        except Exception as e:
-            print(f'封面图片上传失败: {str(e)}')
-            return
-        
-        # 准备文章内图片
-        image_paths = [os.path.join(root_dir, '1.jpg'), os.path.join(root_dir, '2.jpg')]
-        
-        # 创建文章
-        articles = create_article(wechat, image_paths)
-        
-        # 设置封面图片ID
-        articles[0]['thumb_media_id'] = thumb_media_id
+        # 创建文章，文章内图片和封面在发布时并行上传
+        articles = create_article([os.path.join(root_dir, '1.jpg'), os.path.join(root_dir, '2.jpg')])
+        articles[0]['thumb_path'] = thumb_path
         
-        # 发布文章
+        # 上传图片、创建草稿并发布
         result = wechat.publish_article(articles)
-        print(f'文章发布成功: {result}')
+        print(f'草稿创建成功，media_id: {result["media_id"]}')
+        print(f'文章发布结果: {result["status"]["status_desc"]}')
+        for article in result['articles']:
+            print(f'{article["title"]}: {article["url"]}')
         
     except Exception as e:
         print(f'发布文章时出错: {str(e)}')
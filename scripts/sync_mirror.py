@@ -0,0 +1,13 @@
+import os
+import sys
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+from core.cli import main
+
+# 增量同步草稿箱和已发布文章到本地镜像，等同于 python gzh.py sync
+if __name__ == '__main__':
+    sys.exit(main(['sync'] + sys.argv[1:]))
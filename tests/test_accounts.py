@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from core.accounts import Account, AccountScheduler
+
+
+class AccountSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def account(self, name: str, quota: int) -> Account:
+        return Account(name, name, 'secret', os.path.join(self.tmp, 'imgs'), os.path.join(self.tmp, name),
+                       daily_quota=quota)
+
+    def test_only_successful_runs_consume_quota(self):
+        ok, failing, idle = self.account('ok', 2), self.account('failing', 2), self.account('idle', 2)
+        calls = {'ok': 0, 'failing': 0, 'idle': 0}
+
+        def task(account):
+            calls[account.name] += 1
+            if account.name == 'failing':
+                raise Exception('群发失败')
+            if account.name == 'idle':
+                return False
+            return True
+
+        history = AccountScheduler([ok, failing, idle]).run_all(task)
+        self.assertEqual(history, {'ok': [True, True], 'failing': [False], 'idle': [False]})
+        # 失败或没有内容的账号本次不再重试
+        self.assertEqual(calls, {'ok': 2, 'failing': 1, 'idle': 1})
+        self.assertEqual((ok.remaining_quota(), failing.remaining_quota(), idle.remaining_quota()), (0, 2, 2))
+
+    def test_failed_account_runs_again_next_time(self):
+        account = self.account('a', 1)
+        scheduler = AccountScheduler([account])
+        self.assertEqual(scheduler.run_all(lambda a: 1 / 0), {'a': [False]})
+        self.assertEqual(scheduler.run_all(lambda a: None), {'a': [True]})
+        self.assertEqual(account.remaining_quota(), 0)
+        self.assertEqual(scheduler.run_all(lambda a: None), {'a': []})
+
+    def test_rounds_rotate_start(self):
+        accounts = [self.account(n, 3) for n in ('a', 'b', 'c')]
+        order = []
+        AccountScheduler(accounts).run_all(lambda a: order.append(a.name))
+        self.assertEqual(order, ['a', 'b', 'c', 'b', 'c', 'a', 'c', 'a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+from unittest import mock
+
+from core import adaptive_limit
+from core.adaptive_limit import ERROR, OK, THROTTLED, AdaptiveLimiter, classify_result
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return 1700000000.0 + self.now
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(adaptive_limit, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, limiter: AdaptiveLimiter, outcome: str, latency: float = 0.1):
+        token = limiter.acquire()
+        self.clock.now += latency
+        limiter.release(token, outcome)
+
+    def test_increases_after_limit_successes(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=4)
+        for limit in (2, 3):
+            for _ in range(limit - 1):
+                self.request(limiter, OK)
+            self.assertEqual(limiter.limit, limit)
+            self.request(limiter, OK)
+            self.assertEqual(limiter.limit, limit + 1)
+        # 达到上限后不再增加
+        for _ in range(10):
+            self.request(limiter, OK)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_burst_of_throttles_halves_once(self):
+        limiter = AdaptiveLimiter(initial=8)
+        tokens = [limiter.acquire() for _ in range(8)]
+        self.clock.now += 0.1
+        for token in tokens:
+            limiter.release(token, THROTTLED)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.in_flight, 0)
+        # 降低之后发出的请求再被限流时继续降低
+        self.request(limiter, THROTTLED)
+        self.assertEqual(limiter.limit, 2)
+        self.request(limiter, THROTTLED)
+        self.request(limiter, THROTTLED)
+        self.assertEqual(limiter.limit, 1)
+        self.assertEqual([h['limit'] for h in limiter.history], [8, 4, 2, 1])
+
+    def test_latency_spike_lowers_limit(self):
+        limiter = AdaptiveLimiter(initial=4, max_limit=4, latency_factor=3.0)
+        for _ in range(5):
+            self.request(limiter, OK, latency=0.1)
+        self.assertAlmostEqual(limiter.baseline, 0.1)
+        self.request(limiter, OK, latency=0.29)
+        self.assertEqual(limiter.limit, 4)
+        self.request(limiter, OK, latency=0.5)
+        self.assertEqual(limiter.limit, 2)
+        self.assertIn('延迟', limiter.history[-1]['reason'])
+        # 基线缓慢跟随延迟的变化
+        self.assertGreater(limiter.baseline, 0.1)
+
+    def test_error_leaves_limit_unchanged(self):
+        limiter = AdaptiveLimiter(initial=3)
+        self.request(limiter, OK)
+        self.request(limiter, OK)
+        for _ in range(10):
+            self.request(limiter, ERROR, latency=5.0)
+        self.assertEqual(limiter.limit, 3)
+        # 错误不打断正常请求的计数
+        self.request(limiter, OK)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = AdaptiveLimiter(initial=1, min_limit=1)
+        limiter.acquire()
+        with mock.patch.object(limiter._cond, 'wait', side_effect=RuntimeError('blocked')):
+            with self.assertRaises(RuntimeError):
+                limiter.acquire()
+
+    def test_from_settings_and_classify(self):
+        limiter = AdaptiveLimiter.from_settings({'upload_concurrency': {'initial': 50, 'max': 8, 'min': 2}})
+        self.assertEqual((limiter.limit, limiter.min_limit, limiter.max_limit), (8, 2, 8))
+        self.assertEqual(classify_result({}), OK)
+        self.assertEqual(classify_result({'errcode': 45009}), THROTTLED)
+        self.assertEqual(classify_result({'errcode': 40001}), ERROR)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from core import publisher
+from core.accounts import Account
+from core.backlog import BacklogState, get_backlog_state
+
+
+def _claim_all(path, results):
+    state = BacklogState(path)
+    claimed = []
+    while True:
+        draft = state.claim_draft()
+        if draft is None:
+            break
+        claimed.append(draft['media_id'])
+    results.put(claimed)
+
+
+class FakeWeChat:
+    def __init__(self, fail_send: bool = False):
+        self.fail_send = fail_send
+        self.sent = []
+
+    def send_mass_message(self, media_id, **kwargs):
+        if self.fail_send:
+            raise Exception('群发失败')
+        self.sent.append(media_id)
+        return {'msg_id': 7}
+
+    def wait_for_mass_send(self, msg_id, event_hub=None):
+        return {'msg_status': 'SEND_SUCCESS'}
+
+
+class BacklogStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'data', 'backlog_state.json')
+
+    def test_concurrent_processes_claim_distinct_drafts(self):
+        state = BacklogState(self.path)
+        media_ids = [f'media{i}' for i in range(40)]
+        for media_id in media_ids:
+            state.add_draft(media_id, [media_id + '_dir'])
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=_claim_all, args=(self.path, results)) for _ in range(4)]
+        for p in processes:
+            p.start()
+        claimed = [media_id for _ in processes for media_id in results.get(timeout=30)]
+        for p in processes:
+            p.join(timeout=30)
+            self.assertEqual(p.exitcode, 0)
+
+        self.assertEqual(sorted(claimed), sorted(media_ids))
+        fresh = BacklogState(self.path)
+        self.assertEqual(fresh.staged_drafts(), [])
+        self.assertEqual(len(fresh.claimed_drafts()), len(media_ids))
+
+    def test_updates_from_other_instances_are_kept(self):
+        first = BacklogState(self.path)
+        second = BacklogState(self.path)
+        first.add_draft('a', ['dir_a'])
+        second.update_dir('dir_b', article={'title': 'b'})
+        second.add_draft('b', ['dir_b'])
+        fresh = BacklogState(self.path)
+        self.assertEqual([d['media_id'] for d in fresh.drafts], ['a', 'b'])
+        self.assertEqual(fresh.dirs['dir_a']['drafted'], 'a')
+
+
+class StagedDraftSendTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.account = Account('test', 'appid', 'secret', os.path.join(self.tmp, 'imgs'),
+                               os.path.join(self.tmp, 'data'))
+        get_backlog_state(self.account).add_draft('staged', ['dir_a', 'dir_b'])
+        patcher = mock.patch.multiple(publisher, get_shared_session=mock.DEFAULT,
+                                      get_shared_encode_pool=mock.DEFAULT, get_library_index=mock.DEFAULT)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failed_send_releases_draft(self):
+        self.account._wechat = FakeWeChat(fail_send=True)
+        with self.assertRaises(Exception):
+            publisher._auto_publish(self.account)
+        state = get_backlog_state(self.account)
+        self.assertEqual([d['media_id'] for d in state.staged_drafts()], ['staged'])
+        self.assertEqual(state.claimed_drafts(), [])
+
+        # 重试时发送同一个草稿
+        wechat = FakeWeChat()
+        self.account._wechat = wechat
+        publisher._auto_publish(self.account)
+        self.assertEqual(wechat.sent, ['staged'])
+        draft = get_backlog_state(self.account).drafts[0]
+        self.assertEqual((draft['sent'], draft['msg_id']), (True, 7))
+        self.assertEqual(get_backlog_state(self.account).staged_drafts(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
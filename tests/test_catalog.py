@@ -0,0 +1,123 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from core.catalog import LibraryCatalog
+from core.image_color import COLOR_FIELDS
+from core.image_quality import passes_quality
+from core.library_index import LibraryIndex
+
+QUALITY_FIELDS = ('sharpness', 'brightness', 'dark_ratio', 'bright_ratio')
+
+THRESHOLDS = {'min_width': 500, 'min_height': 500, 'min_sharpness': 50, 'min_brightness': 0.1,
+              'max_brightness': 0.9, 'max_dark_ratio': 0.6, 'max_bright_ratio': 0.6}
+
+
+def _maybe(rng, value, missing=0.2):
+    return None if rng.random() < missing else value
+
+
+def make_records(rng: random.Random, root: str):
+    records = []
+    for d in range(8):
+        directory = os.path.join(root, f'作品{d}')
+        for i in range(rng.randint(0, 12)):
+            # 一部分图片在扫描目录的子目录中
+            parent = os.path.join(directory, 'sub') if i % 4 == 3 else directory
+            record = {'path': os.path.join(parent, f'{i:03d}.jpg'), 'dir': directory,
+                      'width': _maybe(rng, rng.randint(200, 2000)), 'height': _maybe(rng, rng.randint(200, 2000)),
+                      'dhash': _maybe(rng, rng.getrandbits(64)), 'published': int(rng.random() < 0.3),
+                      'dominant': _maybe(rng, [[rng.randint(0, 255) for _ in range(3)] + [rng.random()]
+                                               for _ in range(rng.randint(1, 3))])}
+            for name in QUALITY_FIELDS + COLOR_FIELDS:
+                record[name] = _maybe(rng, rng.uniform(0, 100) if name == 'sharpness' else rng.random())
+            records.append(record)
+    return records
+
+
+class CatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.index = LibraryIndex(os.path.join(self.tmp, 'library.db'))
+        self.index.upsert(make_records(random.Random(13), os.path.join(self.tmp, 'imgs')))
+        self.catalog = self.index.build_catalog()
+
+    def index_records(self):
+        """索引中的全部记录，顺序与快照一致"""
+        rows = self.index._conn().execute('SELECT path FROM images ORDER BY dir, path').fetchall()
+        return [self.index.get(row['path']) for row in rows]
+
+    def test_records_match_index(self):
+        expected = self.index_records()
+        self.assertEqual(len(self.catalog), len(expected))
+        for record, snapshot in zip(expected, self.catalog.records(range(len(self.catalog)))):
+            for name in ('path', 'dir', 'width', 'height', 'dhash', 'published'):
+                self.assertEqual(snapshot[name], record[name], name)
+            for name in QUALITY_FIELDS + COLOR_FIELDS:
+                if record[name] is None:
+                    self.assertIsNone(snapshot[name])
+                else:
+                    self.assertAlmostEqual(snapshot[name], record[name], places=4)
+            if record['dominant'] is None:
+                self.assertIsNone(snapshot['dominant'])
+            else:
+                np.testing.assert_allclose(snapshot['dominant'], record['dominant'], rtol=1e-6)
+
+    def test_dir_rows(self):
+        for directory in self.index.directories():
+            rows = self.catalog.dir_rows(directory)
+            self.assertEqual(sorted(self.catalog.paths(range(rows.start, rows.stop))),
+                             sorted(self.index.get_dir(directory)))
+        self.assertEqual(self.catalog.dir_rows('/不存在'), slice(0, 0))
+
+    def test_quality_and_candidates_match_index(self):
+        records = self.index_records()
+        expected = passes_quality(records, THRESHOLDS)
+        np.testing.assert_array_equal(self.catalog.quality_mask(THRESHOLDS), expected)
+        self.assertTrue(self.catalog.quality_mask(None).all())
+
+        mask = self.catalog.candidate_mask(THRESHOLDS)
+        unpublished = np.array([not r['published'] for r in records])
+        np.testing.assert_array_equal(mask, expected & unpublished)
+        counts = self.catalog.candidates_per_dir(mask)
+        for dir_id, count in enumerate(counts):
+            directory = self.catalog.dir_name(dir_id)
+            self.assertEqual(count, sum(1 for r, k in zip(records, mask) if k and r['dir'] == directory))
+
+        ratio_mask = self.catalog.candidate_mask(unpublished=False, ratio_range=(0.8, 1.2))
+        for record, keep in zip(records, ratio_mask):
+            ratio = record['width'] / record['height'] if record['width'] and record['height'] else None
+            self.assertEqual(bool(keep), ratio is not None and 0.8 <= np.float32(ratio) <= 1.2)
+
+    def test_mark_published_writes_through(self):
+        unpublished = [r['path'] for r in self.index_records() if not r['published']]
+        chosen = unpublished[::3]
+        self.assertTrue(any(os.path.basename(os.path.dirname(p)) == 'sub' for p in chosen))
+        self.index.mark_published(chosen)
+
+        # 另一个映射（例如另一个进程）读到同一个published列
+        other = LibraryCatalog(self.index.catalog_dir)
+        for snapshot in (self.catalog, other):
+            published = {r['path'] for r in snapshot.records(np.flatnonzero(snapshot.published))}
+            self.assertEqual(published, {r['path'] for r in self.index_records() if r['published']})
+            self.assertTrue(set(chosen) <= published)
+
+        self.index.release_published(chosen)
+        self.assertFalse(set(chosen) & set(other.paths(np.flatnonzero(other.published))))
+        self.assertEqual(self.catalog.mark_published(['/不存在/1.jpg']), 0)
+
+    def test_rebuild_is_remapped(self):
+        self.index.upsert([{'path': os.path.join(self.tmp, 'imgs', '新目录', '1.jpg'),
+                            'dir': os.path.join(self.tmp, 'imgs', '新目录'), 'width': 600, 'height': 800}])
+        rebuilt = self.index.build_catalog()
+        self.assertIs(self.index.catalog(), rebuilt)
+        self.assertEqual(len(rebuilt), len(self.catalog) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import hashlib
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+from core import event_server
+from core.event_server import EventHub, WeChatCallbackServer, check_signature, publish_key
+
+TOKEN = 'token123'
+APPID = 'wx123'
+
+PUBLISH_EVENT = b'''<xml>
+<ToUserName><![CDATA[gh_4d00ed8d6399]]></ToUserName>
+<FromUserName><![CDATA[oV5CrjpxgaGXNHIQigzNlgLTnwic]]></FromUserName>
+<CreateTime>1481013459</CreateTime>
+<MsgType><![CDATA[event]]></MsgType>
+<Event><![CDATA[PUBLISHJOBFINISH]]></Event>
+<PublishEventInfo>
+<publish_id>2247503051</publish_id>
+<publish_status>0</publish_status>
+<article_id><![CDATA[b5O2OUs25HBxRceL7hfReg-U9QGeq9zQjiDvyWP4Hq4]]></article_id>
+<article_detail>
+<count>1</count>
+<item>
+<idx>1</idx>
+<article_url><![CDATA[https://mp.weixin.qq.com/s/example]]></article_url>
+</item>
+</article_detail>
+</PublishEventInfo>
+</xml>'''
+
+
+def sign(token: str, timestamp: str, nonce: str) -> str:
+    return hashlib.sha1(''.join(sorted([token, timestamp, nonce])).encode('utf-8')).hexdigest()
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+class CheckSignatureTest(unittest.TestCase):
+    def test_good_and_bad_signatures(self):
+        signature = sign(TOKEN, '1481013459', 'nonce')
+        self.assertTrue(check_signature(TOKEN, signature, '1481013459', 'nonce'))
+        self.assertFalse(check_signature('other', signature, '1481013459', 'nonce'))
+        self.assertFalse(check_signature(TOKEN, signature, '1481013460', 'nonce'))
+        self.assertFalse(check_signature(TOKEN, '', '1481013459', 'nonce'))
+        self.assertFalse(check_signature(TOKEN, '非十六进制', '1481013459', 'nonce'))
+
+
+class EventHubTest(unittest.TestCase):
+    def test_event_before_expect_is_delivered(self):
+        hub = EventHub()
+        hub.resolve('mass:1', {'msg_status': 'SEND_SUCCESS'})
+        future = hub.expect('mass:1')
+        self.assertEqual(future.result(timeout=0), {'msg_status': 'SEND_SUCCESS'})
+        # 事件只交付一次
+        hub.discard('mass:1')
+        self.assertFalse(hub.expect('mass:1').done())
+
+    def test_event_after_expect_resolves_future(self):
+        hub = EventHub()
+        future = hub.expect('mass:1')
+        self.assertFalse(future.done())
+        hub.resolve('mass:1', {'msg_status': 'SEND_SUCCESS'})
+        self.assertEqual(future.result(timeout=0), {'msg_status': 'SEND_SUCCESS'})
+
+    def test_unclaimed_events_are_purged_after_ttl(self):
+        clock = FakeClock()
+        with mock.patch.object(event_server, 'time', clock):
+            hub = EventHub(retain_seconds=60)
+            hub.resolve('mass:old', {})
+            clock.now += 30
+            hub.resolve('mass:new', {})
+            clock.now += 31
+            # 新事件到达时清理过期的事件
+            hub.resolve('mass:newest', {})
+            self.assertEqual(set(hub._arrived), {'mass:new', 'mass:newest'})
+            self.assertFalse(hub.expect('mass:old').done())
+            self.assertTrue(hub.expect('mass:new').done())
+
+
+class CallbackServerTest(unittest.TestCase):
+    def setUp(self):
+        self.hub = EventHub()
+        self.server = WeChatCallbackServer({APPID: TOKEN, 'wx456': 'other'}, self.hub, host='127.0.0.1', port=0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def request(self, signature: str, body: bytes = None, echostr: str = '', appid: str = APPID):
+        url = (f'http://127.0.0.1:{self.server.port}/wechat/callback/{appid}?signature={signature}'
+               f'&timestamp=1481013459&nonce=nonce&echostr={echostr}')
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=body), timeout=5) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, b''
+
+    def test_get_handshake_echoes(self):
+        self.assertEqual(self.request(sign(TOKEN, '1481013459', 'nonce'), echostr='hello'), (200, b'hello'))
+        self.assertEqual(self.request('bad', echostr='hello'), (403, b''))
+
+    def test_post_publish_event_resolves_future(self):
+        future = self.hub.expect(publish_key('2247503051', APPID))
+        self.assertEqual(self.request(sign(TOKEN, '1481013459', 'nonce'), PUBLISH_EVENT), (200, b'success'))
+        status = future.result(timeout=5)
+        self.assertEqual(status['publish_status'], 0)
+        self.assertEqual(status['article_id'], 'b5O2OUs25HBxRceL7hfReg-U9QGeq9zQjiDvyWP4Hq4')
+        self.assertEqual(status['article_detail']['item'][0]['article_url'], 'https://mp.weixin.qq.com/s/example')
+
+    def test_post_with_bad_signature_is_ignored(self):
+        future = self.hub.expect(publish_key('2247503051', APPID))
+        self.assertEqual(self.request('bad', PUBLISH_EVENT), (403, b''))
+        self.assertFalse(future.done())
+
+    def test_accounts_use_their_own_token_and_keys(self):
+        other = self.hub.expect(publish_key('2247503051', 'wx456'))
+        mine = self.hub.expect(publish_key('2247503051', APPID))
+        # 用其它公众号的Token签名的请求被拒绝
+        self.assertEqual(self.request(sign(TOKEN, '1481013459', 'nonce'), PUBLISH_EVENT, appid='wx456'), (403, b''))
+        self.assertEqual(self.request(sign('other', '1481013459', 'nonce'), PUBLISH_EVENT, appid='wx456'),
+                         (200, b'success'))
+        self.assertEqual(other.result(timeout=5)['publish_status'], 0)
+        self.assertFalse(mine.done())
+        self.assertEqual(self.request(sign(TOKEN, '1481013459', 'nonce'), appid='wx789'), (404, b''))
+
+    def test_bare_path_only_for_single_account(self):
+        self.assertIsNone(self.server.appid_for('/wechat/callback'))
+        self.server.tokens = {APPID: TOKEN}
+        self.assertEqual(self.server.appid_for('/wechat/callback'), APPID)
+        self.assertEqual(self.server.appid_for('/wechat/callback/' + APPID), APPID)
+        self.assertIsNone(self.server.appid_for('/other/' + APPID))
+
+    def test_malformed_body_still_acknowledged(self):
+        self.assertEqual(self.request(sign(TOKEN, '1481013459', 'nonce'), b'<xml>'), (200, b'success'))
+
+
+if __name__ == '__main__':
+    unittest.main()
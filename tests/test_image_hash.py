@@ -0,0 +1,107 @@
+import random
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from core.image_hash import MultiIndexHash, hamming, hamming_distances
+from core.publisher import exclude_near_duplicates
+
+
+def _flip(h: int, bits: int, rng: random.Random) -> int:
+    for b in rng.sample(range(64), bits):
+        h ^= 1 << b
+    return h
+
+
+def _random_hashes(rng: random.Random, count: int):
+    """一部分完全随机，一部分是随机哈希翻转少量位得到的近似哈希，保证各个半径都有命中"""
+    bases = [rng.getrandbits(64) for _ in range(count // 4)]
+    hashes = list(bases)
+    while len(hashes) < count:
+        hashes.append(_flip(rng.choice(bases), rng.randint(0, 12), rng))
+    return hashes
+
+
+class HammingDistancesTest(unittest.TestCase):
+    def test_matches_python_popcount(self):
+        rng = random.Random(1)
+        hashes = [rng.getrandbits(64) for _ in range(500)] + [0, 2 ** 64 - 1]
+        target = rng.getrandbits(64)
+        expected = [hamming(h, target) for h in hashes]
+        array = np.array(hashes, dtype=np.uint64)
+        self.assertEqual(hamming_distances(array, target).tolist(), expected)
+        # numpy没有bitwise_count时使用查表
+        with mock.patch('core.image_hash.hasattr', return_value=False, create=True):
+            self.assertEqual(hamming_distances(array, target).tolist(), expected)
+
+
+class MultiIndexHashTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(7)
+        # 超过初始缓冲区的1024个，覆盖扩容
+        self.hashes = _random_hashes(self.rng, 3000)
+
+    def brute_force(self, h: int, k: int):
+        return sorted((hamming(h, x), i) for i, x in enumerate(self.hashes) if hamming(h, x) <= k)
+
+    def test_query_matches_brute_force(self):
+        for max_distance in (0, 1, 3, 6, 10, 15):
+            index = MultiIndexHash(max_distance)
+            for i, h in enumerate(self.hashes):
+                index.add(h, i)
+            self.assertEqual(len(index), len(self.hashes))
+            queries = [_flip(self.rng.choice(self.hashes), self.rng.randint(0, max_distance + 2), self.rng)
+                       for _ in range(60)] + [self.rng.getrandbits(64) for _ in range(10)]
+            for h in queries:
+                for k in sorted({0, max_distance // 2, max_distance}):
+                    expected = self.brute_force(h, k)
+                    self.assertEqual(sorted(index.query(h, k)), expected, (max_distance, k))
+                    self.assertEqual(index.contains_within(h, k), bool(expected), (max_distance, k))
+
+    def test_segments_cover_all_bits(self):
+        for max_distance in range(0, 20):
+            index = MultiIndexHash(max_distance)
+            self.assertEqual(len(index._segments), max_distance + 1)
+            covered = 0
+            for shift, mask in index._segments:
+                self.assertEqual(covered & (mask << shift), 0)
+                covered |= mask << shift
+            self.assertEqual(covered, 2 ** 64 - 1)
+
+    def test_rejects_distance_above_index(self):
+        index = MultiIndexHash(3)
+        index.add(0)
+        with self.assertRaises(ValueError):
+            index.query(0, 4)
+        with self.assertRaises(ValueError):
+            index.contains_within(0, 4)
+
+    def test_empty_index(self):
+        index = MultiIndexHash(4)
+        self.assertEqual(index.query(123), [])
+        self.assertFalse(index.contains_within(123))
+
+
+class ExcludeNearDuplicatesTest(unittest.TestCase):
+    def test_matches_greedy_brute_force(self):
+        rng = random.Random(3)
+        hashes = _random_hashes(rng, 1500)
+        published = set(rng.sample(hashes, 50))
+        index = mock.Mock()
+        index.is_near_published.side_effect = lambda h, k: any(hamming(h, p) <= k for p in published)
+        records = [{'path': str(i), 'dhash': h} for i, h in enumerate(hashes)] + [{'path': 'none', 'dhash': None}]
+        for max_distance in (0, 4, 8):
+            expected = []
+            for record in records[:-1]:
+                h = record['dhash']
+                if index.is_near_published(h, max_distance):
+                    continue
+                if any(hamming(h, r['dhash']) <= max_distance for r in expected):
+                    continue
+                expected.append(record)
+            self.assertEqual(exclude_near_duplicates(records, index, max_distance), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
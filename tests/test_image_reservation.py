@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from core import publisher, publish_jobs
+from core.accounts import Account
+from core.backlog import BacklogProcessor
+from core.job_queue import JobQueue
+from core.library_index import LibraryIndex
+
+IMAGES = ['a/1.jpg', 'a/2.jpg', 'a/3.jpg', 'a/4.jpg']
+
+
+class FakeWeChat:
+    def __init__(self, fail_send: bool = False):
+        self.fail_send = fail_send
+        self.drafts = []
+
+    def create_draft(self, articles):
+        self.drafts.append(articles)
+        return f'media{len(self.drafts)}'
+
+    def send_mass_message(self, media_id, **kwargs):
+        if self.fail_send:
+            raise Exception('群发失败')
+        return {'msg_id': 1}
+
+    def wait_for_mass_send(self, msg_id, event_hub=None):
+        return {'msg_status': 'SEND_SUCCESS'}
+
+
+class ImageReservationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.account = Account('test', 'appid', 'secret', os.path.join(self.tmp, 'imgs'),
+                               os.path.join(self.tmp, 'data'))
+        self.index = LibraryIndex(os.path.join(self.tmp, 'library.db'))
+        self.index.upsert([{'path': p, 'dir': 'a', 'width': 600, 'height': 800, 'dhash': i * 0x1111}
+                           for i, p in enumerate(IMAGES, 1)])
+        patcher = mock.patch.multiple(publisher, get_library_index=lambda account: self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def published(self):
+        return {p for p in IMAGES if self.index.get(p)['published']}
+
+    def _auto_publish(self, wechat):
+        def fake_prepare(wechat, account, directories, encode_pool, selected=None):
+            selected.update(IMAGES[:3])
+            return [{'title': 't'}]
+
+        self.account._wechat = wechat
+        with mock.patch.multiple(publisher, get_shared_session=mock.DEFAULT, get_shared_encode_pool=mock.DEFAULT,
+                                 get_unprocessed_directories=lambda account, limit: ['a'],
+                                 prepare_articles=fake_prepare):
+            publisher._auto_publish(self.account)
+
+    def test_failed_send_leaves_images_selectable(self):
+        with self.assertRaises(Exception):
+            self._auto_publish(FakeWeChat(fail_send=True))
+        self.assertEqual(self.published(), set())
+        self.assertFalse(self.index.is_near_published(0x1111, 0))
+
+    def test_successful_send_marks_images(self):
+        self._auto_publish(FakeWeChat())
+        self.assertEqual(self.published(), set(IMAGES[:3]))
+        self.assertTrue(self.index.is_near_published(0x1111, 0))
+
+    def test_queued_run_marks_images_only_after_draft(self):
+        queue = JobQueue(os.path.join(self.tmp, 'jobs.db'))
+        jobs = publish_jobs.PublishJobs([self.account])
+        with mock.patch.multiple(publish_jobs, get_library_index=lambda account: self.index,
+                                 get_random_images=lambda directory, count=None, **kwargs: IMAGES[:count],
+                                 find_videos=lambda directory: [], video_cover_for=lambda account, d: None):
+            run_id = jobs.enqueue_run(queue, 'test', 'a')
+            # 批次中的任务都还没有执行（或者全部失败），图片仍然可选
+            self.assertEqual(self.published(), set())
+
+            queue.complete(queue.lease('w', [publish_jobs.RENDER_COVER]), {'thumb_media_id': 'thumb'})
+            while True:
+                job = queue.lease('w', [publish_jobs.UPLOAD_IMAGE])
+                if job is None:
+                    break
+                queue.complete(job, {'index': job.payload['index'], 'url': 'http://img'})
+
+            jobs._wechat = lambda account: FakeWeChat()
+            with mock.patch.multiple(publish_jobs, build_article=lambda *args: {'title': 't'},
+                                     get_directory_metadata=lambda index, d: {}, image_ratios=lambda i, p: [],
+                                     source_key=lambda account, d: 'a'):
+                job = queue.lease('w', [publish_jobs.CREATE_DRAFT])
+                queue.complete(job, jobs.create_draft(job, queue))
+        self.assertEqual(len(queue.run_jobs(run_id, publish_jobs.SEND_POLL)), 1)
+        self.assertEqual(self.published(), set(IMAGES))
+
+    def test_failed_backlog_directory_releases_images(self):
+        processor = BacklogProcessor.__new__(BacklogProcessor)
+        processor.index = self.index
+        processor.state = mock.Mock()
+        processor.state.dir_state.return_value = {'image_paths': IMAGES[:2], 'cover_paths': IMAGES[1:4]}
+        self.index.mark_published(IMAGES)
+        processor._fail('a', '没有成功上传的图片')
+        self.assertEqual(self.published(), set())
+        processor.state.update_dir.assert_called_once_with('a', failed='没有成功上传的图片')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from core import job_queue, publish_jobs
+from core.accounts import Account
+from core.job_queue import JobQueue
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.db_path = os.path.join(self.tmp, 'jobs.db')
+        self.queue = JobQueue(self.db_path, retry_base_delay=10)
+
+    def fake_clock(self) -> FakeClock:
+        clock = FakeClock()
+        patcher = mock.patch.object(job_queue, 'time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return clock
+
+    def test_concurrent_leasers_never_share_a_job(self):
+        job_ids = {self.queue.enqueue('work', {'n': i}) for i in range(200)}
+        leased = {}
+
+        def worker(name):
+            # 每个worker使用自己的JobQueue实例，相当于独立的进程
+            queue = JobQueue(self.db_path)
+            ids = []
+            while True:
+                job = queue.lease(name, ['work'])
+                if job is None:
+                    break
+                ids.append(job.id)
+            leased[name] = ids
+
+        threads = [threading.Thread(target=worker, args=(f'w{i}',)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        all_ids = [i for ids in leased.values() for i in ids]
+        self.assertEqual(len(all_ids), len(set(all_ids)))
+        self.assertEqual(set(all_ids), job_ids)
+
+    def test_expired_lease_is_visible_again(self):
+        clock = self.fake_clock()
+        job_id = self.queue.enqueue('work', {})
+        first = self.queue.lease('a', visibility_timeout=30)
+        self.assertEqual(first.id, job_id)
+        self.assertIsNone(self.queue.lease('b', visibility_timeout=30))
+
+        clock.advance(31)
+        second = self.queue.lease('b', visibility_timeout=30)
+        self.assertEqual(second.id, job_id)
+        self.assertEqual(second.attempts, 2)
+        # 原来的worker已经失去租约，结果被丢弃
+        self.assertFalse(self.queue.complete(first, 'stale'))
+        self.assertTrue(self.queue.complete(second, 'fresh'))
+        self.assertEqual(self.queue.get(job_id).result, 'fresh')
+
+    def test_fail_backs_off_then_dead_letters(self):
+        clock = self.fake_clock()
+        job_id = self.queue.enqueue('work', {}, max_attempts=3)
+
+        for delay in (10, 20):
+            job = self.queue.lease('w')
+            self.assertEqual(self.queue.fail(job, 'boom'), 'queued')
+            clock.advance(delay - 1)
+            self.assertIsNone(self.queue.lease('w'))
+            clock.advance(1)
+
+        job = self.queue.lease('w')
+        self.assertEqual(job.attempts, 3)
+        self.assertEqual(self.queue.fail(job, 'boom'), 'dead')
+        clock.advance(3600)
+        self.assertIsNone(self.queue.lease('w'))
+        self.assertEqual([j.id for j in self.queue.dead_letters()], [job_id])
+        self.assertEqual(self.queue.get(job_id).last_error, 'boom')
+
+    def test_expired_lease_past_max_attempts_is_dead(self):
+        clock = self.fake_clock()
+        job_id = self.queue.enqueue('work', {}, max_attempts=1)
+        self.queue.lease('w', visibility_timeout=10)
+        clock.advance(11)
+        self.assertIsNone(self.queue.lease('w'))
+        self.assertEqual(self.queue.get(job_id).status, 'dead')
+
+    def test_defer_does_not_consume_attempts(self):
+        job_id = self.queue.enqueue('work', {}, max_attempts=1)
+        self.queue.defer(self.queue.lease('w'), 0)
+        job = self.queue.lease('w')
+        self.assertEqual((job.id, job.attempts), (job_id, 1))
+
+    def test_requeue_dead(self):
+        ids = [self.queue.enqueue('work', {'n': i}, max_attempts=1) for i in range(3)]
+        for _ in ids:
+            self.queue.fail(self.queue.lease('w'), 'boom')
+        self.assertEqual(self.queue.stats(), {'work': {'dead': 3}})
+
+        self.assertEqual(self.queue.requeue_dead([ids[0]]), 1)
+        job = self.queue.lease('w')
+        self.assertEqual((job.id, job.attempts), (ids[0], 1))
+        self.assertIsNone(self.queue.lease('w'))
+
+        self.assertEqual(self.queue.requeue_dead(), 2)
+        self.assertEqual(self.queue.stats(), {'work': {'leased': 1, 'queued': 2}})
+
+
+class FakeWeChat:
+    def __init__(self, fail_draft: int = 0):
+        self.fail_draft = fail_draft
+        self.drafts = []
+
+    def create_draft(self, articles):
+        if self.fail_draft:
+            self.fail_draft -= 1
+            raise Exception('草稿创建超时')
+        self.drafts.append(articles)
+        return f'media{len(self.drafts)}'
+
+
+class CreateDraftCheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.clock = FakeClock()
+        patcher = mock.patch.object(job_queue, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.queue = JobQueue(os.path.join(self.tmp, 'jobs.db'))
+        self.account = Account('test', 'appid', 'secret', os.path.join(self.tmp, 'imgs'),
+                               os.path.join(self.tmp, 'data'))
+        self.jobs = publish_jobs.PublishJobs([self.account])
+        self.build_article = mock.Mock(return_value={'title': 't'})
+        patcher = mock.patch.multiple(publish_jobs, build_article=self.build_article,
+                                      get_library_index=mock.DEFAULT, get_directory_metadata=mock.DEFAULT,
+                                      image_ratios=mock.DEFAULT, source_key=mock.DEFAULT)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        run_id = 'run'
+        self.queue.enqueue(publish_jobs.RENDER_COVER, {}, run_id=run_id)
+        self.queue.complete(self.queue.lease('w'), {'thumb_media_id': 'thumb'})
+        self.queue.enqueue(publish_jobs.UPLOAD_IMAGE, {'path': 'a/1.jpg', 'index': 0}, run_id=run_id)
+        self.queue.complete(self.queue.lease('w'), {'index': 0, 'url': 'http://img'})
+        self.queue.enqueue(publish_jobs.CREATE_DRAFT, {'account': 'test', 'directory': 'a', 'image_count': 1,
+                                                       'image_paths': ['a/1.jpg'], 'cover_paths': []},
+                           run_id=run_id, max_attempts=3)
+
+    def attempt(self, wechat: FakeWeChat):
+        """租用创建草稿任务并执行一次，失败时按worker的方式回写"""
+        self.jobs._wechat = lambda account: wechat
+        job = self.queue.lease('w', [publish_jobs.CREATE_DRAFT])
+        try:
+            result = self.jobs.create_draft(job, self.queue)
+        except Exception as e:
+            self.queue.fail(job, str(e))
+            self.clock.advance(3600)
+            return None
+        self.queue.complete(job, result)
+        return result
+
+    def test_retry_after_draft_created_reuses_draft(self):
+        wechat = FakeWeChat()
+        with mock.patch.object(publish_jobs.PublishJobs, '_enqueue_send',
+                               side_effect=[Exception('worker退出'), mock.DEFAULT],
+                               wraps=publish_jobs.PublishJobs._enqueue_send):
+            self.assertIsNone(self.attempt(wechat))
+            result = self.attempt(wechat)
+
+        self.assertEqual(result['media_id'], 'media1')
+        self.assertEqual(len(wechat.drafts), 1)
+        self.build_article.assert_called_once()
+        self.assertEqual(len(self.queue.run_jobs('run', publish_jobs.SEND_POLL)), 1)
+
+    def test_retry_after_draft_failure_reuses_article(self):
+        wechat = FakeWeChat(fail_draft=1)
+        self.assertIsNone(self.attempt(wechat))
+        result = self.attempt(wechat)
+
+        self.assertEqual(result['media_id'], 'media1')
+        # 文章计数不会因为重试重复增加
+        self.build_article.assert_called_once()
+        self.assertEqual(len(self.queue.run_jobs('run', publish_jobs.SEND_POLL)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import itertools
+import random
+import unittest
+
+from core.layout_planner import pair_order, plan_pairs, tight_window
+
+
+def _matchings(items):
+    """枚举items的全部完美匹配"""
+    if not items:
+        yield []
+        return
+    first, rest = items[0], items[1:]
+    for i, other in enumerate(rest):
+        for matching in _matchings(rest[:i] + rest[i + 1:]):
+            yield [(first, other)] + matching
+
+
+def _cost(ratios, pairs) -> float:
+    return sum(abs(ratios[a] - ratios[b]) for a, b in pairs)
+
+
+def brute_force(ratios):
+    """最小配对代价；数量为奇数时枚举留出的图片"""
+    n = len(ratios)
+    skips = [None] if n % 2 == 0 else range(n)
+    return min(_cost(ratios, m) for s in skips for m in _matchings([i for i in range(n) if i != s]))
+
+
+class PlanPairsTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(5)
+
+    def random_ratios(self, n):
+        # 包含重复的宽高比，覆盖排序稳定性
+        choices = [0.5625, 0.75, 1.0, 1.3333, 1.7778]
+        return [self.rng.choice(choices) if self.rng.random() < 0.3 else self.rng.uniform(0.3, 2.5)
+                for _ in range(n)]
+
+    def test_matches_brute_force(self):
+        for n in range(1, 10):
+            for _ in range(30):
+                ratios = self.random_ratios(n)
+                pairs, skip = plan_pairs(ratios)
+                used = [i for pair in pairs for i in pair] + ([skip] if skip is not None else [])
+                self.assertEqual(sorted(used), list(range(n)))
+                self.assertEqual(skip is None, n % 2 == 0)
+                self.assertAlmostEqual(_cost(ratios, pairs), brute_force(ratios), places=9, msg=ratios)
+
+    def test_skip_choice(self):
+        # 离群的图片被留出
+        self.assertEqual(plan_pairs([1.0, 1.01, 5.0, 0.99, 1.02])[1], 2)
+        self.assertEqual(plan_pairs([0.1, 1.0, 1.01])[1], 0)
+        self.assertEqual(plan_pairs([1.0, 1.01, 9.0])[1], 2)
+        # 留出中间的一张时两侧分别相邻配对
+        pairs, skip = plan_pairs([0.0, 0.1, 0.5, 0.9, 1.0])
+        self.assertEqual(skip, 2)
+        self.assertEqual(pairs, [(0, 1), (3, 4)])
+
+    def test_small_inputs(self):
+        self.assertEqual(plan_pairs([]), ([], None))
+        self.assertEqual(plan_pairs([1.5]), ([], 0))
+        self.assertEqual(plan_pairs([2.0, 1.0]), ([(1, 0)], None))
+
+    def test_pair_order(self):
+        for n in range(0, 10):
+            ratios = self.random_ratios(n)
+            order = pair_order(ratios)
+            pairs, skip = plan_pairs(ratios)
+            self.assertEqual(sorted(order), list(range(n)))
+            self.assertEqual(order[:2 * len(pairs)], [i for pair in pairs for i in pair])
+            if skip is not None:
+                self.assertEqual(order[-1], skip)
+
+
+class TightWindowTest(unittest.TestCase):
+    def test_minimum_spread(self):
+        rng = random.Random(11)
+        for n in range(1, 9):
+            for _ in range(20):
+                ratios = [rng.uniform(0.3, 2.5) for _ in range(n)]
+                for count in range(1, n + 1):
+                    chosen = tight_window(ratios, count)
+                    self.assertEqual(len(set(chosen)), count)
+                    spread = max(ratios[i] for i in chosen) - min(ratios[i] for i in chosen)
+                    best = min(max(ratios[i] for i in c) - min(ratios[i] for i in c)
+                               for c in itertools.combinations(range(n), count))
+                    self.assertAlmostEqual(spread, best, places=12)
+                    self.assertEqual([ratios[i] for i in chosen], sorted(ratios[i] for i in chosen))
+
+    def test_count_out_of_range(self):
+        self.assertEqual(tight_window([2.0, 1.0, 3.0], 5), [1, 0, 2])
+        self.assertEqual(tight_window([2.0, 1.0], 0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
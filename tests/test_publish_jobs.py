@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from core import publish_jobs
+from core.accounts import Account
+from core.event_server import EventHub, mass_key
+from core.job_queue import JobQueue, run_worker
+
+
+class FakeWeChat:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.queries = 0
+
+    def send_mass_message(self, media_id, **kwargs):
+        return {'msg_id': 42}
+
+    def query_mass_status(self, msg_id):
+        self.queries += 1
+        return {'msg_id': msg_id, 'msg_status': self.statuses.pop(0) if self.statuses else 'SENDING'}
+
+
+class SendPollTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.queue = JobQueue(os.path.join(self.tmp, 'jobs.db'))
+        account = Account('test', 'appid', 'secret', os.path.join(self.tmp, 'imgs'), os.path.join(self.tmp, 'data'))
+        self.jobs = publish_jobs.PublishJobs([account], mass_poll_delay=0, event_wait=5)
+        self.hub = None
+        patcher = mock.patch.object(publish_jobs, 'get_running_hub', lambda: self.hub)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue.enqueue(publish_jobs.SEND_POLL, {'account': 'test', 'media_id': 'media'}, run_id='run',
+                           max_attempts=1)
+
+    def work(self, wechat, max_jobs):
+        self.jobs._wechat = lambda account: wechat
+        return run_worker(self.queue, self.jobs.handlers(), poll_interval=0, max_jobs=max_jobs)
+
+    def polls(self):
+        return self.queue.run_jobs('run', publish_jobs.SEND_POLL)
+
+    def test_polls_until_success(self):
+        wechat = FakeWeChat(['SENDING', 'SENDING', 'SEND_SUCCESS'])
+        self.work(wechat, 4)
+        self.assertEqual([j.status for j in self.polls()], ['done'] * 4)
+        self.assertEqual(self.polls()[-1].result['msg_status'], 'SEND_SUCCESS')
+        self.assertEqual(self.polls()[-1].payload['polls'], 2)
+
+    def test_sending_past_deadline_is_dead(self):
+        self.jobs.mass_send_timeout = 0
+        wechat = FakeWeChat([])
+        self.work(wechat, 2)
+        jobs = self.polls()
+        self.assertEqual([j.status for j in jobs], ['done', 'dead'])
+        self.assertIn('仍未完成', jobs[1].last_error)
+        # 进入死信后不再添加查询任务
+        self.assertEqual(wechat.queries, 1)
+
+    def test_waits_for_push_event(self):
+        self.hub = EventHub()
+        wechat = FakeWeChat([])
+        self.work(wechat, 1)
+        event = {'msg_id': 42, 'msg_status': 'SEND_SUCCESS', 'from_event': True}
+        timer = threading.Timer(0.2, self.hub.resolve, (mass_key(42, 'appid'), event))
+        timer.start()
+        self.work(wechat, 1)
+        timer.join()
+        self.assertEqual(self.polls()[-1].result['from_event'], True)
+        self.assertEqual(wechat.queries, 0)
+
+    def test_event_arriving_before_poll_is_used(self):
+        self.hub = EventHub()
+        self.hub.resolve(mass_key(42, 'appid'), {'msg_id': 42, 'msg_status': 'SEND_FAIL', 'from_event': True})
+        wechat = FakeWeChat([])
+        self.work(wechat, 2)
+        self.assertEqual(self.polls()[-1].status, 'dead')
+        self.assertIn('群发失败', self.polls()[-1].last_error)
+        self.assertEqual(wechat.queries, 0)
+
+    def test_falls_back_to_query_without_event(self):
+        self.hub = EventHub()
+        self.jobs.event_wait = 0
+        wechat = FakeWeChat(['SEND_SUCCESS'])
+        self.work(wechat, 2)
+        self.assertEqual(self.polls()[-1].result['msg_status'], 'SEND_SUCCESS')
+        self.assertEqual(wechat.queries, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
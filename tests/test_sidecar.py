@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from core.sidecar import SIDECAR_FIELDS, extract_fields
+
+CHUNK_SIZES = (1, 2, 7)
+
+DOCUMENT = {
+    'aweme_id': 7301234567890123456,
+    'video': {'play_addr': {'url_list': ['http://a/"1"', 'http://b/\\2'], 'width': 1080},
+              'bit_rate': [{'gear': 'normal_720', 'size': 123456}, {'gear': [], 'size': {}}]},
+    'statistics': [[1, [2, [3, {'digg': -12.5e3}]]], {}, [], None, True, False],
+    'escaped': 'quote \\" and backslash \\\\ and \\\\" tricky',
+    'create_time': 1700000000,
+    'unicode': '中文 表情😀',
+    'desc': 'say "hi" \\ #话题 #tag2',
+    'author': {'nickname': '作者', 'uid': '123', 'tags': ['{', '[', '}']},
+    'ratio': 0.5625,
+    'after': {'never': 'read'},
+}
+
+
+class ExtractFieldsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def write(self, text: str) -> str:
+        path = os.path.join(self.tmp, 'x_result.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def assertMatchesJsonLoad(self, path: str, fields):
+        with open(path, encoding='utf-8') as f:
+            document = json.load(f)
+        expected = {k: document[k] for k in fields if k in document}
+        for chunk_size in CHUNK_SIZES:
+            self.assertEqual(extract_fields(path, fields, chunk_size), expected, chunk_size)
+
+    def test_matches_json_load(self):
+        for indent in (None, 2):
+            path = self.write(json.dumps(DOCUMENT, ensure_ascii=False, indent=indent))
+            self.assertMatchesJsonLoad(path, SIDECAR_FIELDS)
+            self.assertMatchesJsonLoad(path, ('ratio', 'escaped', 'unicode', 'missing'))
+            self.assertMatchesJsonLoad(path, ('statistics', 'video'))
+
+    def test_numbers_split_at_chunk_end(self):
+        # 数字在任意位置被块边界截断都要完整读出
+        for text in ('{"aweme_id": 1234567, "create_time": -98.765e-3}', '{"aweme_id":1234567}',
+                     '{"create_time":12}', '{"aweme_id": 1234567 }'):
+            self.assertMatchesJsonLoad(self.write(text), SIDECAR_FIELDS)
+
+    def test_escapes_split_at_chunk_end(self):
+        for value in ('\\', '"', '\\"', 'a\\\\"b', '\\\\\\"', '中"\\'):
+            text = json.dumps({'skipped': [value, {'k': value}], 'desc': value, 'skipped2': value,
+                               'aweme_id': 1})
+            self.assertMatchesJsonLoad(self.write(text), SIDECAR_FIELDS)
+
+    def test_stops_after_all_fields_found(self):
+        # 字段都找到后不再读取，后面不完整的内容不影响结果
+        text = '{"desc": "d", "aweme_id": 1, "create_time": 2, "author": {"uid": 3}, "rest": [1, 2, {"x'
+        for chunk_size in CHUNK_SIZES:
+            self.assertEqual(extract_fields(self.write(text), chunk_size=chunk_size),
+                             {'desc': 'd', 'aweme_id': 1, 'create_time': 2, 'author': {'uid': 3}})
+
+    def test_truncated_file(self):
+        complete = json.dumps(DOCUMENT, ensure_ascii=False)
+        # 截断在需要读取或跳过的值中间时报错
+        for end in (complete.index('"video"') + 20, complete.index('"desc"') + 12, len(complete) // 2):
+            path = self.write(complete[:end])
+            for chunk_size in CHUNK_SIZES:
+                with self.assertRaises(ValueError):
+                    extract_fields(path, chunk_size=chunk_size)
+        # 截断在对象结束之前但字段之后时返回已经找到的字段
+        path = self.write('{"aweme_id": 1, "desc": "d"')
+        for chunk_size in CHUNK_SIZES:
+            self.assertEqual(extract_fields(path, chunk_size=chunk_size), {'aweme_id': 1, 'desc': 'd'})
+
+    def test_empty_object(self):
+        for chunk_size in CHUNK_SIZES:
+            self.assertEqual(extract_fields(self.write(' { } '), chunk_size=chunk_size), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from core.memory_governor import MemoryGovernor
+from core.stage_graph import (CACHED, FAILED, FALLBACK, OK, PROCESS, SKIPPED, GraphRun, Stage, StageCache,
+                              StageGraph)
+
+
+def fail(*args):
+    raise ValueError('boom')
+
+
+class StageGraphTest(unittest.TestCase):
+    def test_dependency_order(self):
+        events = []
+        lock = threading.Lock()
+
+        def step(name):
+            def fn(*args):
+                with lock:
+                    events.append(name)
+                return name + ''.join(args)
+            return fn
+
+        graph = StageGraph('test', [
+            Stage('d', step('d'), inputs=('b', 'c')),
+            Stage('b', step('b'), inputs=('a',)),
+            Stage('c', step('c'), inputs=('a', 'x')),
+            Stage('a', step('a')),
+        ])
+        run = graph.run({'x': 'X'}, cache=StageCache())
+        self.assertEqual(run.value('d'), 'dbacaX')
+        self.assertEqual(events[0], 'a')
+        self.assertEqual(events[-1], 'd')
+        self.assertEqual(set(run.status.values()), {OK})
+        for name, upstream in (('b', 'a'), ('c', 'a'), ('d', 'b'), ('d', 'c')):
+            self.assertGreaterEqual(run.started[name], run.finished[upstream])
+
+    def test_multiple_outputs(self):
+        graph = StageGraph('test', [Stage('split', lambda: (1, 2), outputs=('one', 'two')),
+                                    Stage('sum', lambda a, b: a + b, inputs=('one', 'two'))])
+        self.assertEqual(graph.run(cache=StageCache()).value('sum'), 3)
+
+    def test_failure_skips_dependents_only(self):
+        graph = StageGraph('test', [
+            Stage('a', fail),
+            Stage('b', lambda a: a, inputs=('a',)),
+            Stage('c', lambda b: b, inputs=('b',)),
+            Stage('other', lambda: 1),
+            Stage('after_other', lambda o: o + 1, inputs=('other',)),
+            Stage('opt', fail, optional=True, default='fallback'),
+            Stage('uses_opt', lambda o: o, inputs=('opt',)),
+        ])
+        run = graph.run(cache=StageCache())
+        self.assertEqual(run.status, {**run.status, 'a': FAILED, 'b': SKIPPED, 'c': SKIPPED, 'other': OK,
+                                      'after_other': OK, 'opt': FALLBACK, 'uses_opt': OK})
+        self.assertEqual(run.errors['b'], 'a: boom')
+        # 间接依赖的阶段沿用最初失败的原因
+        self.assertEqual(run.errors['c'], 'a: boom')
+        self.assertEqual(run.value('after_other'), 2)
+        self.assertEqual(run.value('uses_opt'), 'fallback')
+        with self.assertRaises(Exception):
+            run.value('c')
+
+    def test_cache_hits(self):
+        calls = []
+        valid = {'ok': True}
+
+        def expensive(x):
+            calls.append(x)
+            return x * 2
+
+        graph = StageGraph('test', [Stage('double', expensive, inputs=('x',), cache_key=lambda x: x,
+                                          cache_valid=lambda value: valid['ok'])])
+        cache = StageCache()
+        self.assertEqual(graph.run({'x': 2}, cache=cache).status['double'], OK)
+        run = graph.run({'x': 2}, cache=cache)
+        self.assertEqual((run.status['double'], run.value('double')), (CACHED, 4))
+        self.assertEqual(graph.run({'x': 3}, cache=cache).status['double'], OK)
+        self.assertEqual(calls, [2, 3])
+        # 缓存的输出不可用时重新执行
+        valid['ok'] = False
+        self.assertEqual(graph.run({'x': 2}, cache=cache).status['double'], OK)
+        self.assertEqual(calls, [2, 3, 2])
+
+    def test_failed_stage_is_not_cached(self):
+        cache = StageCache()
+        graph = StageGraph('test', [Stage('f', fail, cache_key=lambda: 'k')])
+        graph.run(cache=cache)
+        self.assertEqual(graph.run(cache=cache).status['f'], FAILED)
+
+    def test_rejects_missing_inputs_and_cycles(self):
+        with self.assertRaises(Exception):
+            StageGraph('test', [Stage('a', lambda x: x, inputs=('x',))]).run(cache=StageCache())
+        with self.assertRaises(Exception):
+            StageGraph('test', [Stage('a', lambda b: b, inputs=('b',)),
+                                Stage('b', lambda a: a, inputs=('a',))]).run(cache=StageCache())
+
+    def test_critical_path(self):
+        stages = {'a': Stage('a', None), 'b': Stage('b', None, inputs=('a',)),
+                  'c': Stage('c', None, inputs=('a',)), 'd': Stage('d', None, inputs=('b', 'c')),
+                  'e': Stage('e', None)}
+        run = GraphRun(stages, {n: n for n in stages})
+        run.started = {'a': 0.0, 'b': 1.0, 'c': 1.0, 'd': 5.0, 'e': 0.0}
+        run.finished = {'a': 1.0, 'b': 5.0, 'c': 2.0, 'd': 6.0, 'e': 3.0}
+        run.status = {n: OK for n in stages}
+        self.assertEqual(run.critical_path(), ['a', 'b', 'd'])
+        self.assertEqual([s['stage'] for s in run.report()['critical_path']], ['a', 'b', 'd'])
+        run.finished['c'] = 5.5
+        self.assertEqual(run.critical_path(), ['a', 'c', 'd'])
+
+    def test_governed_stage_does_not_block_scheduler(self):
+        # 预算已经被占满，只有线程阶段执行后才会归还；准入等待不能阻止调度循环提交这个线程阶段
+        governor = MemoryGovernor(100)
+        governor.acquire(100)
+        graph = StageGraph('test', [
+            Stage('decode', lambda: 'decoded', executor=PROCESS, footprint=lambda: 100),
+            Stage('free', lambda: governor.release(100)),
+        ])
+        result = {}
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            runner = threading.Thread(target=lambda: result.update(
+                run=graph.run(process_pool=pool, governor=governor, cache=StageCache())), daemon=True)
+            runner.start()
+            runner.join(timeout=10)
+        self.assertFalse(runner.is_alive(), '调度循环被内存准入阻塞')
+        self.assertEqual(result['run'].value('decode'), 'decoded')
+        self.assertEqual(governor.reserved, 0)
+        self.assertEqual(governor.admitted, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+import unittest
+
+from core.cli import STARTUP_BUDGET_MS, probe_startup
+
+
+class StartupTest(unittest.TestCase):
+    def test_light_commands_do_not_import_heavy_modules(self):
+        heavy = probe_startup()['heavy']
+        self.assertEqual(heavy, [], f'轻量命令加载了重量级模块: {heavy}')
+
+    def test_import_time_budget(self):
+        # 取三次中最快的一次，减少机器负载的干扰；预算不包含解释器本身的启动时间
+        fastest = min(probe_startup()['import_ms'] for _ in range(3))
+        self.assertLess(fastest, STARTUP_BUDGET_MS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import os
+import sys
+import time
+import errno
+import hashlib
+import sqlite3
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+from core.content_hash import hash_file
+
+# 支持的图片格式
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    source_path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    stored_path TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files(sha256);
+'''
+
+
+def _copy_hashing(source_path: str, target_dir: str, ext: str) -> Tuple[str, str]:
+    """边复制边计算哈希：写入临时文件后按哈希重命名，源文件只读取一次"""
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, suffix='.part')
+    try:
+        with open(source_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+        sha256 = digest.hexdigest()
+        stored_path = os.path.join(target_dir, sha256 + ext)
+        if os.path.exists(stored_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, stored_path)
+        return sha256, stored_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def place_file(source_path: str, target_dir: str, mode: str = 'link') -> Tuple[str, str, bool]:
+    """把文件按内容哈希存入目标目录，内容相同的文件只保存一份
+
+    Args:
+        source_path: 源文件路径
+        target_dir: 内容寻址存储目录
+        mode: link（硬链接，保留源文件）、move（移动）或copy（复制）；
+              硬链接或移动跨文件系统失败时退化为复制
+
+    Returns:
+        Tuple[str, str, bool]: (哈希, 存储路径, 是否为新内容)
+    """
+    ext = os.path.splitext(source_path)[1].lower()
+    if ext == '.jpg':
+        ext = '.jpeg'
+
+    if mode == 'copy':
+        stored_before = None
+    else:
+        sha256 = hash_file(source_path)
+        stored_path = os.path.join(target_dir, sha256 + ext)
+        if os.path.exists(stored_path):
+            # 内容已存在：移动模式下删除重复的源文件
+            if mode == 'move':
+                os.remove(source_path)
+            return sha256, stored_path, False
+        try:
+            if mode == 'link':
+                os.link(source_path, stored_path)
+            else:
+                os.rename(source_path, stored_path)
+            return sha256, stored_path, True
+        except FileExistsError:
+            # 其它进程刚刚写入了相同内容
+            if mode == 'move':
+                os.remove(source_path)
+            return sha256, stored_path, False
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+        stored_before = stored_path
+
+    sha256, stored_path = _copy_hashing(source_path, target_dir, ext)
+    is_new = stored_before is None or stored_path == stored_before
+    if mode == 'move':
+        os.remove(source_path)
+    return sha256, stored_path, is_new
+
+
+def ingest_directory(files: List[Tuple[str, int, float]], target_dir: str, mode: str) -> List[Dict]:
+    """在worker进程中处理一个源目录的待入库文件"""
+    results = []
+    for source_path, size, mtime in files:
+        try:
+            sha256, stored_path, is_new = place_file(source_path, target_dir, mode)
+            results.append({'source_path': source_path, 'size': size, 'mtime': mtime,
+                            'sha256': sha256, 'stored_path': stored_path, 'new': is_new})
+        except Exception as e:
+            results.append({'source_path': source_path, 'error': str(e)})
+    return results
+
+
+def ingest(source_dir: str = 'imgs', target_dir: str = 'img', mode: str = 'link',
+           manifest_path: str = os.path.join(root_dir, 'data', 'ingest_manifest.db'),
+           workers: int = None) -> Dict:
+    """把源目录中的图片按内容哈希入库
+
+    每个子目录作为一个任务在进程池中并行处理；源路径到哈希的映射记录在清单数据库中，
+    大小和修改时间未变化的文件在重复运行时直接跳过。
+
+    Args:
+        source_dir: 源目录
+        target_dir: 内容寻址存储目录
+        mode: link、move或copy
+        manifest_path: 清单数据库路径
+        workers: 进程数，默认为CPU核数
+
+    Returns:
+        Dict: 统计信息
+    """
+    start = time.time()
+    os.makedirs(target_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    conn = sqlite3.connect(manifest_path)
+    conn.executescript(_SCHEMA)
+    known = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT source_path, size, mtime FROM files')}
+
+    target_abs = os.path.abspath(target_dir)
+    batches: Dict[str, List[Tuple[str, int, float]]] = {}
+    skipped = 0
+    for root, dirs, files in os.walk(source_dir):
+        if os.path.abspath(root) == target_abs:  # 跳过目标目录
+            dirs[:] = []
+            continue
+        for file in files:
+            if not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            source_path = os.path.join(root, file)
+            st = os.stat(source_path)
+            if known.get(source_path) == (st.st_size, st.st_mtime):
+                skipped += 1
+                continue
+            batches.setdefault(root, []).append((source_path, st.st_size, st.st_mtime))
+
+    stats = {'skipped': skipped, 'new_blobs': 0, 'duplicates': 0, 'errors': 0, 'bytes': 0}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(ingest_directory, files, target_dir, mode) for files in batches.values()]
+        for future in futures:
+            now = time.time()
+            for r in future.result():
+                if 'error' in r:
+                    stats['errors'] += 1
+                    print(f"入库失败 {r['source_path']}: {r['error']}")
+                    continue
+                stats['new_blobs' if r['new'] else 'duplicates'] += 1
+                stats['bytes'] += r['size']
+                conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                             (r['source_path'], r['size'], r['mtime'], r['sha256'], now))
+                conn.execute('INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)',
+                             (r['sha256'], r['stored_path'], r['size']))
+            conn.commit()
+    conn.close()
+
+    stats['seconds'] = round(time.time() - start, 2)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='按内容哈希把图片入库，相同内容只保存一份')
+    parser.add_argument('--source', default='imgs', help='源目录')
+    parser.add_argument('--target', default='img', help='存储目录')
+    parser.add_argument('--mode', choices=['link', 'move', 'copy'], default='link', help='入库方式')
+    parser.add_argument('--workers', type=int, help='进程数')
+    args = parser.parse_args()
+
+    result = ingest(args.source, args.target, args.mode, workers=args.workers)
+    print(f"处理完成！新内容{result['new_blobs']}个，重复{result['duplicates']}个，"
+          f"跳过{result['skipped']}个，失败{result['errors']}个，"
+          f"{result['bytes'] / 1024 / 1024:.1f}MB，耗时{result['seconds']}秒")
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
+
+# 添加项目根目录到系统路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+sys.path.insert(0, root_dir)
+
+from core.content_hash import hash_file
+from core.compress_image import needs_transcode, transcode_to_jpeg
+
+# 可以转码的源格式，HEIC需要安装pillow-heif
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.heic', '.heif')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transcoded (
+    source_path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    transcoded_at REAL NOT NULL
+)
+'''
+
+
+def output_path_for(source_path: str, source_dir: str, output_dir: Optional[str]) -> str:
+    """转码结果的路径：与源文件同名的.jpeg文件，指定output_dir时保持相对目录结构"""
+    base, ext = os.path.splitext(source_path)
+    if ext.lower() in ('.jpg', '.jpeg') and output_dir is None:
+        return source_path
+    if output_dir is not None:
+        base = os.path.join(output_dir, os.path.relpath(base, source_dir))
+    return base + '.jpeg'
+
+
+def transcode_file(source_path: str, output_path: str, known_sha256: Optional[str],
+                   max_size_kb: int) -> Dict:
+    """在worker进程中处理一个文件：源文件哈希未变化且输出存在时跳过
+
+    Returns:
+        Dict: 处理结果，status为converted、unchanged、skipped或failed
+    """
+    try:
+        size = os.path.getsize(source_path)
+        sha256 = hash_file(source_path)
+        if sha256 == known_sha256 and os.path.exists(output_path):
+            status = 'unchanged'
+        elif output_path == source_path and not needs_transcode(source_path, max_size_kb):
+            # 已经符合要求的JPEG保持原样
+            status = 'skipped'
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            transcode_to_jpeg(source_path, output_path, max_size_kb)
+            status = 'converted'
+            if output_path == source_path:
+                # 原地转码后记录新文件的哈希，下次运行直接跳过
+                sha256 = hash_file(source_path)
+        st = os.stat(source_path)
+        return {'source_path': source_path, 'output_path': output_path, 'status': status,
+                'bytes': size, 'size': st.st_size, 'mtime': st.st_mtime, 'sha256': sha256}
+    except Exception as e:
+        return {'source_path': source_path, 'status': 'failed', 'error': str(e)}
+
+
+def list_sources(source_dir: str) -> List[str]:
+    """递归列出可以转码的图片"""
+    paths = []
+    for root, _, files in os.walk(source_dir):
+        for f in files:
+            if f.lower().endswith(SOURCE_EXTENSIONS):
+                paths.append(os.path.join(root, f))
+    return sorted(paths)
+
+
+def transcode_library(source_dir: str = 'img', output_dir: Optional[str] = None,
+                      manifest_path: str = os.path.join(root_dir, 'data', 'transcode_manifest.db'),
+                      workers: Optional[int] = None, max_size_kb: int = 2048,
+                      remove_source: bool = False) -> Dict:
+    """把图库中的图片批量转码为符合微信要求的JPEG
+
+    源文件的大小、修改时间和哈希记录在清单数据库中：大小和修改时间未变化的文件不会被读取，
+    变化了但哈希相同的文件也会跳过。转码在进程池中执行，每个文件先写临时文件再替换。
+
+    Args:
+        source_dir: 源目录
+        output_dir: 输出目录，为None时写到源文件旁边（JPEG原地转码）
+        manifest_path: 清单数据库路径
+        workers: 进程数，默认为CPU核数
+        max_size_kb: 输出文件的最大大小（KB）
+        remove_source: 转码成功后删除非JPEG的源文件
+
+    Returns:
+        Dict: 统计信息
+    """
+    start = time.time()
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    conn = sqlite3.connect(manifest_path)
+    conn.execute(_SCHEMA)
+    known = {row[0]: row[1:] for row in
+             conn.execute('SELECT source_path, size, mtime, sha256, output_path FROM transcoded')}
+
+    stats = {'total': 0, 'converted': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+    tasks = []
+    for source_path in list_sources(source_dir):
+        stats['total'] += 1
+        output_path = output_path_for(source_path, source_dir, output_dir)
+        st = os.stat(source_path)
+        record = known.get(source_path)
+        if (record and record[0] == st.st_size and record[1] == st.st_mtime
+                and record[3] == output_path and os.path.exists(output_path)):
+            stats['unchanged'] += 1
+            continue
+        known_sha256 = record[2] if record and record[3] == output_path else None
+        tasks.append((source_path, output_path, known_sha256))
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(transcode_file, s, o, h, max_size_kb) for s, o, h in tasks]
+            for future in futures:
+                r = future.result()
+                stats[r['status']] += 1
+                if r['status'] == 'failed':
+                    print(f"转码失败 {r['source_path']}: {r['error']}")
+                    continue
+                stats['bytes'] += r['bytes']
+                if r['status'] == 'converted':
+                    print(f"已转码: {r['source_path']} -> {r['output_path']}")
+                    if remove_source and r['output_path'] != r['source_path']:
+                        os.remove(r['source_path'])
+                        continue
+                conn.execute('INSERT OR REPLACE INTO transcoded VALUES (?, ?, ?, ?, ?, ?)',
+                             (r['source_path'], r['size'], r['mtime'], r['sha256'], r['output_path'],
+                              time.time()))
+        conn.commit()
+    conn.close()
+
+    stats['seconds'] = round(time.time() - start, 2)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='把PNG/WebP/HEIC等图片批量转码为符合微信要求的JPEG')
+    parser.add_argument('--source', default='img', help='源目录')
+    parser.add_argument('--output', help='输出目录，默认写到源文件旁边')
+    parser.add_argument('--workers', type=int, help='进程数')
+    parser.add_argument('--max-size-kb', type=int, default=2048, help='输出文件最大大小（KB）')
+    parser.add_argument('--remove-source', action='store_true', help='转码成功后删除非JPEG源文件')
+    args = parser.parse_args()
+
+    result = transcode_library(args.source, args.output, workers=args.workers,
+                               max_size_kb=args.max_size_kb, remove_source=args.remove_source)
+    seconds = max(result['seconds'], 0.001)
+    processed = result['total'] - result['unchanged']
+    print(f"转码完成！共{result['total']}个文件，转码{result['converted']}个，未变化{result['unchanged']}个，"
+          f"无需转码{result['skipped']}个，失败{result['failed']}个")
+    print(f"耗时{result['seconds']}秒，{processed / seconds:.1f}个/秒，"
+          f"{result['bytes'] / 1024 / 1024 / seconds:.1f}MB/秒")